@@ -8,6 +8,7 @@ from all_charities_pipeline import get_recipient_objectives
 #add project root to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from utils import clean_text
+from table_snapshots import invalidate_snapshots
 
 #get keys from env
 load_dotenv()
@@ -72,6 +73,9 @@ def import_objectives(objectives_dict):
         #show progress
         print(f"Processed {batch_end}/{total} recipients (success: {success_count}, errors: {error_count})...")
 
+    #drop local snapshots, as these updates bypass pipe_to_supabase
+    invalidate_snapshots("recipients")
+
     print(f"Success: {success_count}")
     print(f"Errors: {error_count}")
 
@@ -1,7 +1,12 @@
+import sys
+import os
 import pandas as pd
-from supabase import create_client
 from cc_api.transformers import ensure_area_columns
 
+#add project root to path for utils import
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+from utils import get_table_from_supabase
+
 def transform_area_columns(df):
 
     """
@@ -97,15 +102,11 @@ def build_areas_tables(df, supabase_url, supabase_key):
     """
     areas, all_areas = transform_area_columns(df)
 
-    #connect to supabase and query existing areas
-    supabase = create_client(supabase_url, supabase_key)
-
     try:
-        #fetch all existing areas from database
-        result = supabase.table("areas").select("area_id, area_name, area_level").execute()
+        #fetch all existing areas from database, only the columns needed
+        existing_areas = get_table_from_supabase(supabase_url, supabase_key, "areas", columns=["area_id", "area_name", "area_level"])
 
-        if result.data and len(result.data) > 0:
-            existing_areas = pd.DataFrame(result.data)
+        if len(existing_areas) > 0:
             existing_areas["area_id"] = existing_areas["area_id"].astype(int)
             max_area_id = existing_areas["area_id"].max()
             next_area_id = max_area_id + 1
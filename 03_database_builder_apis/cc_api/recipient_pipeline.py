@@ -3,11 +3,10 @@ import os
 import pandas as pd
 from cc_api.client import extract_cc_data
 from cc_api.areas_builder import transform_area_columns
-from supabase import create_client
 
 #add project root to path for utils import
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
-from utils import clean_data
+from utils import clean_data, get_table_from_supabase
 
 def get_recipient_data(recipient_grants, recipients_info, areas, supabase_url, supabase_key):
 
@@ -51,11 +50,9 @@ def get_recipient_data(recipient_grants, recipients_info, areas, supabase_url, s
 	recipient_all_areas = recipient_all_areas.drop_duplicates()
 
 	#get areas from database to check against
-	supabase = create_client(supabase_url, supabase_key)
 	try:
-		result = supabase.table("areas").select("area_id, area_name, area_level").execute()
-		if result.data and len(result.data) > 0:
-			db_areas = pd.DataFrame(result.data)
+		db_areas = get_table_from_supabase(supabase_url, supabase_key, "areas", columns=["area_id", "area_name", "area_level"])
+		if len(db_areas) > 0:
 			db_areas["area_id"] = db_areas["area_id"].astype(int)
 
 			#combine in-memory areas with database areas
@@ -7,12 +7,13 @@ from tables_builder import get_data
 
 #add project root to path for data_importer import
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from data_importer import pipe_to_supabase
+from data_importer import pipe_to_supabase, get_changed_funders, invalidate_score_cache
 
 #get keys from env
 load_dotenv()
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
+score_api_url = os.getenv("SCORE_API_URL")
 
 if __name__ == "__main__":
     try:
@@ -47,6 +48,9 @@ if __name__ == "__main__":
         for table_name, (df, unique_key) in tables.items():
             pipe_to_supabase(df, table_name, unique_key, supabase_url, supabase_key)
 
+        #evict cached scores for the funders that changed
+        invalidate_score_cache(get_changed_funders(tables), score_api_url)
+
         print("Pipeline completed successfully")
 
     except Exception as e:
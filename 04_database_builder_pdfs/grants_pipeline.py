@@ -1,7 +1,13 @@
+import sys
+import os
 import pandas as pd
 import time
 from supabase import create_client
 
+#add project root to path for table_snapshots import
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from table_snapshots import invalidate_snapshots
+
 def build_grants_table(df):
     """
     Builds a grants table from a dataframe of funder data.
@@ -205,6 +211,9 @@ def build_recipient_grants_table(recipients, grants, key, url):
         except Exception as e:
             print(f"Error upserting recipients: {e}")
 
+        #drop local snapshots, as this upsert bypasses pipe_to_supabase
+        invalidate_snapshots("recipients")
+
     print(f"Mapped {len(id_from_name)} recipient names to IDs")
 
     #build the join table
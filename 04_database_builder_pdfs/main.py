@@ -9,13 +9,14 @@ from pdf_utils import get_360_funders
 
 #add project root to path for data_importer import
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from data_importer import pipe_to_supabase
+from data_importer import pipe_to_supabase, get_changed_funders, invalidate_score_cache
 
 #get key from env
 load_dotenv()
 anthropic_key = os.getenv("ANTHROPIC_KEY")
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
+score_api_url = os.getenv("SCORE_API_URL")
 
 if __name__ == "__main__":
     try:
@@ -42,6 +43,9 @@ if __name__ == "__main__":
         for table_name, (df, unique_key) in tables.items():
             pipe_to_supabase(df, table_name, unique_key, supabase_url, supabase_key)
 
+        #evict cached scores for the funders that changed
+        invalidate_score_cache(get_changed_funders(tables), score_api_url)
+
         print("Pipeline complete!")
 
     except Exception as e:
@@ -1,5 +1,4 @@
 import pandas as pd
-from supabase import create_client
 from datetime import datetime
 
 def read_csv_data(csv_file):
@@ -36,7 +35,8 @@ def build_list_table(df, supabase_url, supabase_key):
     Builds table to upsert The List entries.
     """
 
-    supabase = create_client(supabase_url, supabase_key)
+    #project root is on the path once main.py has started
+    from utils import get_table_from_supabase
 
     #get unique list entries
     list_entries = df[["list_type", "list_date", "list_info"]].drop_duplicates().reset_index(drop=True)
@@ -44,10 +44,9 @@ def build_list_table(df, supabase_url, supabase_key):
 
     try:
         #fetch all existing list entries from database
-        result = supabase.table("list_entries").select("list_id, list_type, list_date, list_info").execute()
+        existing_entries = get_table_from_supabase(supabase_url, supabase_key, "list_entries", columns=["list_id", "list_type", "list_date", "list_info"])
 
-        if result.data and len(result.data) > 0:
-            existing_entries = pd.DataFrame(result.data)
+        if len(existing_entries) > 0:
             max_list_id = existing_entries["list_id"].max()
             next_list_id = max_list_id + 1
         else:
@@ -89,11 +88,8 @@ def build_funder_list_table(df, list_entries, supabase_url, supabase_key):
     )[["registered_num", "list_id"]].drop_duplicates()
 
     #fetch existing funders from database to validate foreign keys
-    supabase = create_client(supabase_url, supabase_key)
-
     try:
-        result = supabase.table("funders").select("registered_num").execute()
-        existing_funders = set(row["registered_num"] for row in result.data)
+        existing_funders = set(get_table_from_supabase(supabase_url, supabase_key, "funders", columns=["registered_num"])["registered_num"])
 
         #filter to only include funders that exist in the database
         initial_count = len(funder_list)
@@ -7,12 +7,14 @@ from csv_pipeline import get_list_data
 
 #add project root to path for data_importer import
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from data_importer import pipe_to_supabase
+from data_importer import pipe_to_supabase, get_changed_funders, invalidate_score_cache
+from table_snapshots import invalidate_snapshots
 
 #get keys from env
 load_dotenv()
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
+score_api_url = os.getenv("SCORE_API_URL")
 
 if __name__ == "__main__":
     try:
@@ -52,6 +54,12 @@ if __name__ == "__main__":
                 except Exception as e:
                     print(f"Warning: Could not update is_on_list for {registered_num}: {e}")
 
+            #drop local snapshots, as these updates bypass pipe_to_supabase
+            invalidate_snapshots("funders")
+
+        #evict cached scores for the funders that changed
+        invalidate_score_cache(get_changed_funders(tables), score_api_url)
+
         print("Pipeline completed successfully!")
 
     except Exception as e:
@@ -1,9 +1,15 @@
 import re
+import os
+import sys
 import pandas as pd
-import json
-from sentence_transformers import SentenceTransformer, util
 from IPython.display import display, HTML
 
+#add project root to path for shared modules
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from embedding_store import cosine_similarity
+
 def extract_classifications(row, section_cols, ukcat_df, areas_df):
     """
     Uses data from the Charity Classifications project to extract causes and beneficiaries, and Charity Commission data to match/extract areas.
@@ -142,14 +148,8 @@ def calculate_similarity_score(funder_embedding, user_embedding):
     Calculates semantic similarity between user and funder using pre-computed embeddings.
     """
     
-    #parse json   
-    if isinstance(funder_embedding, str):
-        funder_embedding = json.loads(funder_embedding)
-    if isinstance(user_embedding, str):
-        user_embedding = json.loads(user_embedding)
-    
     #calculate cosine similarity
-    score = util.cos_sim(funder_embedding, user_embedding).item()
+    score = cosine_similarity(funder_embedding, user_embedding)
     
     return max(0.0, score)
 
@@ -0,0 +1,453 @@
+import asyncio
+import json
+import os
+import sys
+import hmac
+import math
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tornado.web
+
+#add backend and project root to path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+project_root = os.path.abspath(os.path.join(backend_dir, '..'))
+for path in [project_root, backend_dir]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from backend_utils import get_area_index
+from utils import extract_classifications
+from embedding_store import decode_embedding_columns
+from grants_index import get_funder_grants_index
+from rp_engine import get_rp_engine
+from keyword_embeddings import DEFAULT_CACHE_PATH, get_keyword_cache
+from ukcat_registry import get_ukcat_registry
+from score_cache import ScoreCache, score_pairs_cached
+from funder_ranking import rank_funders, build_user_pairs, get_funder_positions, FunderVectorIndex, SHORTLIST_SIZE
+from reference_data import get_reference_data_source
+from profile_store import open_profile_store
+from step_timing import get_step_timings
+from user_encoder import get_user_encoder
+from model_runtime import load_model as load_embedding_model
+
+MODEL_NAME = "all-roberta-large-v1"
+DEFAULT_CORS_ORIGIN = "http://localhost:5174"
+USER_TEXT_FIELDS = ["user_name", "user_activities", "user_objectives"]
+USER_LIST_FIELDS = ["user_areas", "user_beneficiaries", "user_causes", "user_extracted_class"]
+
+def load_model():
+    """
+    Loads the sentence transformer used for all embeddings, in the runtime and thread count set by EMBEDDING_RUNTIME and EMBEDDING_THREADS.
+    """
+    return load_embedding_model(MODEL_NAME)
+
+class ProfileStoreSource:
+    """
+    Opens a compiled funder profile store instead of loading and preparing the reference tables.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        return open_profile_store(self.path)
+
+class ServiceBusy(Exception):
+    pass
+
+class UnknownFunder(KeyError):
+    pass
+
+class ReferenceData:
+    """
+    One load of the reference data and the indexes built on it, swapped in whole so a request never mixes two loads.
+    """
+
+    def __init__(self, data, model, generation, keyword_cache):
+        self.generation = generation
+        if isinstance(data, dict):
+            #decode embeddings once and build indexes
+            self.funders_df, _ = decode_embedding_columns(data["funders"], "registered_num")
+            grants_df, _ = decode_embedding_columns(data["grants"])
+            self.areas_df = data["areas"]
+            self.area_index = get_area_index(self.areas_df, data["hierarchies"])
+            self.grants_index = get_funder_grants_index(grants_df)
+            self.rp_engine = get_rp_engine(grants_df).build_all()
+        else:
+            #a compiled profile store serves as both grants index and RP engine
+            self.funders_df = data.funders_df
+            self.areas_df = data.areas_df
+            self.area_index = data.area_index
+            self.grants_index = data
+            self.rp_engine = data
+            data.load_keywords(keyword_cache)
+        self.funder_positions = get_funder_positions(self.funders_df)
+        self.vector_index = FunderVectorIndex(self.funders_df)
+
+class ScoringService:
+    """
+    Holds the model and reference data for the API, and runs scoring on a bounded worker pool.
+    Keyword embeddings are cached on disk at keyword_cache_path, or only in memory with None.
+    """
+
+    def __init__(self, data_source, model_loader=load_model, max_workers=None, max_pending=64, score_cache=None, keyword_cache_path=DEFAULT_CACHE_PATH):
+        self.data_source = data_source
+        self.keyword_cache_path = keyword_cache_path
+        self.model_loader = model_loader
+        self.score_cache = score_cache or ScoreCache()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self.reload_executor = ThreadPoolExecutor(max_workers=1)
+        self.max_pending = max_pending
+        self.pending = 0
+        self.ready = False
+        self.error = None
+        self.reload_error = None
+
+    def start(self):
+        """
+        Loads the model and reference data, builds the indexes and warms up by scoring one pair.
+        """
+        try:
+            start_time = time.time()
+            self.model = self.model_loader()
+            self.keyword_cache = get_keyword_cache(self.model, cache_path=self.keyword_cache_path)
+            self.data = ReferenceData(self.data_source.load(), self.model, generation=0, keyword_cache=self.keyword_cache)
+            self.user_encoder = get_user_encoder(self.model, keyword_cache=self.keyword_cache)
+            self.ukcat_registry = get_ukcat_registry()
+
+            #run a full request to warm up the model and caches
+            warm_up_profile = {"user_id": "warm-up", "user_name": "warm up", "user_activities": "warm up", "user_objectives": "",
+                               "user_areas": [], "user_beneficiaries": [], "user_causes": []}
+            self.score(self.data.funders_df["registered_num"].iloc[0], warm_up_profile)
+
+            self.ready = True
+            print(f"Scoring service ready in {time.time() - start_time:.2f}s")
+        except Exception as e:
+            #keep serving so the readiness probe can report the failure
+            self.error = repr(e)
+            print(f"Scoring service failed to start: {self.error}")
+
+    def refresh(self, funder_nums=None):
+        """
+        Reloads the reference data and swaps it in, evicting the cached scores of the given funders (or of every funder with None) first.
+        Requests already running finish on the old data, but the rows they score are no longer cached.
+        Returns the number of rows evicted, or None if the reload failed and the old data was kept.
+        """
+        try:
+            start_time = time.time()
+            data = ReferenceData(self.data_source.load(), self.model, generation=self.data.generation + 1, keyword_cache=self.keyword_cache)
+        except Exception as e:
+            self.reload_error = repr(e)
+            print(f"Reference data reload failed, keeping generation {self.data.generation}: {self.reload_error}")
+            return None
+
+        evicted = self.evict(funder_nums, data.generation)
+        self.data = data
+        self.reload_error = None
+        print(f"Reloaded reference data (generation {data.generation}) in {time.time() - start_time:.2f}s, evicted {evicted} cached scores")
+
+        return evicted
+
+    def schedule_refresh(self, funder_nums=None):
+        """
+        Queues a reload on the reload thread, so reloads run one at a time without taking scoring workers.
+        """
+        return self.reload_executor.submit(self.refresh, funder_nums)
+
+    def evict(self, funder_nums=None, generation=None):
+        """
+        Evicts the cached scores of the given funders, or of every funder with None, returning the number of rows evicted.
+        """
+        if funder_nums is None:
+            evicted = self.score_cache.stats()["size"]
+            self.score_cache.clear(generation)
+            return evicted
+
+        return self.score_cache.invalidate_funders(funder_nums, generation)
+
+    def build_user(self, profile):
+        """
+        Builds the user_ columns of a pairs row from a submitted charity profile.
+        """
+        user = {
+            "user_id": str(profile.get("user_id") or ""),
+            "user_name": profile.get("user_name") or "",
+            "user_areas": list(profile.get("user_areas") or []),
+            "user_beneficiaries": list(profile.get("user_beneficiaries") or []),
+            "user_causes": list(profile.get("user_causes") or [])
+        }
+        user_activities = profile.get("user_activities") or ""
+        user_objectives = profile.get("user_objectives") or ""
+
+        #use submitted keywords, or extract them as in 10.2
+        keywords = profile.get("user_extracted_class")
+        if keywords is None:
+            row = {"extracted_class": user["user_areas"], "user_name": user["user_name"], "user_objectives": user_objectives, "user_activities": user_activities}
+            keywords = extract_classifications(row, ["user_name", "user_objectives", "user_activities"], self.ukcat_registry, self.data.areas_df)
+        user["user_extracted_class"] = [str(keyword).upper() for keyword in keywords if str(keyword).upper() != "GRANT MAKING"]
+
+        #embed name, concatenated text and keywords in one batch, reusing cached vectors
+        return self.user_encoder.encode_user(user, user_activities, user_objectives)
+
+    def score(self, funder_num, profile, explain=False):
+        """
+        Scores one funder for a user profile, with the reasoning for each step if explain is set.
+        """
+        data = self.data
+        if funder_num not in data.funder_positions:
+            raise UnknownFunder(f"Unknown funder '{funder_num}'")
+
+        user = self.build_user(profile)
+        pairs_df = build_user_pairs(user, data.funders_df.iloc[[data.funder_positions[funder_num]]])
+        scores_df = score_pairs_cached(pairs_df, data.grants_index, data.rp_engine, data.area_index, self.model, self.score_cache, explain=explain,
+                                       generation=data.generation, keyword_cache=self.keyword_cache)
+
+        return scores_df.to_dict("records")[0]
+
+    def rank(self, profile, top_k):
+        """
+        Ranks all funders for a user profile.
+        """
+        data = self.data
+        user = self.build_user(profile)
+        shortlist = data.vector_index.search(user["user_concat_em"], SHORTLIST_SIZE)
+        ranked_df = rank_funders(user, data.funders_df, data.grants_index, data.rp_engine, data.area_index, self.model, top_k=top_k, shortlist=shortlist,
+                                 score_cache=self.score_cache, generation=data.generation, funder_positions=data.funder_positions, keyword_cache=self.keyword_cache)
+
+        return ranked_df.to_dict("records")
+
+    async def run(self, fn, *args):
+        """
+        Runs a scoring call on the worker pool, refusing new work once too many calls are waiting.
+        """
+        if self.pending >= self.max_pending:
+            raise ServiceBusy()
+
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+def validate_user(user):
+    """
+    Returns why a submitted user profile is invalid, or None if its fields have the right types.
+    """
+    if not isinstance(user, dict):
+        return "user must be an object"
+    if user.get("user_id") is not None and (isinstance(user["user_id"], bool) or not isinstance(user["user_id"], (str, int))):
+        return "user.user_id must be a string or integer"
+    for field in USER_TEXT_FIELDS:
+        if user.get(field) is not None and not isinstance(user[field], str):
+            return f"user.{field} must be a string"
+    for field in USER_LIST_FIELDS:
+        if user.get(field) is not None and not (isinstance(user[field], list) and all(isinstance(item, str) for item in user[field])):
+            return f"user.{field} must be a list of strings"
+
+    return None
+
+def to_json_safe(value):
+    """
+    Converts numpy values and NaNs so results can be serialised to json.
+    """
+    if isinstance(value, dict):
+        return {key: to_json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [to_json_safe(item) for item in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, service):
+        self.service = service
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json")
+        self.set_header("Access-Control-Allow-Origin", os.getenv("CORS_ORIGIN", DEFAULT_CORS_ORIGIN))
+        self.set_header("Access-Control-Allow-Headers", "Content-Type")
+        self.set_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+
+    def options(self, *args):
+        self.set_status(204)
+
+    def write_json(self, payload, status=200):
+        self.set_status(status)
+        self.finish(json.dumps(to_json_safe(payload)))
+
+    def write_error(self, status_code, **kwargs):
+        #answer tornado's own errors as json rather than html
+        self.finish(json.dumps({"error": self._reason}))
+
+    def get_body(self):
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise tornado.web.HTTPError(400, reason="Body must be json")
+        if not isinstance(body, dict):
+            raise tornado.web.HTTPError(400, reason="Body must be a json object")
+
+        return body
+
+    def check_token(self):
+        """
+        Checks the request's bearer token against SCORE_API_TOKEN, answering 403 if no token is set and 401 if it does not match.
+        """
+        token = os.getenv("SCORE_API_TOKEN")
+        if not token:
+            self.write_json({"error": "Set SCORE_API_TOKEN to enable this route"}, status=403)
+            return False
+        if not hmac.compare_digest(self.request.headers.get("Authorization", "").encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            self.set_header("WWW-Authenticate", "Bearer")
+            self.write_json({"error": "Missing or invalid token"}, status=401)
+            return False
+
+        return True
+
+    async def run_scoring(self, fn, *args):
+        if not self.service.ready:
+            self.write_json({"error": "Service is still loading"}, status=503)
+            return None
+        try:
+            return await self.service.run(fn, *args)
+        except ServiceBusy:
+            self.set_header("Retry-After", "1")
+            self.write_json({"error": "Too many requests in progress"}, status=503)
+        except UnknownFunder as e:
+            self.write_json({"error": str(e.args[0])}, status=404)
+        except Exception as e:
+            print(f"Scoring failed: {e!r}")
+            traceback.print_exc()
+            self.write_json({"error": "Scoring failed"}, status=500)
+        return None
+
+class LiveHandler(BaseHandler):
+    def get(self):
+        self.write_json({"status": "live"})
+
+class ReadyHandler(BaseHandler):
+    def get(self):
+        if self.service.ready:
+            payload = {"status": "ready", "generation": self.service.data.generation}
+            if self.service.reload_error:
+                payload["reload_error"] = self.service.reload_error
+            self.write_json(payload)
+        elif self.service.error:
+            self.write_json({"status": "failed", "error": self.service.error}, status=503)
+        else:
+            self.write_json({"status": "loading"}, status=503)
+
+class ScoreHandler(BaseHandler):
+    async def post(self):
+        body = self.get_body()
+        if "funder_registered_num" not in body or "user" not in body:
+            self.write_json({"error": "Body needs funder_registered_num and user"}, status=400)
+            return
+        funder_num = body["funder_registered_num"]
+        if isinstance(funder_num, bool) or not isinstance(funder_num, (str, int)):
+            self.write_json({"error": "funder_registered_num must be a string or integer"}, status=400)
+            return
+        error = validate_user(body["user"])
+        if error is None and not isinstance(body.get("explain", False), bool):
+            error = "explain must be true or false"
+        if error:
+            self.write_json({"error": error}, status=400)
+            return
+
+        result = await self.run_scoring(self.service.score, str(funder_num), body["user"], body.get("explain", False))
+        if result is not None:
+            self.write_json(result)
+
+class RankHandler(BaseHandler):
+    async def post(self):
+        body = self.get_body()
+        if "user" not in body:
+            self.write_json({"error": "Body needs user"}, status=400)
+            return
+        top_k = body.get("top_k", 50)
+        error = validate_user(body["user"])
+        if error is None and (isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1):
+            error = "top_k must be a positive integer"
+        if error:
+            self.write_json({"error": error}, status=400)
+            return
+
+        result = await self.run_scoring(self.service.rank, body["user"], top_k)
+        if result is not None:
+            self.write_json({"funders": result})
+
+class CacheInvalidateHandler(BaseHandler):
+    def post(self):
+        if not self.check_token():
+            return
+        body = self.get_body()
+        if body.get("all"):
+            funder_nums = None
+        elif isinstance(body.get("funder_registered_nums"), list):
+            funder_nums = [str(funder_num) for funder_num in body["funder_registered_nums"]]
+        else:
+            self.write_json({"error": "Body needs funder_registered_nums or all"}, status=400)
+            return
+
+        #evicting alone would rescore from the same in-memory data, so reload it first unless told not to
+        if body.get("reload", True):
+            if not self.service.ready:
+                self.write_json({"error": "Service is still loading"}, status=503)
+                return
+            self.service.schedule_refresh(funder_nums)
+            self.write_json({"reloading": True, "generation": self.service.data.generation, "cache": self.service.score_cache.stats()}, status=202)
+            return
+
+        evicted = self.service.evict(funder_nums)
+        self.write_json({"evicted": evicted, "cache": self.service.score_cache.stats()})
+
+class MetricsHandler(BaseHandler):
+    def get(self):
+        #per-step timings are only filled while SCORE_STEP_TIMING is set
+        timings = get_step_timings()
+        if self.get_query_argument("format", "prometheus") == "json":
+            self.write_json(timings.to_json())
+            return
+
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(timings.to_prometheus())
+
+def make_app(service):
+    """
+    Builds the tornado application for a scoring service.
+    """
+    handler_args = {"service": service}
+    return tornado.web.Application([
+        (r"/health/live", LiveHandler, handler_args),
+        (r"/health/ready", ReadyHandler, handler_args),
+        (r"/score", ScoreHandler, handler_args),
+        (r"/rank", RankHandler, handler_args),
+        (r"/cache/invalidate", CacheInvalidateHandler, handler_args),
+        (r"/metrics", MetricsHandler, handler_args)
+    ])
+
+def get_data_source():
+    """
+    Chooses the data source from the environment: a compiled profile store if SCORE_PROFILE_DIR is set, otherwise the reference tables.
+    """
+    profile_dir = os.getenv("SCORE_PROFILE_DIR")
+    if profile_dir:
+        return ProfileStoreSource(profile_dir)
+
+    return get_reference_data_source()
+
+async def main():
+    score_cache = ScoreCache(max_size=int(os.getenv("SCORE_CACHE_SIZE", "10000")), ttl=float(os.getenv("SCORE_CACHE_TTL", "3600")))
+    service = ScoringService(get_data_source(), max_workers=int(os.getenv("SCORE_WORKERS", "0")) or None, score_cache=score_cache)
+    app = make_app(service)
+    app.listen(int(os.getenv("PORT", "8000")))
+
+    #load in the background so the liveness probe answers during warm-up
+    asyncio.get_running_loop().run_in_executor(None, service.start)
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
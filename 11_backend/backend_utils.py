@@ -1,155 +1,15 @@
 import pandas as pd
-from supabase import create_client
-import time
-import re
-import json
-from sentence_transformers import SentenceTransformer, util
-
-def get_table_from_supabase(url, key, table_name, batch_size=1000, delay=0.2, filter_recipients=False):
-    """
-    Fetches table data from Supabase with batching to avoid timeouts
-    """
-
-    PRIMARY_KEYS = {
-        "recipients": "recipient_id",
-        "funders": "registered_num",
-        "grants": "grant_id",
-        "evaluation_pairs": "id",
-        "beneficiaries": "ben_id",
-        "causes": "cause_id",
-        "areas": "area_id",
-        "financials": "financials_id",
-        "list_entries": "list_id",
-        "funder_causes": "funder_causes_id",
-        "funder_areas": "funder_areas_id",
-        "funder_beneficiaries": "funder_ben_id",
-        "funder_grants": "funder_grants_id",
-        "funder_financials": "funder_fin_id",
-        "funder_list": "funder_list_id",
-        "recipient_grants": "recipient_grants_id",
-        "recipient_areas": "recipient_areas_id",
-        "recipient_beneficiaries": "recipient_ben_id",
-        "recipient_causes": "recipient_cause_id",
-        "embedding_pairs": "id",
-        "logic_pairs": "id",
-        "area_hierarchy": "parent_area_id"
-    }
-
-    #create client instance
-    supabase = create_client(url, key)
-
-    all_data = []
-    offset = 0
-
-    while True:
-        query = supabase.table(table_name).select("*")
-
-        #get only actual recipients
-        if filter_recipients:
-            query = query.eq("is_recipient", True)
-
-        #order by primary key
-        if table_name not in PRIMARY_KEYS:
-            raise ValueError(f"Unknown table '{table_name}' - please add ordering column to PRIMARY_KEYS")
-
-        query = query.order(PRIMARY_KEYS[table_name])
-
-        #batch imports
-        try:
-            response = query.limit(batch_size).offset(offset).execute()
-            data = response.data
-        except Exception as e:
-            if "timeout" in str(e).lower() and batch_size > 10:
-                return get_table_from_supabase(url, key, table_name, batch_size=batch_size // 2, delay=delay, filter_recipients=filter_recipients)
-            raise
-
-        if not data:
-            break
-
-        all_data.extend(data)
-        offset += len(data)
-
-        if len(data) < batch_size:
-            break
-
-        time.sleep(delay)
-
-    df = pd.DataFrame(all_data)
-
-    return df
-
-def extract_classifications(row, section_cols, ukcat_df, areas_df):
-    """
-    Uses data from the Charity Classifications project to extract causes and beneficiaries, and Charity Commission data to match/extract areas.
-    """
-
-    #get existing extracted classifications
-    existing_classes = list(row["extracted_class"]) if isinstance(row["extracted_class"], list) else []
-
-    #concatenate sections
-    sections = []
-    for col in section_cols:
-        if pd.notna(row[col]) and str(row[col]).strip():
-            sections.append(str(row[col]))
-
-    if not sections:
-        return existing_classes
-
-    text_to_search = " ".join(sections)
-
-    matched_items = []
-
-    #check against ukcat patterns
-    for idx, ukcat_row in ukcat_df.iterrows():
-
-        pattern = ukcat_row["Regular expression"]
-        exclude_pattern = ukcat_row["Exclude regular expression"]
-
-        if pd.isna(pattern) or not pattern:
-            continue
-
-        try:
-            #check if patterns match
-            if re.search(pattern, text_to_search, re.IGNORECASE):
-                #check exclude patterns do not match
-                if pd.notna(exclude_pattern) and exclude_pattern:
-                    if re.search(exclude_pattern, text_to_search, re.IGNORECASE):
-                        continue
-
-                #add tag
-                matched_items.append(ukcat_row["tag"])
-        except re.error:
-            continue
-
-    #check against areas
-    for idx, area_row in areas_df.iterrows():
-
-        area_name = area_row["area_name"]
-
-        if pd.isna(area_name) or not area_name:
-            continue
-
-        #handle partial matches
-        pattern = r'\b' + re.escape(str(area_name)) + r'\b'
-
-        try:
-            if re.search(pattern, text_to_search, re.IGNORECASE):
-                matched_items.append(area_name)
-        except re.error:
-            continue
-
-    #combine with existing and return unique items
-    all_classes = existing_classes + matched_items
-
-    checked = set()
-    unique_classes = []
-    for item in all_classes:
-        item_lower = str(item).lower()
-        if item_lower not in checked:
-            checked.add(item_lower)
-            unique_classes.append(item)
-
-    return unique_classes
+import os
+import sys
+import functools
+import threading
+
+#add project root to path for shared modules
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from utils import extract_classifications, get_table_from_supabase
+from embedding_store import cosine_similarity
 
 def get_id_from_name(area_name, df):
     """
@@ -170,21 +30,7 @@ def get_granularity_weight(area_id, df):
     Provides the weighting for an area based on the granularity of its level.
     """
     area_level = df[df["area_id"] == area_id]["area_level"].values[0]
-    
-    #england and wales areas
-    if area_level == "local_authority":
-        return 1.0
-    elif area_level == "metropolitan_county":
-        return 0.85
-    elif area_level == "region":
-        return 0.7
-    #international areas
-    elif area_level == "country":
-        return 1.0
-    elif area_level == "continent":
-        return 0.7
-    else:
-        return 0.5
+    return granularity_weight_for_level(area_level)
 
 def get_descendants(area_id, df):
     """
@@ -210,19 +56,130 @@ def check_if_parent(parent_id, child_id, hierarchies_df):
     """
     descendants = get_descendants(parent_id, hierarchies_df)
     return child_id in descendants
- 
+
+class AreaIndex:
+    """
+    Lookup maps and hierarchy closure for areas, built once from the areas and area_hierarchy tables.
+    """
+
+    def __init__(self, areas_df, hierarchies_df):
+        #map names and ids, keeping the first row for repeated names as get_id_from_name does
+        self.name_to_id = {}
+        self.id_to_name = {}
+        self.id_to_level = {}
+        for area_id, area_name, area_level in zip(areas_df["area_id"], areas_df["area_name"], areas_df["area_level"]):
+            self.name_to_id.setdefault(area_name, area_id)
+            self.id_to_name.setdefault(area_id, area_name)
+            self.id_to_level.setdefault(area_id, area_level)
+
+        #get weights per id
+        self.id_to_weight = {area_id: granularity_weight_for_level(level) for area_id, level in self.id_to_level.items()}
+
+        #get direct children of each parent
+        children = {}
+        for parent, child in zip(hierarchies_df["parent_area_id"], hierarchies_df["child_area_id"]):
+            children.setdefault(parent, []).append(child)
+
+        #walk the hierarchy once per parent to get descendants and invert for ancestors
+        self.descendants = {}
+        self.ancestors = {}
+        for parent in children:
+            descendants = set()
+            areas_to_check = [parent]
+            while areas_to_check:
+                current = areas_to_check.pop()
+                for child in children.get(current, []):
+                    if child not in descendants:
+                        descendants.add(child)
+                        areas_to_check.append(child)
+            self.descendants[parent] = frozenset(descendants)
+            for child in descendants:
+                self.ancestors.setdefault(child, set()).add(parent)
+
+    def get_id(self, area_name):
+        """
+        Returns the ID for an area name.
+        """
+        return self.name_to_id.get(area_name)
+
+    def get_name(self, area_id):
+        """
+        Returns the name for an area ID.
+        """
+        return self.id_to_name.get(area_id)
+
+    def get_weight(self, area_id):
+        """
+        Returns the granularity weight for an area ID.
+        """
+        return self.id_to_weight[area_id]
+
+    def is_parent(self, parent_id, child_id):
+        """
+        Checks if an area is a parent of another.
+        """
+        return child_id in self.descendants.get(parent_id, ())
+
+def granularity_weight_for_level(area_level):
+    """
+    Provides the weighting for an area level based on its granularity.
+    """
+
+    #england and wales areas
+    if area_level == "local_authority":
+        return 1.0
+    elif area_level == "metropolitan_county":
+        return 0.85
+    elif area_level == "region":
+        return 0.7
+    #international areas
+    elif area_level == "country":
+        return 1.0
+    elif area_level == "continent":
+        return 0.7
+    else:
+        return 0.5
+
+def get_frame_signature(frame):
+    """
+    Gets a dataframe's identity, shape and columns, so rows or columns added in place are noticed.
+    """
+    return id(frame), frame.shape, tuple(frame.columns)
+
+def cache_on_frames(builder):
+    """
+    Memoises a builder on the dataframes passed to it, so an index is built once per loaded dataset, and is safe to call from several threads.
+    The cached frames are kept referenced so their ids cannot be reused; values edited in place are not noticed, so loaded frames are treated as read-only.
+    """
+    cache = {}
+    lock = threading.Lock()
+
+    @functools.wraps(builder)
+    def wrapper(*frames):
+        key = tuple(get_frame_signature(frame) for frame in frames)
+        with lock:
+            entry = cache.get("entry")
+            if entry is None or entry[0] != key:
+                #replace key, frames and value together so no caller sees a value built for other frames
+                entry = (key, frames, builder(*frames))
+                cache["entry"] = entry
+        return entry[2]
+
+    return wrapper
+
+@cache_on_frames
+def get_area_index(areas_df, hierarchies_df):
+    """
+    Gets the area index for the loaded areas and hierarchy tables.
+    """
+    return AreaIndex(areas_df, hierarchies_df)
+
 def calculate_similarity_score(funder_embedding, user_embedding):
     """
     Calculates semantic similarity between user and funder using pre-computed embeddings.
     """
     
-    #parse json   
-    if isinstance(funder_embedding, str):
-        funder_embedding = json.loads(funder_embedding)
-    if isinstance(user_embedding, str):
-        user_embedding = json.loads(user_embedding)
-    
     #calculate cosine similarity
-    score = util.cos_sim(funder_embedding, user_embedding).item()
+    score = cosine_similarity(funder_embedding, user_embedding)
     
     return max(0.0, score)
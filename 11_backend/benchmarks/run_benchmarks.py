@@ -0,0 +1,300 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+import numpy as np
+
+#add backend and project root to path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+project_root = os.path.abspath(os.path.join(backend_dir, '..'))
+for path in [project_root, backend_dir]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from backend_utils import get_area_index, calculate_similarity_score
+from grants_index import get_funder_grants_index
+from rp_engine import get_rp_engine
+from embedding_store import embedding_to_array
+from keyword_embeddings import KeywordEmbeddingCache
+from ukcat_registry import UkcatRegistry, use_ukcat_registry, get_ukcat_registry
+from scoring_logic import (check_existing_relationship, check_areas, check_beneficiaries, check_causes, check_keywords, check_name_rp,
+                           check_grants_rp, check_recipients_rp, calculate_keywords_bonus, calculate_relationship_bonus,
+                           calculate_areas_bonus_rp, calculate_keywords_bonus_rp, calculate_lv_penalty, score_pair, combine_scores)
+from funder_ranking import FunderVectorIndex, SHORTLIST_SIZE
+from synthetic_data import make_synthetic_data, SyntheticModel
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_SCALES = [1000, 10000, 100000]
+
+def get_steps(pair, prepared):
+    """
+    Returns the 20 scoring steps for one pair as named callables, run in order and sharing their results as score_pair does.
+    """
+    grants_index, rp_matrices, area_index, model, keyword_cache = prepared
+    state = {}
+
+    def existing_relationship():
+        state["existing_relationship"], _, _ = check_existing_relationship(grants_index, pair["funder_registered_num"], pair["user_id"], explain=False)
+
+    def keywords():
+        _, state["strong_matches"], _, _ = check_keywords(pair["extracted_class"], pair["user_extracted_class"], model, keyword_cache, explain=False)
+
+    def causes():
+        _, _, state["has_gcp"] = check_causes(pair["causes"], pair["user_causes"], explain=False)
+
+    def keywords_bonus():
+        if state["strong_matches"]:
+            calculate_keywords_bonus(state["strong_matches"], get_ukcat_registry())
+
+    def relationship_bonus():
+        if state["existing_relationship"]:
+            calculate_relationship_bonus(grants_index.get_relationship_years(pair["funder_registered_num"], pair["user_id"]))
+
+    return [
+        ("01_is_sbf", lambda: pair["is_potential_sbf"]),
+        ("02_is_nua", lambda: pair["is_nua"]),
+        ("03_is_on_list", lambda: pair["is_on_list"]),
+        ("04_existing_relationship", existing_relationship),
+        ("05_areas", lambda: check_areas(pair["areas"], pair["user_areas"], area_index, explain=False)),
+        ("06_beneficiaries", lambda: check_beneficiaries(pair["beneficiaries"], pair["user_beneficiaries"], explain=False)),
+        ("07_causes", causes),
+        ("08_text_similarity", lambda: calculate_similarity_score(pair["concat_em"], pair["user_concat_em"])),
+        ("09_keyword_similarity", keywords),
+        ("10_name_rp", lambda: check_name_rp(rp_matrices, pair["user_name_em"], pair["user_name"], explain=False)),
+        ("11_grants_rp", lambda: check_grants_rp(rp_matrices, pair["user_concat_em"], pair["user_name"], explain=False)),
+        ("12_recipients_rp", lambda: check_recipients_rp(rp_matrices, pair["user_concat_em"], pair["user_name"], explain=False)),
+        ("13_sbf_penalty", lambda: 0.1 if pair["is_potential_sbf"] else 1.0),
+        ("14_nua_penalty", lambda: 1.0 if state["existing_relationship"] else (0.2 if pair["is_nua"] else 1.0)),
+        ("15_keywords_bonus", keywords_bonus),
+        ("16_relationship_bonus", relationship_bonus),
+        ("17_gcp_bonus", lambda: 1.2 if state["has_gcp"] else 1.0),
+        ("18_areas_rp_bonus", lambda: calculate_areas_bonus_rp(rp_matrices, pair["user_areas"], area_index, explain=False)),
+        ("19_keywords_rp_bonus", lambda: calculate_keywords_bonus_rp(rp_matrices, pair["user_extracted_class"], explain=False)),
+        ("20_lv_penalty", lambda: calculate_lv_penalty(rp_matrices))
+    ]
+
+def measure(fn, trace_memory=False):
+    """
+    Runs a callable and returns its wall time in seconds, and the peak memory it allocated in bytes if tracing.
+    """
+    if trace_memory:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - before if trace_memory else None
+
+    return elapsed, peak
+
+def summarise(timings, peaks):
+    """
+    Summarises timings as p50/p99/mean in milliseconds, with the largest peak allocation in KiB.
+    """
+    timings_ms = np.array(timings) * 1000
+
+    return {
+        "n": len(timings),
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "mean_ms": float(timings_ms.mean()),
+        "peak_memory_kib": float(max(peaks) / 1024) if peaks else None
+    }
+
+def benchmark_prefilter(funders_df, pairs, k=SHORTLIST_SIZE):
+    """
+    Times building the funder vector index and shortlisting each pair's user with every vector scanned and with IVF lists,
+    and the recall of the IVF shortlists: the share of their funders at least as similar as the exact k-th funder.
+    """
+    num_lists = max(int(np.sqrt(len(funders_df))), 2)
+    results = {}
+    exact_cutoffs = []
+    for name, index_lists in [("exact", 0), ("ivf", num_lists)]:
+        indexes = []
+        build_seconds, _ = measure(lambda: indexes.append(FunderVectorIndex(funders_df, num_lists=index_lists)))
+        index = indexes[0]
+        timings, recalls = [], []
+        for pair in pairs:
+            shortlist = []
+            elapsed, _ = measure(lambda: shortlist.append(index.search(pair["user_concat_em"], k)))
+            timings.append(elapsed)
+            similarities = shortlist[0][1]
+            if name == "exact":
+                exact_cutoffs.append(similarities[-1] if similarities else 0.0)
+            else:
+                recalls.append(np.mean(np.array(similarities) >= exact_cutoffs[len(recalls)] - 1e-6) if similarities else 1.0)
+        results[name] = {"build_seconds": build_seconds, **summarise(timings, [])}
+        if recalls:
+            results[name]["num_lists"] = num_lists
+            results[name]["recall"] = float(np.mean(recalls))
+
+    return results
+
+def benchmark_scale(num_funders, grants_per_funder=10, keywords_per_user=5, num_pairs=200, dim=1024, seed=0):
+    """
+    Generates synthetic data for one scale and benchmarks index preparation, each scoring step and end-to-end scoring over the sampled pairs.
+    """
+    print(f"Generating {num_funders:,} funders...")
+    start = time.perf_counter()
+    frames = make_synthetic_data(num_funders, grants_per_funder=grants_per_funder, keywords_per_user=keywords_per_user, num_pairs=num_pairs, dim=dim, seed=seed)
+    generate_seconds = time.perf_counter() - start
+    model = SyntheticModel(dim)
+    keyword_cache = KeywordEmbeddingCache(model, model_name="synthetic", cache_path=None)
+    previous_registry = use_ukcat_registry(UkcatRegistry(frames["ukcat"]))
+
+    try:
+        #time building the shared indexes once
+        tracemalloc.start()
+        preparation = {}
+        for name, fn in [("area_index", lambda: get_area_index(frames["areas"], frames["hierarchies"])),
+                         ("grants_index", lambda: get_funder_grants_index(frames["grants"]))]:
+            elapsed, peak = measure(fn, trace_memory=True)
+            preparation[name] = {"seconds": elapsed, "peak_memory_kib": peak / 1024}
+        area_index = get_area_index(frames["areas"], frames["hierarchies"])
+        grants_index = get_funder_grants_index(frames["grants"])
+        rp_engine = get_rp_engine(frames["grants"])
+
+        #decode each pair's embeddings once, as the batch scorer does
+        pairs = frames["pairs"].to_dict("records")
+        for pair in pairs:
+            for col in ["concat_em", "user_name_em", "user_concat_em"]:
+                pair[col] = embedding_to_array(pair[col])
+
+        #build each sampled funder's RP matrices on first use
+        rp_timings, rp_peaks = [], []
+        for funder_num in dict.fromkeys(pair["funder_registered_num"] for pair in pairs):
+            elapsed, peak = measure(lambda: rp_engine.get_funder(funder_num), trace_memory=True)
+            rp_timings.append(elapsed)
+            rp_peaks.append(peak)
+        preparation["rp_matrices_per_funder"] = summarise(rp_timings, rp_peaks)
+        tracemalloc.stop()
+
+        #compare a full scan of the funder vectors with IVF lists
+        prefilter = benchmark_prefilter(frames["funders"], pairs)
+
+        #warm the keyword cache so steps measure scoring, not first-time encoding
+        for pair in pairs:
+            check_keywords(pair["extracted_class"], pair["user_extracted_class"], model, keyword_cache, explain=False)
+
+        step_timings, step_peaks = {}, {}
+        end_to_end_timings, end_to_end_peaks = [], []
+        #time without tracing, then trace memory in a second pass
+        for trace_memory in [False, True]:
+            if trace_memory:
+                tracemalloc.start()
+            for pair in pairs:
+                prepared = (grants_index, rp_engine.get_funder(pair["funder_registered_num"]), area_index, model, keyword_cache)
+                for name, fn in get_steps(pair, prepared):
+                    elapsed, peak = measure(fn, trace_memory)
+                    if trace_memory:
+                        step_peaks.setdefault(name, []).append(peak)
+                    else:
+                        step_timings.setdefault(name, []).append(elapsed)
+
+                score = lambda: combine_scores(score_pair(pair, grants_index, prepared[1], area_index, model, keyword_cache))
+                elapsed, peak = measure(score, trace_memory)
+                if trace_memory:
+                    end_to_end_peaks.append(peak)
+                else:
+                    end_to_end_timings.append(elapsed)
+    finally:
+        tracemalloc.stop()
+        use_ukcat_registry(previous_registry)
+
+    return {
+        "num_funders": num_funders,
+        "num_grants": len(frames["grants"]),
+        "num_pairs": len(pairs),
+        "generate_seconds": generate_seconds,
+        "preparation": preparation,
+        "prefilter": prefilter,
+        "steps": {name: summarise(step_timings[name], step_peaks[name]) for name in step_timings},
+        "end_to_end": summarise(end_to_end_timings, end_to_end_peaks),
+        "max_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def get_git_commit():
+    """
+    Gets the current commit so results can be matched to code, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=project_root, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(scales=DEFAULT_SCALES, grants_per_funder=10, keywords_per_user=5, num_pairs=200, dim=1024, seed=0, output_path=None):
+    """
+    Benchmarks every scale and saves the results as json, returning the results and the path written.
+    """
+    results = {
+        "commit": get_git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "config": {"grants_per_funder": grants_per_funder, "keywords_per_user": keywords_per_user, "num_pairs": num_pairs, "dim": dim, "seed": seed},
+        "scales": {}
+    }
+    for num_funders in scales:
+        results["scales"][str(num_funders)] = benchmark_scale(num_funders, grants_per_funder, keywords_per_user, num_pairs, dim, seed)
+        end_to_end = results["scales"][str(num_funders)]["end_to_end"]
+        prefilter = results["scales"][str(num_funders)]["prefilter"]
+        print(f"{num_funders:,} funders: end-to-end p50 {end_to_end['p50_ms']:.3f}ms, p99 {end_to_end['p99_ms']:.3f}ms; "
+              f"prefilter p50 {prefilter['exact']['p50_ms']:.3f}ms exact, {prefilter['ivf']['p50_ms']:.3f}ms ivf (recall {prefilter['ivf']['recall']:.2f})")
+
+    if output_path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output_path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{(results['commit'] or 'nocommit')[:8]}.json")
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output_path}")
+
+    return results, output_path
+
+def compare_results(old_path, new_path, threshold=0.1):
+    """
+    Prints the change in p50/p99 latency per step between two results files, flagging slowdowns over the threshold.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for scale, new_scale in new["scales"].items():
+        old_scale = old["scales"].get(scale)
+        if old_scale is None:
+            continue
+        print(f"\n{int(scale):,} funders")
+        rows = list(new_scale["steps"].items()) + [("end_to_end", new_scale["end_to_end"])]
+        for name, new_stats in rows:
+            old_stats = old_scale["end_to_end"] if name == "end_to_end" else old_scale["steps"].get(name)
+            if old_stats is None:
+                continue
+            changes = []
+            for stat in ["p50_ms", "p99_ms"]:
+                ratio = new_stats[stat] / old_stats[stat] if old_stats[stat] else float("nan")
+                flag = " !" if ratio > 1 + threshold else ""
+                changes.append(f"{stat} {old_stats[stat]:.4f} -> {new_stats[stat]:.4f} ({ratio:.2f}x){flag}")
+            print(f"  {name:<26} " + "  ".join(changes))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scoring steps on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="numbers of funders to benchmark")
+    parser.add_argument("--grants-per-funder", type=int, default=10)
+    parser.add_argument("--keywords-per-user", type=int, default=5)
+    parser.add_argument("--pairs", type=int, default=200, help="pairs sampled per scale")
+    parser.add_argument("--dim", type=int, default=1024, help="embedding size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file, defaults to results/<timestamp>-<commit>.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+    else:
+        run_benchmarks(args.scales, args.grants_per_funder, args.keywords_per_user, args.pairs, args.dim, args.seed, args.output)
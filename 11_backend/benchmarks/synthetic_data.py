@@ -0,0 +1,244 @@
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+#add backend and project root to path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+project_root = os.path.abspath(os.path.join(backend_dir, '..'))
+for path in [project_root, backend_dir]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from reference_data import build_funders_df, build_grants_df
+
+CAUSES = [
+    "General Charitable Purposes", "Education/training", "The Advancement Of Health Or Saving Of Lives", "Disability",
+    "The Prevention Or Relief Of Poverty", "Overseas Aid/famine Relief", "Accommodation/housing", "Religious Activities",
+    "Arts/culture/heritage/science", "Amateur Sport", "Animals", "Environment/conservation/heritage", "Economic/community Development/employment",
+    "Armed Forces/emergency Service Efficiency", "Human Rights/religious Or Racial Harmony/equality Or Diversity", "Recreation", "Other Charitable Purposes"
+]
+BENEFICIARIES = [
+    "Children/young People", "Elderly/old People", "People With Disabilities", "People Of A Particular Ethnic Or Racial Origin",
+    "Other Charities Or Voluntary Bodies", "Other Defined Groups", "The General Public/mankind"
+]
+LIST_TYPES = ["Funds unsolicited applications", "Funds small charities", "Funds core costs"]
+NUM_TOPICS = 200
+VARIANTS_PER_TOPIC = 5
+
+class SyntheticModel:
+    """
+    Deterministic stand-in for the sentence transformer: keywords sharing a topic get vectors with cosine similarity around 0.96,
+    so strong keyword matches occur as they do with real embeddings. Other text gets an unrelated vector per string.
+    """
+
+    def __init__(self, dim=1024):
+        self.dim = dim
+        self.vectors = {}
+
+    def _vector(self, text):
+        if text not in self.vectors:
+            seed = int.from_bytes(hashlib.md5(text.encode("utf-8")).digest()[:8], "little")
+            self.vectors[text] = np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+        return self.vectors[text]
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        encoded = []
+        for text in [texts] if single else texts:
+            topic, _, variant = str(text).rpartition(" ")
+            if topic.startswith("TOPIC") and variant.isalpha():
+                encoded.append(self._vector(topic) + 0.2 * self._vector(str(text)))
+            else:
+                encoded.append(self._vector(str(text)))
+
+        return encoded[0] if single else np.stack(encoded) if encoded else np.zeros((0, self.dim), dtype=np.float32)
+
+def make_keywords():
+    """
+    Builds the synthetic keyword vocabulary, e.g. "TOPIC12 B", with a UK-CAT style table giving each a level and pattern.
+    """
+    keywords = [f"TOPIC{topic} {chr(65 + variant)}" for topic in range(NUM_TOPICS) for variant in range(VARIANTS_PER_TOPIC)]
+    ukcat_df = pd.DataFrame({
+        "tag": [keyword.title() for keyword in keywords],
+        "level": [1 + i % 3 for i in range(len(keywords))],
+        "Regular expression": [rf"\b{keyword.lower()}\b" for keyword in keywords],
+        "Exclude regular expression": [None] * len(keywords)
+    })
+
+    return keywords, ukcat_df
+
+def make_areas():
+    """
+    Builds a UK-shaped area table and hierarchy: one continent, four countries, regions, metropolitan counties and local authorities.
+    """
+    areas = [("C0", "continent", "Europe")]
+    hierarchy = []
+    for country in range(4):
+        country_id = f"K{country}"
+        areas.append((country_id, "country", f"Country {country}"))
+        hierarchy.append(("C0", country_id))
+
+        #england-sized first country, smaller devolved nations
+        for region in range(9 if country == 0 else 1):
+            region_id = f"R{country}{region}"
+            areas.append((region_id, "region", f"Region {country}-{region}"))
+            hierarchy.append((country_id, region_id))
+
+            metropolitan_id = None
+            if region % 3 == 0:
+                metropolitan_id = f"M{country}{region}"
+                areas.append((metropolitan_id, "metropolitan_county", f"Metropolitan County {country}-{region}"))
+                hierarchy.append((region_id, metropolitan_id))
+
+            for local_authority in range(35 if country == 0 else 30):
+                local_authority_id = f"L{country}{region}{local_authority:02d}"
+                areas.append((local_authority_id, "local_authority", f"Local Authority {country}-{region}-{local_authority}"))
+                parent_id = metropolitan_id if metropolitan_id and local_authority < 5 else region_id
+                hierarchy.append((parent_id, local_authority_id))
+
+    areas_df = pd.DataFrame(areas, columns=["area_id", "area_level", "area_name"])
+    hierarchies_df = pd.DataFrame(hierarchy, columns=["parent_area_id", "child_area_id"])
+
+    return areas_df, hierarchies_df
+
+def sample_links(rng, owner_ids, owner_col, values, value_col, max_links):
+    """
+    Links each owner to up to max_links distinct values, as in the funder_/recipient_ join tables.
+    """
+    counts = rng.integers(0, max_links + 1, size=len(owner_ids))
+    owners = np.repeat(owner_ids, counts)
+    linked = np.concatenate([rng.choice(values, size=count, replace=False) for count in counts]) if counts.sum() else np.array([], dtype=object)
+
+    return pd.DataFrame({owner_col: owners, value_col: linked})
+
+def sample_keywords(rng, keywords, max_keywords, count=None):
+    """
+    Picks keywords for one entity as a json list, as extracted_class is stored.
+    """
+    count = rng.integers(0, max_keywords + 1) if count is None else count
+    return json.dumps([keywords[i] for i in rng.choice(len(keywords), size=count, replace=False)])
+
+def make_synthetic_data(num_funders, grants_per_funder=10, keywords_per_user=5, num_pairs=200, dim=1024, seed=0, pool_size=4096):
+    """
+    Generates reference tables shaped like schema.sql at a given number of funders, builds the funders and grants dataframes
+    with the same code as the service, and samples user-funder pairs. Embeddings are row views into a shared random pool to keep memory down.
+    Returns the frames by name: funders, grants, areas, hierarchies, ukcat and pairs.
+    """
+    rng = np.random.default_rng(seed)
+    pool = rng.normal(size=(pool_size, dim)).astype(np.float32)
+    embedding = lambda: pool[rng.integers(pool_size)]
+    keywords, ukcat_df = make_keywords()
+    areas_df, hierarchies_df = make_areas()
+
+    #lookup tables
+    causes = pd.DataFrame({"cause_id": [f"CA{i}" for i in range(len(CAUSES))], "cause_name": CAUSES})
+    beneficiaries = pd.DataFrame({"ben_id": [f"BE{i}" for i in range(len(BENEFICIARIES))], "ben_name": BENEFICIARIES})
+    list_entries = pd.DataFrame({"list_id": np.arange(1, len(LIST_TYPES) + 1), "list_type": LIST_TYPES, "list_date": "2025-01-01", "list_info": None})
+
+    #funders
+    funder_ids = np.array([f"{1000000 + i}" for i in range(num_funders)], dtype=object)
+    funders = pd.DataFrame({
+        "registered_num": funder_ids,
+        "name": [f"FUNDER {i} TRUST" for i in range(num_funders)],
+        "is_potential_sbf": rng.random(num_funders) < 0.05,
+        "is_on_list": rng.random(num_funders) < 0.1,
+        "is_nua": rng.random(num_funders) < 0.2,
+        "concat_em": [embedding() for _ in range(num_funders)],
+        "extracted_class": [sample_keywords(rng, keywords, 8) for _ in range(num_funders)]
+    })
+    funder_list = funders.loc[funders["is_on_list"], ["registered_num"]].copy()
+    funder_list["list_id"] = rng.integers(1, len(LIST_TYPES) + 1, size=len(funder_list))
+
+    #recipients, reused across grants so relationships repeat
+    num_recipients = max(100, num_funders * 2)
+    recipient_ids = np.array([f"{2000000 + i}" for i in range(num_recipients)], dtype=object)
+    recipients = pd.DataFrame({
+        "recipient_id": recipient_ids,
+        "recipient_name": [f"RECIPIENT {i}" for i in range(num_recipients)],
+        "is_recipient": True,
+        "recipient_name_em": [embedding() for _ in range(num_recipients)],
+        "recipient_concat_em": [embedding() for _ in range(num_recipients)],
+        "recipient_extracted_class": [sample_keywords(rng, keywords, 6) for _ in range(num_recipients)]
+    })
+
+    #grants, with a skewed number per funder and a skewed choice of recipient
+    grant_counts = rng.poisson(grants_per_funder, size=num_funders) * (rng.random(num_funders) < 0.8)
+    num_grants = int(grant_counts.sum())
+    grant_ids = np.array([f"G{i}" for i in range(num_grants)], dtype=object)
+    has_text = rng.random(num_grants) < 0.7
+    grants = pd.DataFrame({
+        "grant_id": grant_ids,
+        "grant_title": np.where(has_text, "Grant for core costs", None),
+        "grant_desc": np.where(has_text & (rng.random(num_grants) < 0.5), "Towards running costs", None),
+        "amount": rng.integers(500, 100000, size=num_grants),
+        "year": rng.integers(2005, 2026, size=num_grants),
+        "source": "synthetic",
+        "grant_concat_em": [embedding() for _ in range(num_grants)]
+    })
+    funder_grants = pd.DataFrame({"registered_num": np.repeat(funder_ids, grant_counts), "grant_id": grant_ids})
+    recipient_grants = pd.DataFrame({"recipient_id": recipient_ids[rng.zipf(1.5, size=num_grants) % num_recipients], "grant_id": grant_ids})
+
+    tables = {
+        "funders": funders,
+        "causes": causes,
+        "areas": areas_df,
+        "beneficiaries": beneficiaries,
+        "grants": grants,
+        "funder_causes": sample_links(rng, funder_ids, "registered_num", causes["cause_id"].to_numpy(), "cause_id", 4),
+        "funder_areas": sample_links(rng, funder_ids, "registered_num", areas_df["area_id"].to_numpy(), "area_id", 5),
+        "funder_beneficiaries": sample_links(rng, funder_ids, "registered_num", beneficiaries["ben_id"].to_numpy(), "ben_id", 3),
+        "funder_grants": funder_grants,
+        "list_entries": list_entries,
+        "funder_list": funder_list,
+        "area_hierarchy": hierarchies_df,
+        "recipient_grants": recipient_grants,
+        "recipient_areas": sample_links(rng, recipient_ids, "recipient_id", areas_df["area_id"].to_numpy(), "area_id", 3),
+        "recipient_beneficiaries": sample_links(rng, recipient_ids, "recipient_id", beneficiaries["ben_id"].to_numpy(), "ben_id", 2),
+        "recipient_causes": sample_links(rng, recipient_ids, "recipient_id", causes["cause_id"].to_numpy(), "cause_id", 2)
+    }
+    funders_df = build_funders_df(tables)
+    grants_df = build_grants_df(tables, recipients)
+    pairs_df = make_pairs(rng, funders_df, grants_df, tables, recipients, keywords, keywords_per_user, num_pairs)
+
+    return {"funders": funders_df, "grants": grants_df, "areas": areas_df, "hierarchies": hierarchies_df, "ukcat": ukcat_df, "pairs": pairs_df}
+
+def make_pairs(rng, funders_df, grants_df, tables, recipients, keywords, keywords_per_user, num_pairs):
+    """
+    Samples recipients as users and pairs each with a funder, a third of them with a funder that has given to them before.
+    """
+    area_names = dict(zip(tables["areas"]["area_id"], tables["areas"]["area_name"]))
+    ben_names = dict(zip(tables["beneficiaries"]["ben_id"], tables["beneficiaries"]["ben_name"]))
+    cause_names = dict(zip(tables["causes"]["cause_id"], tables["causes"]["cause_name"]))
+    user_areas = tables["recipient_areas"].groupby("recipient_id")["area_id"].apply(lambda ids: [area_names[i] for i in ids]).to_dict()
+    user_bens = tables["recipient_beneficiaries"].groupby("recipient_id")["ben_id"].apply(lambda ids: [ben_names[i] for i in ids]).to_dict()
+    user_causes = tables["recipient_causes"].groupby("recipient_id")["cause_id"].apply(lambda ids: [cause_names[i] for i in ids]).to_dict()
+
+    funder_rows = funders_df.reset_index(drop=True)
+    funder_positions = {funder_num: i for i, funder_num in enumerate(funder_rows["registered_num"])}
+    pairs = []
+    for _ in range(num_pairs):
+        if len(grants_df) > 0 and rng.random() < 1 / 3:
+            grant = grants_df.iloc[rng.integers(len(grants_df))]
+            recipient = recipients.iloc[int(grant["recipient_id"]) - 2000000]
+            funder = funder_rows.iloc[funder_positions[grant["funder_num"]]]
+        else:
+            recipient = recipients.iloc[rng.integers(len(recipients))]
+            funder = funder_rows.iloc[rng.integers(len(funder_rows))]
+
+        pair = funder.to_dict()
+        pair["funder_registered_num"] = pair.pop("registered_num")
+        pair.update({
+            "user_id": recipient["recipient_id"],
+            "user_name": recipient["recipient_name"],
+            "user_areas": user_areas.get(recipient["recipient_id"], []),
+            "user_beneficiaries": user_bens.get(recipient["recipient_id"], []),
+            "user_causes": user_causes.get(recipient["recipient_id"], []),
+            "user_extracted_class": json.loads(sample_keywords(rng, keywords, keywords_per_user, count=keywords_per_user)),
+            "user_name_em": recipient["recipient_name_em"],
+            "user_concat_em": recipient["recipient_concat_em"]
+        })
+        pairs.append(pair)
+
+    return pd.DataFrame(pairs)
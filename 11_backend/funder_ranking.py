@@ -0,0 +1,210 @@
+import numpy as np
+import pandas as pd
+from backend_utils import cache_on_frames, get_area_index
+from grants_index import get_funder_grants_index
+from rp_engine import get_rp_engine
+from keyword_embeddings import normalise_rows
+from embedding_store import embedding_to_array
+from supabase_client import get_supabase_client
+from scoring_logic import score_pairs
+from score_cache import score_pairs_cached
+
+SHORTLIST_SIZE = 200
+USER_COLUMNS = ["user_id", "user_name", "user_areas", "user_beneficiaries", "user_causes", "user_extracted_class", "user_name_em", "user_concat_em"]
+
+#below this many funders the prefilter scans every vector, which is exact and fast enough: in benchmarks/run_benchmarks.py
+#(results/20261018T155250-9dee787b.json, 1024 dims) a scan takes 3.2ms p50 at 20k funders, under a tenth of scoring a
+#200-funder shortlist, but grows to 9.3ms at 50k and 18.4ms at 100k, where searching IVF lists takes 0.9ms and 1.2ms
+IVF_MIN_FUNDERS = 20000
+#lists probed per search, and the shortlist multiple to keep probing until there are enough candidates
+IVF_PROBES = 16
+IVF_CANDIDATE_FACTOR = 4
+
+class FunderVectorIndex:
+    """
+    In-memory index of the funders' normalised concat_em vectors for cheap similarity prefiltering.
+    From IVF_MIN_FUNDERS funders up, the vectors are split into about sqrt(n) lists by spherical k-means, and a search only scores the
+    centroids and the members of the nearest lists (an inverted file index, as pgvector's ivfflat), so it costs about O(sqrt(n)) rather than O(n).
+    Smaller tables, or num_lists=0, are scanned in full. The database prefilter (search_funders_supabase) uses the HNSW index instead.
+    """
+
+    def __init__(self, funders_df, num_lists=None, num_probes=IVF_PROBES, seed=0):
+        funder_nums = []
+        vectors = []
+        for funder_num, embedding in zip(funders_df["registered_num"], funders_df["concat_em"]):
+            vector = embedding_to_array(embedding)
+            if vector is not None:
+                funder_nums.append(funder_num)
+                vectors.append(vector)
+
+        self.funder_nums = np.array(funder_nums, dtype=object)
+        self.matrix = normalise_rows(np.stack(vectors)) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self.num_probes = num_probes
+        self.centroids = None
+
+        #split large tables into lists, stored contiguously by list
+        if num_lists is None:
+            num_lists = int(np.sqrt(len(self.funder_nums))) if len(self.funder_nums) >= IVF_MIN_FUNDERS else 0
+        if num_lists > 1 and len(self.funder_nums) > num_lists:
+            self.centroids, assignments = fit_spherical_kmeans(self.matrix, num_lists, seed)
+            order = np.argsort(assignments, kind="stable")
+            self.funder_nums = self.funder_nums[order]
+            self.matrix = np.ascontiguousarray(self.matrix[order])
+            self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=num_lists))])
+
+    def search(self, user_embedding, k):
+        """
+        Returns the k funders whose concat_em is most similar to the user's, with their similarities.
+        With lists, these are the most similar among the members of the nearest lists, probing more lists until there are IVF_CANDIDATE_FACTOR * k members.
+        """
+        if len(self.funder_nums) == 0:
+            return [], []
+
+        user_vector = normalise_rows(embedding_to_array(user_embedding).reshape(1, -1))[0]
+        if self.centroids is None:
+            positions = np.arange(len(self.funder_nums))
+            similarities = self.matrix @ user_vector
+        else:
+            positions, similarities = self.search_lists(user_vector, k)
+
+        #partition rather than sort all candidates
+        k = min(k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top], kind="stable")]
+
+        return list(self.funder_nums[positions[top]]), [float(similarities[i]) for i in top]
+
+    def search_lists(self, user_vector, k):
+        """
+        Scores the members of the lists nearest the user, returning their positions and similarities.
+        """
+        list_order = np.argsort(-(self.centroids @ user_vector), kind="stable")
+        positions = []
+        similarities = []
+        num_candidates = 0
+        for probe, list_num in enumerate(list_order):
+            if probe >= self.num_probes and num_candidates >= IVF_CANDIDATE_FACTOR * k:
+                break
+            start, end = self.list_offsets[list_num], self.list_offsets[list_num + 1]
+            positions.append(np.arange(start, end))
+            similarities.append(self.matrix[start:end] @ user_vector)
+            num_candidates += end - start
+
+        return np.concatenate(positions), np.concatenate(similarities)
+
+def fit_spherical_kmeans(matrix, num_lists, seed=0, iterations=10, sample_size=64):
+    """
+    Clusters normalised vectors by cosine similarity, fitting the centroids on a sample of up to sample_size vectors per list.
+    Returns the normalised centroids and every vector's list.
+    """
+    rng = np.random.default_rng(seed)
+    sample = matrix[rng.choice(len(matrix), min(len(matrix), num_lists * sample_size), replace=False)]
+    centroids = sample[rng.choice(len(sample), num_lists, replace=False)]
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        counts = np.bincount(assignments, minlength=num_lists)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        #sum each list's vectors, reseeding empty lists from random sample vectors
+        sums = np.zeros_like(centroids)
+        filled = np.flatnonzero(counts)
+        sums[filled] = np.add.reduceat(sample[np.argsort(assignments, kind="stable")], starts[filled])
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        centroids = normalise_rows(sums)
+
+    #assign every vector in chunks to bound memory
+    assignments = np.concatenate([np.argmax(matrix[i:i + 8192] @ centroids.T, axis=1) for i in range(0, len(matrix), 8192)])
+
+    return centroids, assignments
+
+@cache_on_frames
+def get_funder_vector_index(funders_df):
+    """
+    Gets the vector index for the loaded funders table.
+    """
+    return FunderVectorIndex(funders_df)
+
+@cache_on_frames
+def get_funder_positions(funders_df):
+    """
+    Maps each funder number to its row in the loaded funders table, keeping the first row of a repeated number.
+    """
+    funder_positions = {}
+    for position, funder_num in enumerate(funders_df["registered_num"]):
+        funder_positions.setdefault(funder_num, position)
+
+    return funder_positions
+
+def search_funders_supabase(url, key, user_embedding, k):
+    """
+    Runs the prefilter in the database using the match_funders function over the pgvector concat_em column.
+    """
+    supabase = get_supabase_client(url, key)
+    query_embedding = embedding_to_array(user_embedding).tolist()
+    response = supabase.rpc("match_funders", {"query_embedding": query_embedding, "match_count": k}).execute()
+
+    return [row["registered_num"] for row in response.data], [row["similarity"] for row in response.data]
+
+def build_user_pairs(user, funders_df):
+    """
+    Builds a pairs dataframe of one user against a set of funders.
+    """
+    pairs_df = funders_df.rename(columns={"registered_num": "funder_registered_num"}).reset_index(drop=True)
+
+    #repeat the user's profile on every row
+    for col in USER_COLUMNS:
+        pairs_df[col] = [user[col]] * len(pairs_df)
+
+    return pairs_df
+
+def rank_funders_for_user(user, funders_df, grants_df, areas_df, hierarchies_df, model, top_k=50, shortlist_size=SHORTLIST_SIZE, shortlist=None):
+    """
+    Ranks funders for one user: prefilters by text similarity, then runs the full scoring on the shortlist only.
+    The user is a dict (or row) with the user_ columns of a pairs dataframe; a precomputed shortlist of funder numbers and similarities can be passed in.
+    """
+    grants_index = get_funder_grants_index(grants_df)
+    rp_engine = get_rp_engine(grants_df)
+    area_index = get_area_index(areas_df, hierarchies_df)
+
+    return rank_funders(user, funders_df, grants_index, rp_engine, area_index, model, top_k=top_k, shortlist_size=shortlist_size, shortlist=shortlist)
+
+def rank_funders(user, funders_df, grants_index, rp_engine, area_index, model, top_k=50, shortlist_size=SHORTLIST_SIZE, shortlist=None, score_cache=None, generation=None,
+                 funder_positions=None, keyword_cache=None):
+    """
+    Ranks funders for one user against prepared funder data: a grants index and RP engine, or a compiled profile store for both.
+    With a score cache, only shortlisted funders not already scored for this user are scored, and new rows are cached under the data generation.
+    Candidates are looked up by row through funder_positions, built from funders_df if not passed in.
+    """
+
+    #decode the user's profile once
+    user = {col: user[col] for col in USER_COLUMNS}
+    user["user_name_em"] = embedding_to_array(user["user_name_em"])
+    user["user_concat_em"] = embedding_to_array(user["user_concat_em"])
+
+    #prefilter funders by similarity to the user's text
+    if shortlist is None:
+        shortlist = get_funder_vector_index(funders_df).search(user["user_concat_em"], shortlist_size)
+    shortlist_nums, shortlist_similarities = shortlist
+    prefilter_similarity = dict(zip(shortlist_nums, shortlist_similarities))
+
+    #always keep funders who have given to the user before
+    past_funders = grants_index.get_funders_of(user["user_id"])
+    candidate_nums = set(shortlist_nums) | set(past_funders)
+    funder_positions = get_funder_positions(funders_df) if funder_positions is None else funder_positions
+    candidates_df = funders_df.iloc[sorted(funder_positions[funder_num] for funder_num in candidate_nums if funder_num in funder_positions)]
+    if candidates_df.empty:
+        return pd.DataFrame(columns=["funder_registered_num", "name", "prefilter_similarity", "final_score"])
+
+    #score shortlist and rank
+    pairs_df = build_user_pairs(user, candidates_df)
+    if score_cache is not None:
+        scores_df = score_pairs_cached(pairs_df, grants_index, rp_engine, area_index, model, score_cache, generation=generation, keyword_cache=keyword_cache)
+    else:
+        scores_df = score_pairs(pairs_df, grants_index, rp_engine, area_index, model, keyword_cache=keyword_cache)
+    scores_df.insert(1, "name", pairs_df["name"])
+    scores_df.insert(2, "prefilter_similarity", scores_df["funder_registered_num"].map(prefilter_similarity))
+    ranked_df = scores_df.sort_values("final_score", ascending=False, kind="stable").head(top_k).reset_index(drop=True)
+
+    return ranked_df
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+from backend_utils import cache_on_frames
+
+def get_relationship_columns(grants_df):
+    """
+    Gets the grants columns a relationship is returned with: all but the embeddings.
+    """
+    return [col for col in grants_df.columns if not col.endswith("_em")]
+
+class FunderGrantsIndex:
+    """
+    Grants sorted by funder with each funder's row range, plus the rows and grant years of every funder-recipient relationship.
+    """
+
+    def __init__(self, grants_df):
+        #stable sort keeps each funder's grants in their original order
+        self.grants_df = grants_df.sort_values("funder_num", kind="stable")
+
+        #map each funder to the start and end of its block of rows
+        funder_nums = self.grants_df["funder_num"].to_numpy()
+        self.funder_ranges = {}
+        if len(funder_nums) > 0:
+            starts = np.flatnonzero(np.r_[True, funder_nums[1:] != funder_nums[:-1]])
+            stops = np.r_[starts[1:], len(funder_nums)]
+            for start, stop in zip(starts, stops):
+                if pd.notna(funder_nums[start]):
+                    self.funder_ranges[funder_nums[start]] = (int(start), int(stop))
+
+        self.grant_years = self.grants_df["year"].to_numpy()
+        self.relationship_columns = get_relationship_columns(self.grants_df)
+
+        #map each funder-recipient pair to its rows and each recipient to its funders
+        self.relationships = {}
+        self.recipient_funders = {}
+        for position, (funder_num, recipient_id) in enumerate(zip(funder_nums, self.grants_df["recipient_id"])):
+            self.relationships.setdefault((funder_num, recipient_id), []).append(position)
+            self.recipient_funders.setdefault(recipient_id, {})[funder_num] = None
+
+    def get_funder_grants(self, funder_num):
+        """
+        Returns a funder's grants, in the order they appear in the grants table.
+        """
+        start, stop = self.funder_ranges.get(funder_num, (0, 0))
+        return self.grants_df.iloc[start:stop]
+
+    def get_relationship(self, funder_num, recipient_id):
+        """
+        Returns the grants a funder has given to a recipient, without their embeddings.
+        """
+        rows = self.relationships.get((funder_num, recipient_id), [])
+        return self.grants_df.iloc[rows][self.relationship_columns].reset_index(drop=True)
+
+    def get_relationship_years(self, funder_num, recipient_id):
+        """
+        Returns the years of the grants a funder has given to a recipient.
+        """
+        return self.grant_years[self.relationships.get((funder_num, recipient_id), [])]
+
+    def get_funders_of(self, recipient_id):
+        """
+        Returns the funders that have given grants to a recipient.
+        """
+        return list(self.recipient_funders.get(recipient_id, {}))
+
+@cache_on_frames
+def get_funder_grants_index(grants_df):
+    """
+    Gets the grants index for the loaded grants table.
+    """
+    return FunderGrantsIndex(grants_df)
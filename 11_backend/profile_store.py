@@ -0,0 +1,359 @@
+import os
+import sys
+import json
+import time
+import shutil
+from collections import Counter
+import numpy as np
+import pandas as pd
+from backend_utils import get_area_index
+from embedding_store import EmbeddingStore
+from grants_index import get_funder_grants_index, get_relationship_columns
+from rp_engine import FunderRPMatrices, get_rp_engine
+from keyword_embeddings import DEFAULT_MODEL_NAME
+
+FORMAT_VERSION = 2
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "funder_profiles")
+FUNDER_FIELDS = ["registered_num", "name", "is_potential_sbf", "is_nua", "is_on_list", "list_entries", "areas", "beneficiaries", "causes", "extracted_class"]
+RP_KINDS = ["name", "recipient", "grant"]
+COUNT_KINDS = ["keyword", "area"]
+#separates recipient and funder in the sorted relationship keys
+KEY_SEPARATOR = "\x1f"
+
+def to_plain(value):
+    """
+    Converts numpy values and arrays to plain python so they can be written to json, keeping NaNs as they are.
+    """
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        return [to_plain(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is pd.NA:
+        return None
+    return value
+
+def as_labels(values):
+    """
+    Builds an object array of labels, as stack_by_label returns.
+    """
+    labels = np.empty(len(values), dtype=object)
+    labels[:] = values
+    return labels
+
+def parse_keywords(keywords):
+    """
+    Returns a funder's keywords as a list, parsing json strings.
+    """
+    if isinstance(keywords, str):
+        keywords = json.loads(keywords)
+    if isinstance(keywords, (list, np.ndarray)):
+        return [str(keyword) for keyword in keywords]
+    return []
+
+def pack_values(values):
+    """
+    Packs values as json into one utf-8 byte array, with offsets marking where each starts and ends, so any range of them
+    can be read from a memory map with a single json parse.
+    """
+    encoded = [(json.dumps(to_plain(value)) + ",").encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(item) for item in encoded])
+
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def unpack_values(data, offsets, start=0, stop=None):
+    """
+    Reads the packed values from start to stop.
+    """
+    stop = len(offsets) - 1 if stop is None else stop
+    text = bytes(data[offsets[start]:offsets[stop]]).decode("utf-8")
+
+    return json.loads("[" + text[:-1] + "]")
+
+def get_offsets(lengths):
+    """
+    Gets offsets marking where each of a run of blocks starts and ends.
+    """
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+
+    return offsets
+
+def concat_matrices(matrices, dim):
+    """
+    Stacks per-funder matrices into one, with offsets marking where each funder's rows start and end.
+    """
+    dims = {matrix.shape[1] for matrix in matrices if len(matrix) > 0}
+    if len(dims) > 1:
+        raise ValueError(f"Embeddings have different sizes: {sorted(dims)}")
+    dim = dims.pop() if dims else dim
+
+    offsets = np.zeros(len(matrices) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(matrix) for matrix in matrices])
+    non_empty = [matrix for matrix in matrices if len(matrix) > 0]
+    matrix = np.concatenate(non_empty).astype(np.float32) if non_empty else np.zeros((0, dim), dtype=np.float32)
+
+    return np.ascontiguousarray(matrix), offsets
+
+def compile_funder_profiles(funders_df, grants_df, areas_df, hierarchies_df, output_dir=DEFAULT_STORE_DIR, keyword_cache=None,
+                            model_name=DEFAULT_MODEL_NAME, version=None):
+    """
+    Compiles every funder's scoring features into a versioned folder of .npy arrays and a manifest, and points the LATEST file in output_dir at it.
+    Matrices are stored as they are; labels, counts, relationships and table columns as packed json with offset arrays. Funder keyword
+    embeddings are included if a keyword cache is given. Returns the path of the compiled version.
+    """
+    version = version or time.strftime("%Y%m%dT%H%M%S")
+    grants_index = get_funder_grants_index(grants_df)
+    rp_engine = get_rp_engine(grants_df)
+    relationship_columns = get_relationship_columns(grants_df)
+
+    #decode funder text embeddings into one matrix
+    funder_store = EmbeddingStore(funders_df, columns=["concat_em"])
+    arrays = {
+        "funder_concat_em": funder_store.matrices["concat_em"],
+        "funder_concat_present": funder_store.present["concat_em"]
+    }
+    dim = arrays["funder_concat_em"].shape[1]
+
+    #collect each funder's RP matrices, labels, counts and relationships
+    funder_nums = list(funders_df["registered_num"])
+    num_grants = []
+    num_unique_recipients = []
+    rp_matrices = {kind: [] for kind in RP_KINDS}
+    labels = {kind: [] for kind in RP_KINDS}
+    counts = {kind: [] for kind in COUNT_KINDS}
+    relationships = []
+    for row, funder_num in enumerate(funder_nums):
+        rp = rp_engine.get_funder(funder_num)
+        num_grants.append(rp.num_grants)
+        num_unique_recipients.append(int(rp.num_unique_recipients))
+        for kind in RP_KINDS:
+            rp_matrices[kind].append(getattr(rp, f"{kind}_matrix"))
+            labels[kind].extend(getattr(rp, f"{kind}_labels"))
+        counts["keyword"].append(list(rp.recipient_keyword_counts.items()))
+        counts["area"].append(list(rp.recipient_area_counts.items()))
+
+        #keep each relationship's grants for steps 4 and 16
+        funder_grants_df = grants_index.get_funder_grants(funder_num)
+        for recipient_id, year, grant in zip(funder_grants_df["recipient_id"], funder_grants_df["year"], funder_grants_df[relationship_columns].itertuples(index=False)):
+            if pd.notna(recipient_id):
+                relationships.append((f"{recipient_id}{KEY_SEPARATOR}{funder_num}", row, year, list(grant)))
+
+    arrays["num_grants"] = np.array(num_grants, dtype=np.int64)
+    arrays["num_unique_recipients"] = np.array(num_unique_recipients, dtype=np.int64)
+    for kind in RP_KINDS:
+        arrays[f"{kind}_matrix"], arrays[f"{kind}_offsets"] = concat_matrices(rp_matrices[kind], dim)
+        arrays[f"{kind}_labels"], arrays[f"{kind}_label_offsets"] = pack_values(labels[kind])
+    for kind in COUNT_KINDS:
+        items = [item for funder_counts in counts[kind] for item in funder_counts]
+        arrays[f"{kind}_count_keys"], arrays[f"{kind}_count_key_offsets"] = pack_values([key for key, _ in items])
+        arrays[f"{kind}_counts"] = np.array([count for _, count in items], dtype=np.int64)
+        arrays[f"{kind}_count_offsets"] = get_offsets([len(funder_counts) for funder_counts in counts[kind]])
+
+    #sort relationships by recipient then funder so they can be binary searched, keeping grant order within each
+    relationships.sort(key=lambda relationship: relationship[0])
+    year_dtype = grants_df["year"].dtype if grants_df["year"].dtype.kind in "iuf" else np.float64
+    arrays["relationship_keys"] = np.array([key for key, _, _, _ in relationships], dtype=str)
+    arrays["relationship_funder_rows"] = np.array([row for _, row, _, _ in relationships], dtype=np.int64)
+    arrays["relationship_years"] = np.array(pd.to_numeric(pd.Series([year for _, _, year, _ in relationships], dtype=object), errors="coerce"), dtype=year_dtype)
+    arrays["relationship_grants"], arrays["relationship_grant_offsets"] = pack_values([grant for _, _, _, grant in relationships])
+
+    #store the tables the service rebuilds as packed columns
+    tables = {"funders": funders_df[FUNDER_FIELDS], "areas": areas_df, "hierarchies": hierarchies_df}
+    for table_name, df in tables.items():
+        for col in df.columns:
+            arrays[f"{table_name}_{col}"], arrays[f"{table_name}_{col}_offsets"] = pack_values(df[col])
+
+    #embed every funder keyword so the service does not have to
+    keywords = []
+    if keyword_cache is not None:
+        keywords = list(dict.fromkeys(keyword for funder_keywords in funders_df["extracted_class"] for keyword in parse_keywords(funder_keywords)))
+        keyword_cache.precompute(keywords)
+        arrays["keyword_matrix"] = np.ascontiguousarray(keyword_cache.encode(keywords), dtype=np.float32) if keywords else np.zeros((0, dim), dtype=np.float32)
+    arrays["keywords"], arrays["keyword_offsets"] = pack_values(keywords)
+
+    #write to a temporary folder and move it into place once complete
+    os.makedirs(output_dir, exist_ok=True)
+    version_dir = os.path.join(output_dir, f"profiles-{version}")
+    build_dir = version_dir + ".building"
+    if os.path.exists(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(build_dir, f"{name}.npy"), array)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "model_name": model_name,
+        "embedding_dim": dim,
+        "num_funders": len(funder_nums),
+        "num_grants": len(grants_df),
+        "has_keywords": keyword_cache is not None,
+        "tables": {table_name: list(df.columns) for table_name, df in tables.items()},
+        "relationship_columns": relationship_columns,
+        "relationship_dtypes": {col: str(grants_df[col].dtype) for col in relationship_columns},
+        "arrays": {name: {"file": f"{name}.npy", "dtype": str(array.dtype), "shape": list(array.shape)} for name, array in arrays.items()}
+    }
+    with open(os.path.join(build_dir, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(version_dir):
+        shutil.rmtree(version_dir)
+    os.rename(build_dir, version_dir)
+
+    #swap the pointer atomically so readers never see a half-written version
+    latest_tmp = os.path.join(output_dir, "LATEST.tmp")
+    with open(latest_tmp, "w") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(latest_tmp, os.path.join(output_dir, "LATEST"))
+
+    return version_dir
+
+class FunderProfileStore:
+    """
+    A compiled funder profile store opened read-only, with every array memory-mapped so worker processes share their pages.
+    Only the funders, areas and hierarchies tables are parsed on open; each funder's labels and counts are read when it is first scored.
+    Stands in for both the grants index and the RP engine when scoring.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json")) as f:
+            self.manifest = json.load(f)
+        if self.manifest["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Profile store format {self.manifest['format_version']} is not supported (expected {FORMAT_VERSION})")
+
+        #map the arrays rather than reading them
+        self.arrays = {name: np.load(os.path.join(path, info["file"]), mmap_mode="r") for name, info in self.manifest["arrays"].items()}
+        self.areas_df = self.read_table("areas")
+        self.hierarchies_df = self.read_table("hierarchies")
+        self.area_index = get_area_index(self.areas_df, self.hierarchies_df)
+
+        #rebuild the funders table with row views into the text embedding matrix
+        self.funders_df = self.read_table("funders")
+        concat_em = np.empty(len(self.funders_df), dtype=object)
+        for row in np.flatnonzero(self.arrays["funder_concat_present"]):
+            concat_em[row] = self.arrays["funder_concat_em"][row]
+        self.funders_df["concat_em"] = concat_em
+
+        #index funders, keeping the first row for repeated numbers
+        self.funder_nums = list(self.funders_df["registered_num"])
+        self.funder_rows = {}
+        for row, funder_num in enumerate(self.funder_nums):
+            self.funder_rows.setdefault(funder_num, row)
+        self.funders = {}
+
+    def read_table(self, table_name):
+        """
+        Rebuilds a table stored as packed columns.
+        """
+        columns = self.manifest["tables"][table_name]
+        data = {col: unpack_values(self.arrays[f"{table_name}_{col}"], self.arrays[f"{table_name}_{col}_offsets"]) for col in columns}
+
+        return pd.DataFrame(data, columns=columns)
+
+    def read_counts(self, kind, row):
+        """
+        Reads a funder's recipient keyword or area counts, in order of first appearance.
+        """
+        start, stop = self.arrays[f"{kind}_count_offsets"][row:row + 2]
+        keys = unpack_values(self.arrays[f"{kind}_count_keys"], self.arrays[f"{kind}_count_key_offsets"], start, stop)
+
+        return Counter(dict(zip(keys, self.arrays[f"{kind}_counts"][start:stop].tolist())))
+
+    def get_funder(self, funder_num, funder_grants_df=None):
+        """
+        Gets a funder's RP matrices as views into the store, as RPEngine.get_funder does.
+        """
+        if funder_num not in self.funders:
+            row = self.funder_rows.get(funder_num)
+            if row is None:
+                empty = (as_labels([]), np.zeros((0, self.manifest["embedding_dim"]), dtype=np.float32))
+                self.funders[funder_num] = FunderRPMatrices.from_parts(0, 0, Counter(), Counter(), {kind: empty for kind in RP_KINDS})
+            else:
+                stacked = {}
+                for kind in RP_KINDS:
+                    start, stop = self.arrays[f"{kind}_offsets"][row:row + 2]
+                    labels = unpack_values(self.arrays[f"{kind}_labels"], self.arrays[f"{kind}_label_offsets"], start, stop)
+                    stacked[kind] = (as_labels(labels), self.arrays[f"{kind}_matrix"][start:stop])
+                self.funders[funder_num] = FunderRPMatrices.from_parts(
+                    int(self.arrays["num_grants"][row]), int(self.arrays["num_unique_recipients"][row]),
+                    self.read_counts("keyword", row), self.read_counts("area", row), stacked
+                )
+
+        return self.funders[funder_num]
+
+    def find_relationship(self, funder_num, recipient_id):
+        """
+        Returns the start and end of a funder-recipient relationship's grants in the sorted relationship arrays.
+        """
+        key = f"{recipient_id}{KEY_SEPARATOR}{funder_num}"
+        keys = self.arrays["relationship_keys"]
+
+        return int(np.searchsorted(keys, key, side="left")), int(np.searchsorted(keys, key, side="right"))
+
+    def get_relationship(self, funder_num, recipient_id):
+        """
+        Returns the grants a funder has given to a recipient, without their embeddings, as FunderGrantsIndex.get_relationship does.
+        """
+        start, stop = self.find_relationship(funder_num, recipient_id)
+        grants = unpack_values(self.arrays["relationship_grants"], self.arrays["relationship_grant_offsets"], start, stop)
+
+        return pd.DataFrame(grants, columns=self.manifest["relationship_columns"]).astype(self.manifest["relationship_dtypes"])
+
+    def get_relationship_years(self, funder_num, recipient_id):
+        """
+        Returns the years of the grants a funder has given to a recipient.
+        """
+        start, stop = self.find_relationship(funder_num, recipient_id)
+        return np.array(self.arrays["relationship_years"][start:stop])
+
+    def get_funders_of(self, recipient_id):
+        """
+        Returns the funders that have given grants to a recipient.
+        """
+        keys = self.arrays["relationship_keys"]
+        start = np.searchsorted(keys, f"{recipient_id}{KEY_SEPARATOR}", side="left")
+        stop = np.searchsorted(keys, f"{recipient_id}{KEY_SEPARATOR}\U0010ffff", side="left")
+        rows = dict.fromkeys(self.arrays["relationship_funder_rows"][start:stop].tolist())
+
+        return [self.funder_nums[row] for row in rows]
+
+    def load_keywords(self, keyword_cache):
+        """
+        Puts the compiled funder keyword embeddings into a keyword cache for the same model.
+        """
+        if "keyword_matrix" in self.arrays and keyword_cache.model_name == self.manifest["model_name"]:
+            keyword_cache.add(unpack_values(self.arrays["keywords"], self.arrays["keyword_offsets"]), self.arrays["keyword_matrix"])
+
+def open_profile_store(path=DEFAULT_STORE_DIR):
+    """
+    Opens a compiled profile store, following the LATEST pointer if given the output folder rather than a version.
+    """
+    latest_path = os.path.join(path, "LATEST")
+    if os.path.exists(latest_path):
+        with open(latest_path) as f:
+            path = os.path.join(path, f.read().strip())
+
+    return FunderProfileStore(path)
+
+if __name__ == "__main__":
+    #compile from the reference tables chosen by SCORE_DATA_DIR or Supabase
+    from reference_data import get_reference_data_source
+    from embedding_store import decode_embedding_columns
+    from keyword_embeddings import get_keyword_cache
+    from model_runtime import load_model
+
+    frames = get_reference_data_source().load()
+    grants_df, _ = decode_embedding_columns(frames["grants"])
+    keyword_cache = get_keyword_cache(load_model(DEFAULT_MODEL_NAME, warm_up=False))
+    output_dir = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_STORE_DIR
+
+    version_dir = compile_funder_profiles(frames["funders"], grants_df, frames["areas"], frames["hierarchies"], output_dir,
+                                          keyword_cache=keyword_cache, model_name=keyword_cache.model_name)
+    print(f"Compiled funder profiles to {version_dir}")
@@ -0,0 +1,99 @@
+import os
+import sys
+import pandas as pd
+
+#add project root to path for shared modules
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+from utils import build_relationship_cols, load_tables
+
+REFERENCE_TABLES = ["funders", "grants", "areas", "hierarchies"]
+
+class LocalDataSource:
+    """
+    Loads prepared reference tables from pickle files named like the 10.1 checkpoints, e.g. for tests against local fixtures.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def load(self):
+        return {name: pd.read_pickle(os.path.join(self.folder, f"{name}_df.pkl")) for name in REFERENCE_TABLES}
+
+class SupabaseDataSource:
+    """
+    Loads the reference tables from Supabase and builds the funders and grants dataframes as in 10.2.
+    """
+
+    def __init__(self, url, key):
+        self.url = url
+        self.key = key
+
+    def load(self):
+        #fetch every table at once over the shared client
+        tables = load_tables(self.url, self.key, [
+            "funders", "causes", "areas", "beneficiaries", "grants", "funder_causes", "funder_areas",
+            "funder_beneficiaries", "funder_grants", "list_entries", "funder_list", "area_hierarchy",
+            "recipient_grants", "recipient_areas", "recipient_beneficiaries", "recipient_causes",
+            {"table": "recipients", "batch_size": 50, "filter_recipients": True}
+        ])
+        recipients = tables["recipients"]
+
+        return {
+            "funders": build_funders_df(tables),
+            "grants": build_grants_df(tables, recipients),
+            "areas": tables["areas"],
+            "hierarchies": tables["area_hierarchy"]
+        }
+
+def build_funders_df(tables):
+    """
+    Adds causes, areas, beneficiaries and list entries to the funders table.
+    """
+    funder_rels = [
+        {"join_table": tables["funder_causes"], "lookup_table": tables["causes"], "key": "cause_id", "value_col": "cause_name", "result_col": "causes"},
+        {"join_table": tables["funder_areas"], "lookup_table": tables["areas"], "key": "area_id", "value_col": "area_name", "result_col": "areas"},
+        {"join_table": tables["funder_beneficiaries"], "lookup_table": tables["beneficiaries"], "key": "ben_id", "value_col": "ben_name", "result_col": "beneficiaries"}
+    ]
+    funders_df = build_relationship_cols(tables["funders"], "registered_num", funder_rels)
+
+    #get list of entries for each funder
+    list_with_info = tables["funder_list"].merge(tables["list_entries"], on="list_id")
+    list_grouped = list_with_info.groupby("registered_num")["list_type"].apply(list).reset_index()
+    list_grouped.columns = ["registered_num", "list_entries"]
+    funders_df = funders_df.merge(list_grouped, on="registered_num", how="left")
+    funders_df["list_entries"] = funders_df["list_entries"].apply(lambda x: x if isinstance(x, list) else [])
+
+    return funders_df
+
+def build_grants_df(tables, recipients):
+    """
+    Adds funder and recipient details to the grants table.
+    """
+    grants_df = tables["grants"].merge(tables["funder_grants"], on="grant_id")
+    grants_df = grants_df.merge(tables["funders"][["registered_num", "name"]], on="registered_num")
+    grants_df = grants_df.rename(columns={"name": "funder_name", "registered_num": "funder_num"})
+
+    #add recipient info
+    grants_df = grants_df.merge(tables["recipient_grants"], on="grant_id")
+    grants_df = grants_df.merge(recipients[["recipient_id", "recipient_name", "recipient_name_em", "recipient_concat_em", "recipient_extracted_class"]],
+                                on="recipient_id", how="left")
+    recipient_rels = [
+        {"join_table": tables["recipient_areas"], "lookup_table": tables["areas"], "key": "area_id", "value_col": "area_name", "result_col": "recipient_areas"}
+    ]
+    grants_df = build_relationship_cols(grants_df, "recipient_id", recipient_rels)
+
+    return grants_df
+
+def get_reference_data_source():
+    """
+    Chooses where to load the reference tables from: local pickles if SCORE_DATA_DIR is set, otherwise Supabase.
+    """
+    data_dir = os.getenv("SCORE_DATA_DIR")
+    if data_dir:
+        return LocalDataSource(data_dir)
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    return SupabaseDataSource(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
@@ -0,0 +1,208 @@
+import json
+from collections import Counter
+import numpy as np
+from backend_utils import cache_on_frames
+from grants_index import get_funder_grants_index
+from keyword_embeddings import normalise_rows
+from embedding_store import embedding_to_array
+
+def stack_by_label(labels, embeddings):
+    """
+    Stacks embeddings into a normalised matrix with one row per label, keeping the last embedding for repeated labels.
+    """
+
+    #keep first position and last value per label, as building a dict from the columns would
+    latest = {}
+    for label, embedding in zip(labels, embeddings):
+        latest[label] = embedding
+
+    #drop rows without embeddings
+    rows = [(label, embedding_to_array(embedding)) for label, embedding in latest.items()]
+    rows = [(label, embedding) for label, embedding in rows if embedding is not None]
+    if len(rows) == 0:
+        return np.array([], dtype=object), np.zeros((0, 0), dtype=np.float32)
+
+    stacked_labels = np.empty(len(rows), dtype=object)
+    stacked_labels[:] = [label for label, _ in rows]
+    matrix = normalise_rows(np.stack([embedding for _, embedding in rows]))
+
+    return stacked_labels, np.ascontiguousarray(matrix, dtype=np.float32)
+
+def count_recipient_keywords(keyword_lists):
+    """
+    Counts recipient keywords across a funder's grants, parsing any json lists.
+    """
+    counts = Counter()
+    for recipient_keywords in keyword_lists:
+        if isinstance(recipient_keywords, str):
+            recipient_keywords = json.loads(recipient_keywords)
+        if recipient_keywords:
+            counts.update(recipient_keywords)
+
+    return counts
+
+def count_recipient_areas(area_lists):
+    """
+    Counts recipient areas across a funder's grants, in order of first appearance.
+    """
+    counts = Counter()
+    for areas_list in area_lists:
+        if isinstance(areas_list, list):
+            counts.update(areas_list)
+
+    return counts
+
+class FunderAreaProfile:
+    """
+    A funder's recipient areas resolved against the area index: grant counts per area id with granularity,
+    and the first recipient area covering or within any other area.
+    """
+
+    def __init__(self, area_name_counts, area_index):
+        self.area_index = area_index
+        self.num_areas = sum(area_name_counts.values())
+
+        #resolve names to ids, keeping order of first appearance
+        self.area_ids = []
+        self.area_counts = {}
+        for area_name, count in area_name_counts.items():
+            area_id = area_index.get_id(area_name)
+            if area_id is None:
+                continue
+            if area_id not in self.area_counts:
+                self.area_ids.append(area_id)
+                self.area_counts[area_id] = 0
+            self.area_counts[area_id] += count
+        self.area_id_set = frozenset(self.area_ids)
+
+        #expand through the hierarchy once, keeping the first recipient area for each
+        self.covering_area = {}
+        self.contained_area = {}
+        for area_id in self.area_ids:
+            for descendant in area_index.descendants.get(area_id, ()):
+                self.covering_area.setdefault(descendant, area_id)
+            for ancestor in area_index.ancestors.get(area_id, ()):
+                self.contained_area.setdefault(ancestor, area_id)
+
+        #get low level areas by number of grants, with granularity attached
+        low_level = [(area_id, area_index.get_weight(area_id), self.area_counts[area_id]) for area_id in self.area_ids if area_id]
+        low_level = [(area_id, weight, count) for area_id, weight, count in low_level if weight >= 0.9]
+        self.low_level_areas = sorted(low_level, key=lambda x: x[2], reverse=True)
+        self.total_low_level = sum(count for _, _, count in self.low_level_areas)
+
+class FunderRPMatrices:
+    """
+    Precomputed revealed-preference data for a funder: normalised embedding matrices of its previous recipients and grants,
+    and counts of its recipients' keywords and areas.
+    """
+
+    def __init__(self, funder_grants_df):
+        self.num_grants = len(funder_grants_df)
+        self.num_unique_recipients = funder_grants_df["recipient_name"].nunique()
+        self.recipient_keyword_counts = count_recipient_keywords(funder_grants_df["recipient_extracted_class"])
+        self.recipient_area_counts = count_recipient_areas(funder_grants_df["recipient_areas"])
+        self.area_profile = None
+
+        recipient_names = funder_grants_df["recipient_name"]
+        self.name_labels, self.name_matrix = stack_by_label(recipient_names, funder_grants_df["recipient_name_em"])
+        self.recipient_labels, self.recipient_matrix = stack_by_label(recipient_names, funder_grants_df["recipient_concat_em"])
+
+        #only use grants with a title or description
+        non_empty_grants = funder_grants_df[
+            (funder_grants_df["grant_title"].notna() & (funder_grants_df["grant_title"] != "")) |
+            (funder_grants_df["grant_desc"].notna() & (funder_grants_df["grant_desc"] != ""))
+        ]
+        self.grant_labels, self.grant_matrix = stack_by_label(non_empty_grants["recipient_name"], non_empty_grants["grant_concat_em"])
+
+    @classmethod
+    def from_parts(cls, num_grants, num_unique_recipients, recipient_keyword_counts, recipient_area_counts, stacked):
+        """
+        Rebuilds a funder's matrices from precomputed parts, e.g. views into a compiled profile store.
+        Stacked maps "name", "recipient" and "grant" to their labels and matrix.
+        """
+        rp_matrices = cls.__new__(cls)
+        rp_matrices.num_grants = num_grants
+        rp_matrices.num_unique_recipients = num_unique_recipients
+        rp_matrices.recipient_keyword_counts = recipient_keyword_counts
+        rp_matrices.recipient_area_counts = recipient_area_counts
+        rp_matrices.area_profile = None
+        rp_matrices.name_labels, rp_matrices.name_matrix = stacked["name"]
+        rp_matrices.recipient_labels, rp_matrices.recipient_matrix = stacked["recipient"]
+        rp_matrices.grant_labels, rp_matrices.grant_matrix = stacked["grant"]
+
+        return rp_matrices
+
+    def get_area_profile(self, area_index):
+        """
+        Gets the funder's recipient-area profile for an area index, building it on first use.
+        """
+        if self.area_profile is None or self.area_profile.area_index is not area_index:
+            self.area_profile = FunderAreaProfile(self.recipient_area_counts, area_index)
+
+        return self.area_profile
+
+class RPEngine:
+    """
+    Builds and keeps the revealed-preference matrices for each funder in a grants table.
+    """
+
+    def __init__(self, grants_df):
+        self.grants_df = grants_df
+        self.funders = {}
+
+    def get_funder(self, funder_num, funder_grants_df=None):
+        """
+        Gets a funder's matrices, building them on first use.
+        """
+        if funder_num not in self.funders:
+            if funder_grants_df is None:
+                funder_grants_df = get_funder_grants_index(self.grants_df).get_funder_grants(funder_num)
+            self.funders[funder_num] = FunderRPMatrices(funder_grants_df)
+
+        return self.funders[funder_num]
+
+    def build_all(self):
+        """
+        Builds every funder's data up front, e.g. at data-prep time or service start.
+        """
+        grants_index = get_funder_grants_index(self.grants_df)
+        for funder_num in grants_index.funder_ranges:
+            self.get_funder(funder_num, grants_index.get_funder_grants(funder_num))
+
+        return self
+
+@cache_on_frames
+def get_rp_engine(grants_df):
+    """
+    Gets the RP engine for the loaded grants table.
+    """
+    return RPEngine(grants_df)
+
+def top_k_similarity(labels, matrix, user_embedding, exclude_label, k=10):
+    """
+    Scores the user against every row with one matrix-vector product and returns the average and matches of the top k.
+    """
+    if len(labels) == 0:
+        return 0.0, []
+
+    #compare every row to the user, skipping the user's own entry
+    user_vector = normalise_rows(embedding_to_array(user_embedding).reshape(1, -1))[0]
+    candidates = np.flatnonzero(labels != exclude_label)
+    if len(candidates) == 0:
+        return 0.0, []
+    similarities = np.clip(matrix[candidates] @ user_vector, 0.0, None).astype(np.float64)
+
+    #get top k without sorting every row, taking the earliest rows on ties as a stable sort would
+    if len(similarities) > k:
+        kth_similarity = -np.partition(-similarities, k - 1)[k - 1]
+        above = np.flatnonzero(similarities > kth_similarity)
+        tied = np.flatnonzero(similarities == kth_similarity)[:k - len(above)]
+        top = np.concatenate([above, tied])
+    else:
+        top = np.arange(len(similarities))
+    top = top[np.lexsort((top, -similarities[top]))]
+
+    score = float(similarities[top].sum() / len(top))
+    matches = [(labels[candidates[i]], float(similarities[i])) for i in top]
+
+    return score, matches
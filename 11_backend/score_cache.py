@@ -0,0 +1,168 @@
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from embedding_store import embedding_to_array
+from scoring_logic import score_pairs, get_score_columns
+
+PROFILE_FIELDS = ["user_id", "user_name", "user_areas", "user_beneficiaries", "user_causes", "user_extracted_class"]
+EMBEDDING_FIELDS = ["user_name_em", "user_concat_em"]
+
+def as_string_list(values):
+    """
+    Returns a list field as a list of strings, parsing json strings and treating missing values as empty.
+    """
+    if isinstance(values, str):
+        values = json.loads(values) if values.lstrip().startswith("[") else [values]
+    if values is None or (isinstance(values, float) and np.isnan(values)):
+        return []
+    return [str(value) for value in values]
+
+def hash_user_profile(user):
+    """
+    Hashes everything scoring reads from a user: id, name, areas, beneficiaries, causes, keywords and the embeddings.
+    List order is kept, as the reasoning follows it.
+    """
+    normalised = {
+        "user_id": str(user["user_id"]),
+        "user_name": str(user["user_name"]),
+        "user_areas": as_string_list(user["user_areas"]),
+        "user_beneficiaries": as_string_list(user["user_beneficiaries"]),
+        "user_causes": as_string_list(user["user_causes"]),
+        "user_extracted_class": [keyword.upper() for keyword in as_string_list(user["user_extracted_class"])]
+    }
+    digest = hashlib.sha256(json.dumps(normalised, sort_keys=True).encode("utf-8"))
+
+    #hash embeddings by their float32 bytes
+    for field in EMBEDDING_FIELDS:
+        embedding = embedding_to_array(user[field])
+        digest.update(b"\0" if embedding is None else embedding.tobytes())
+
+    return digest.hexdigest()
+
+class ScoreCache:
+    """
+    LRU cache of scored rows keyed by funder and user profile hash, with a time to live and per-funder invalidation.
+    Invalidating with a data generation also stops rows scored from older generations of the reference data being cached afterwards.
+    """
+
+    def __init__(self, max_size=10000, ttl=3600, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.funder_keys = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+
+    def get(self, funder_num, profile_key, explain=False):
+        """
+        Returns a cached row, or None if it is missing, expired or lacks the reasoning asked for.
+        """
+        key = (str(funder_num), profile_key)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                expires_at, has_reasoning, row = entry
+                if expires_at <= self.clock():
+                    self._remove(key)
+                elif has_reasoning or not explain:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return row
+            self.misses += 1
+            return None
+
+    def put(self, funder_num, profile_key, row, explain=False, generation=None):
+        """
+        Caches a scored row, evicting the least recently used rows over the size limit.
+        Rows scored from a data generation older than the last invalidation are dropped.
+        """
+        key = (str(funder_num), profile_key)
+        with self.lock:
+            if generation is not None and generation < self.generation:
+                return
+            self.entries[key] = (self.clock() + self.ttl, explain, row)
+            self.entries.move_to_end(key)
+            self.funder_keys.setdefault(key[0], set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate_funders(self, funder_nums, generation=None):
+        """
+        Evicts every cached row for the given funders, e.g. after their grants, details or list entries change.
+        Returns the number of rows evicted.
+        """
+        evicted = 0
+        with self.lock:
+            self._set_generation(generation)
+            for funder_num in funder_nums:
+                for key in list(self.funder_keys.get(str(funder_num), ())):
+                    self._remove(key)
+                    evicted += 1
+
+        return evicted
+
+    def clear(self, generation=None):
+        """
+        Evicts every cached row.
+        """
+        with self.lock:
+            self._set_generation(generation)
+            self.entries.clear()
+            self.funder_keys.clear()
+
+    def stats(self):
+        """
+        Returns the size and hit counts of the cache.
+        """
+        with self.lock:
+            return {"size": len(self.entries), "max_size": self.max_size, "ttl": self.ttl, "hits": self.hits, "misses": self.misses, "generation": self.generation}
+
+    def _set_generation(self, generation):
+        if generation is not None:
+            self.generation = max(self.generation, generation)
+
+    def _remove(self, key):
+        self.entries.pop(key, None)
+        funder_keys = self.funder_keys.get(key[0])
+        if funder_keys is not None:
+            funder_keys.discard(key)
+            if not funder_keys:
+                del self.funder_keys[key[0]]
+
+def score_pairs_cached(pairs_df, grants_index, rp_engine, area_index, model, score_cache, explain=False, generation=None, keyword_cache=None):
+    """
+    Scores a pairs dataframe as score_pairs does, reusing cached rows and scoring only the pairs not in the cache.
+    The generation is that of the reference data being scored, so rows from data that has since been reloaded are not cached.
+    """
+    pairs = pairs_df.to_dict("records")
+
+    #hash each distinct user once
+    profile_keys = {}
+    rows = [None] * len(pairs)
+    keys = [None] * len(pairs)
+    missing = []
+    for position, pair in enumerate(pairs):
+        user_ids = tuple(id(pair[field]) for field in PROFILE_FIELDS + EMBEDDING_FIELDS)
+        if user_ids not in profile_keys:
+            profile_keys[user_ids] = hash_user_profile(pair)
+        keys[position] = profile_keys[user_ids]
+
+        rows[position] = score_cache.get(pair["funder_registered_num"], keys[position], explain)
+        if rows[position] is None:
+            missing.append(position)
+
+    #score the rest in one batch and cache them
+    if missing:
+        scores_df = score_pairs(pairs_df.iloc[missing], grants_index, rp_engine, area_index, model, explain=explain, keyword_cache=keyword_cache)
+        for position, row in zip(missing, scores_df.to_dict("records")):
+            score_cache.put(row["funder_registered_num"], keys[position], row, explain, generation)
+            rows[position] = row
+
+    return pd.DataFrame(rows, index=pairs_df.index, columns=get_score_columns(explain))
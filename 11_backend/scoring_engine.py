@@ -0,0 +1,134 @@
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+#add backend and project root to path
+backend_dir = os.path.abspath(os.path.dirname(__file__))
+project_root = os.path.abspath(os.path.join(backend_dir, '..'))
+for path in [project_root, backend_dir]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+import reference_scoring
+from scoring_logic import calculate_alignment_scores_batch, get_batch_keywords, BATCH_SCORE_COLUMNS
+from keyword_embeddings import KeywordEmbeddingCache, DEFAULT_MODEL_NAME
+
+BACKENDS = ("reference", "numpy")
+PARITY_COLUMNS = BATCH_SCORE_COLUMNS + ["final_score"]
+
+#checkpointed pairs the harness runs over by default, as (name, checkpoint folder, pairs file)
+PARITY_SETS = [
+    ("logic", os.path.join(project_root, "10_scoring_logic", "10.1_checkpoints"), "pairs_df.pkl"),
+    ("evaluation", os.path.join(project_root, "13_evaluation", "13.1_checkpoints"), "eval_final_df.pkl")
+]
+
+class PrecomputedKeywordModel:
+    """
+    Serves keyword embeddings encoded once in a single batch, so both backends compare the same vectors.
+    A real model's batched and one-at-a-time encodes differ in the last float32 digits, which would otherwise show up as mismatches.
+    """
+
+    def __init__(self, model, keywords):
+        keywords = list(dict.fromkeys(str(keyword) for keyword in keywords))
+        embeddings = np.asarray(model.encode(keywords), dtype=np.float32).reshape(len(keywords), -1) if keywords else []
+        self.embeddings = dict(zip(keywords, embeddings))
+        self.cache_name = getattr(model, "cache_name", DEFAULT_MODEL_NAME)
+
+    def encode(self, texts):
+        if isinstance(texts, str):
+            return self.embeddings[texts]
+
+        return np.stack([self.embeddings[str(text)] for text in texts])
+
+def score_pairs(pairs_df, grants_df, areas_df, hierarchies_df, model, backend="numpy", explain=False):
+    """
+    Scores every pair in a pairs dataframe with either backend, returning the component scores and final score (plus reasoning with explain).
+    The reference backend runs the original pandas steps pair by pair. The numpy backend runs the steps that need a funder's grants, areas or keywords
+    pair by pair on stacked funder matrices, and the beneficiaries, causes, text similarity and multiplier steps column-wise over the batch.
+    """
+    if backend == "reference":
+        return reference_scoring.score_pairs(pairs_df, grants_df, areas_df, hierarchies_df, model, explain=explain)
+    if backend == "numpy":
+        return calculate_alignment_scores_batch(pairs_df, grants_df, areas_df, hierarchies_df, model, explain=explain)
+
+    raise ValueError(f"Unknown scoring backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+def compare_backends(pairs_df, grants_df, areas_df, hierarchies_df, model, tolerance=1e-6):
+    """
+    Scores the pairs with both backends and returns one row per differing value: float scores may differ by up to the tolerance, everything else must match exactly.
+    Each step has its own implementation in each backend, so every step is compared. Both backends get the same keyword embeddings,
+    encoded once up front and never read from the on-disk keyword cache, so what is left to differ is float32 rounding (around 1e-7).
+    """
+    keyword_model = PrecomputedKeywordModel(model, get_batch_keywords(pairs_df))
+    keyword_cache = KeywordEmbeddingCache(keyword_model, model_name=keyword_model.cache_name, cache_path=None)
+    reference_df = reference_scoring.score_pairs(pairs_df, grants_df, areas_df, hierarchies_df, keyword_model)
+    numpy_df = calculate_alignment_scores_batch(pairs_df, grants_df, areas_df, hierarchies_df, keyword_model, keyword_cache=keyword_cache)
+
+    mismatches = []
+    for col in PARITY_COLUMNS:
+        reference_values = reference_df[col].to_numpy()
+        numpy_values = numpy_df[col].to_numpy()
+        if col in ("existing_relationship", "num_grants", "has_grants_data"):
+            differs = reference_values.astype(np.int64) != numpy_values.astype(np.int64)
+        else:
+            reference_values = reference_values.astype(np.float64)
+            numpy_values = numpy_values.astype(np.float64)
+            differs = ~np.isclose(reference_values, numpy_values, rtol=0, atol=tolerance, equal_nan=True)
+
+        for position in np.flatnonzero(differs):
+            mismatches.append({
+                "index": pairs_df.index[position],
+                "funder_registered_num": reference_df["funder_registered_num"].iloc[position],
+                "user_id": reference_df["user_id"].iloc[position],
+                "column": col,
+                "reference": reference_values[position],
+                "numpy": numpy_values[position]
+            })
+
+    return pd.DataFrame(mismatches, columns=["index", "funder_registered_num", "user_id", "column", "reference", "numpy"])
+
+def assert_backend_parity(pairs_df, grants_df, areas_df, hierarchies_df, model, tolerance=1e-6):
+    """
+    Raises an AssertionError listing the differing values if the backends disagree on any pair.
+    """
+    mismatches = compare_backends(pairs_df, grants_df, areas_df, hierarchies_df, model, tolerance=tolerance)
+    if len(mismatches):
+        raise AssertionError(f"Scoring backends differ on {mismatches['index'].nunique()} of {len(pairs_df)} pairs:\n{mismatches.head(20).to_string()}")
+
+def load_parity_set(checkpoint_folder, pairs_file):
+    """
+    Loads a checkpointed pairs dataframe with the grants, areas and hierarchies saved alongside it.
+    """
+    frames = [pd.read_pickle(os.path.join(checkpoint_folder, name)) for name in [pairs_file, "grants_df.pkl", "areas_df.pkl", "hierarchies_df.pkl"]]
+    pairs_df, grants_df, areas_df, hierarchies_df = frames
+
+    return pairs_df.reset_index(drop=True), grants_df, areas_df, hierarchies_df
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the reference and numpy scoring backends agree on the logic and evaluation pairs.")
+    parser.add_argument("--tolerance", type=float, default=1e-6)
+    args = parser.parse_args()
+
+    from model_runtime import load_model
+    model = load_model(warm_up=False)
+
+    failed = False
+    for name, checkpoint_folder, pairs_file in PARITY_SETS:
+        if not os.path.exists(os.path.join(checkpoint_folder, pairs_file)):
+            print(f"Skipping {name} pairs: no {pairs_file} in {checkpoint_folder}")
+            continue
+
+        pairs_df, grants_df, areas_df, hierarchies_df = load_parity_set(checkpoint_folder, pairs_file)
+        mismatches = compare_backends(pairs_df, grants_df, areas_df, hierarchies_df, model, tolerance=args.tolerance)
+        if len(mismatches):
+            failed = True
+            print(f"{name}: backends differ on {mismatches['index'].nunique()} of {len(pairs_df)} pairs")
+            print(mismatches.head(20).to_string())
+        else:
+            print(f"{name}: backends agree on all {len(pairs_df)} pairs")
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,34 @@
-from backend_utils import get_name_from_id, get_id_from_name, get_granularity_weight, check_if_parent, calculate_similarity_score
+from backend_utils import get_area_index, calculate_similarity_score
+from rp_engine import get_rp_engine, top_k_similarity
+from embedding_store import embedding_to_array
+from grants_index import get_funder_grants_index
+from keyword_embeddings import get_keyword_cache
+from ukcat_registry import get_ukcat_registry, as_ukcat_registry
+from step_timing import start_pair_timer, start_batch_timer
 import pandas as pd
+import numpy as np
 import json
+from itertools import chain
 from datetime import datetime
 
-def check_existing_relationship(grants_df, funder_num, user_num):
+def check_existing_relationship(grants_index, funder_num, user_num, explain=True):
     """
-    Checks if funder has ever given a grant to the user.
+    Checks if funder has ever given a grant to the user. The grants themselves are only returned with explain.
     """
-    relationship = grants_df[
-        (grants_df["funder_num"] == funder_num) &
-        (grants_df["recipient_id"] == user_num)
-    ]
-
-    num_grants = len(relationship)
+    num_grants = len(grants_index.get_relationship_years(funder_num, user_num))
     existing_relationship = num_grants > 0
+    relationship = grants_index.get_relationship(funder_num, user_num) if explain else None
 
     return existing_relationship, num_grants, relationship
 
-def check_areas(funder_list, user_list, areas_df, hierarchies_df):
+def check_areas(funder_list, user_list, area_index, explain=True):
     """
     Calculates a score based on matches between the funder's and user's stated areas.
     """
 
     #convert names to ids
-    funder_ids = [get_id_from_name(name, areas_df) for name in funder_list if get_id_from_name(name, areas_df) is not None]
-    user_ids = [get_id_from_name(name, areas_df) for name in user_list if get_id_from_name(name, areas_df) is not None]
+    funder_ids = [area_id for area_id in (area_index.get_id(name) for name in funder_list) if area_id is not None]
+    user_ids = [area_id for area_id in (area_index.get_id(name) for name in user_list) if area_id is not None]
     
     #avoid zero division
     if len(user_ids) == 0:
@@ -36,46 +40,44 @@ def check_areas(funder_list, user_list, areas_df, hierarchies_df):
     reasoning = []
     
     for user_area in user_ids:
-        user_area_name = get_name_from_id(user_area, areas_df)
+        user_area_name = area_index.get_name(user_area)
         
         #check for exact match
         if user_area in funder_set:
-            score = get_granularity_weight(user_area, areas_df) * 1.0
+            score = area_index.get_weight(user_area) * 1.0
             scores.append(score)
-            reasoning.append(f"Exact match: {user_area_name}")
+            if explain:
+                reasoning.append(f"Exact match: {user_area_name}")
         
         #check if user area is within funder area
         else:
-            hierarchy_user_in_funder = None
-            for funder_area in funder_ids:
-                if check_if_parent(funder_area, user_area, hierarchies_df):
-                    hierarchy_user_in_funder = funder_area
-                    break
+            user_ancestors = area_index.ancestors.get(user_area, ())
+            hierarchy_user_in_funder = next((funder_area for funder_area in funder_ids if funder_area in user_ancestors), None)
             
             if hierarchy_user_in_funder:
-                parent_name = get_name_from_id(hierarchy_user_in_funder, areas_df)
-                score = get_granularity_weight(hierarchy_user_in_funder, areas_df) * 0.6
+                score = area_index.get_weight(hierarchy_user_in_funder) * 0.6
                 scores.append(score)
-                reasoning.append(f"Hierarchical match: {user_area_name} (user) within {parent_name} (funder)")
+                if explain:
+                    parent_name = area_index.get_name(hierarchy_user_in_funder)
+                    reasoning.append(f"Hierarchical match: {user_area_name} (user) within {parent_name} (funder)")
             
             #check if funder area is within user area
             else:
-                hierarchy_funder_in_user = None
-                for funder_area in funder_ids:
-                    if check_if_parent(user_area, funder_area, hierarchies_df):
-                        hierarchy_funder_in_user = funder_area
-                        break
+                user_descendants = area_index.descendants.get(user_area, ())
+                hierarchy_funder_in_user = next((funder_area for funder_area in funder_ids if funder_area in user_descendants), None)
                 
                 if hierarchy_funder_in_user:
-                    child_name = get_name_from_id(hierarchy_funder_in_user, areas_df)
-                    score = get_granularity_weight(user_area, areas_df) * 0.4
+                    score = area_index.get_weight(user_area) * 0.4
                     scores.append(score)
-                    reasoning.append(f"Hierarchical match: {child_name} (funder) within {user_area_name} (user)")
+                    if explain:
+                        child_name = area_index.get_name(hierarchy_funder_in_user)
+                        reasoning.append(f"Hierarchical match: {child_name} (funder) within {user_area_name} (user)")
                 
                 #no match
                 else:
                     scores.append(0.0)
-                    reasoning.append(f"No match: {user_area_name}")
+                    if explain:
+                        reasoning.append(f"No match: {user_area_name}")
     
     matched_scores = [s for s in scores if s > 0]
     if len(matched_scores) > 0:
@@ -83,16 +85,22 @@ def check_areas(funder_list, user_list, areas_df, hierarchies_df):
     else:
         score = 0.0
     
-    return max(0.0, score), reasoning
+    return max(0.0, score), reasoning if explain else None
+
+#beneficiary and cause categories that do not count as matches
+HIGH_LEVEL_BENEFICIARIES = {"Other Defined Groups", "The General Public/mankind"}
+EXCLUDED_BENEFICIARIES = {"Other Charities Or Voluntary Bodies"}
+GCP = "General Charitable Purposes"
+EXCLUDED_CAUSES = {"Other Charitable Purposes"}
 
-def check_beneficiaries(funder_list, user_list):
+def check_beneficiaries(funder_list, user_list, explain=True):
     """
     Calculates a score based on matches between the funder's and user's stated beneficiaries.
     """
 
     #define categories and filter
-    high_level_bens = {"Other Defined Groups", "The General Public/mankind"}
-    exclude_bens = {"Other Charities Or Voluntary Bodies"}
+    high_level_bens = HIGH_LEVEL_BENEFICIARIES
+    exclude_bens = EXCLUDED_BENEFICIARIES
     funder_bens = [ben for ben in funder_list if ben not in exclude_bens]
     user_bens = [ben for ben in user_list if ben not in exclude_bens]
     
@@ -109,13 +117,16 @@ def check_beneficiaries(funder_list, user_list):
     for user_ben in user_bens:
         if user_ben in funder_specific:
             scores.append(1.0)
-            reasoning.append(f"Exact match: {user_ben}")
+            if explain:
+                reasoning.append(f"Exact match: {user_ben}")
         elif has_high_level:
             scores.append(0.2)
-            reasoning.append(f"Weak match: user states '{user_ben}' and funder supports broad categories")
+            if explain:
+                reasoning.append(f"Weak match: user states '{user_ben}' and funder supports broad categories")
         else:
             scores.append(0.0)
-            reasoning.append(f"No match: {user_ben}")
+            if explain:
+                reasoning.append(f"No match: {user_ben}")
     
     matched_scores = [s for s in scores if s > 0]
     if len(matched_scores) > 0:
@@ -123,15 +134,15 @@ def check_beneficiaries(funder_list, user_list):
     else:
         score = 0.0
 
-    return max(0.0, score), reasoning
+    return max(0.0, score), reasoning if explain else None
 
-def check_causes(funder_list, user_list):
+def check_causes(funder_list, user_list, explain=True):
     """
     Calculates a score based on matches between the funder's and user's stated causes.
     """
     #define categories and filter
-    gcp = "General Charitable Purposes"
-    exclude_causes = {"Other Charitable Purposes"}
+    gcp = GCP
+    exclude_causes = EXCLUDED_CAUSES
     funder_causes = [cause for cause in funder_list if cause not in exclude_causes]
     user_causes = [cause for cause in user_list if cause not in exclude_causes]
     
@@ -149,10 +160,12 @@ def check_causes(funder_list, user_list):
     for user_cause in user_causes:
         if user_cause in funder_specific:
             scores.append(1.0)
-            reasoning.append(f"Exact match: {user_cause}")
+            if explain:
+                reasoning.append(f"Exact match: {user_cause}")
         else:
             scores.append(0.0)
-            reasoning.append(f"No match: {user_cause}")
+            if explain:
+                reasoning.append(f"No match: {user_cause}")
     
     matched_scores = [s for s in scores if s > 0]
     if len(matched_scores) > 0:
@@ -160,9 +173,9 @@ def check_causes(funder_list, user_list):
     else:
         score = 0.0
     
-    return max(0.0, score), reasoning, has_gcp
+    return max(0.0, score), reasoning if explain else None, has_gcp
 
-def check_keywords(funder_keywords, user_keywords, model):
+def check_keywords(funder_keywords, user_keywords, model, keyword_cache=None, explain=True):
     """
     Calculates semantic similarity between funder (extracted) and user (inputted) keywords.
     """
@@ -182,176 +195,104 @@ def check_keywords(funder_keywords, user_keywords, model):
     if len(funder_keywords) == 0 or len(user_keywords) == 0:
         return 0.0, {}, ["No keywords to compare"], False
     
-    #create embeddings for each keyword
-    funder_keywords_em = {}
-    for keyword in funder_keywords:
-        embedding = model.encode(keyword)
-        funder_keywords_em[keyword] = embedding
-
-    user_keywords_em = {}
-    for keyword in user_keywords:
-        embedding = model.encode(keyword)
-        user_keywords_em[keyword] = embedding
+    #get unique keywords in order and embed them all in one batch
+    funder_keywords = list(dict.fromkeys(funder_keywords))
+    user_keywords = list(dict.fromkeys(user_keywords))
+    keyword_cache = keyword_cache or get_keyword_cache(model)
+    embeddings = keyword_cache.encode(funder_keywords + user_keywords)
+    funder_keywords_em = embeddings[:len(funder_keywords)]
+    user_keywords_em = embeddings[len(funder_keywords):]
 
     #compare every funder keyword to every user keyword
-    all_scores = []
-    for funder_kw, funder_em in funder_keywords_em.items():
-        for user_kw, user_em in user_keywords_em.items():
-            similarity = calculate_similarity_score(funder_em, user_em)
-            all_scores.append({
-                "funder_keyword": funder_kw,
-                "user_keyword": user_kw,
-                "similarity": similarity
-            })
+    all_scores = np.clip(funder_keywords_em @ user_keywords_em.T, 0.0, None).astype(np.float64).ravel()
+    num_user = len(user_keywords)
     
     #sort and check for bonus (matches >= 0.9)
-    all_scores.sort(key=lambda x: x["similarity"], reverse=True)
-    gets_bonus = any(match["similarity"] >= 0.90 for match in all_scores)
+    order = np.argsort(-all_scores, kind="stable")
+    is_strong = all_scores[order] >= 0.90
+    gets_bonus = bool(is_strong.any())
     
     #get dictionary of matches >= 0.90
     strong_matches = {}
-    for match in all_scores:
-        if match["similarity"] >= 0.90:
-            key = f"{match['funder_keyword']} & {match['user_keyword']}"
-            strong_matches[key] = match["similarity"]
+    for i in order[is_strong]:
+        key = f"{funder_keywords[i // num_user]} & {user_keywords[i % num_user]}"
+        strong_matches[key] = float(all_scores[i])
     
     #filter to top 10 matches <= 0.90 and get average
-    scores_under_80 = [match for match in all_scores if match["similarity"] < 0.90]
+    scores_under_80 = order[~is_strong]
     top_10 = scores_under_80[:10]
 
     if len(top_10) > 0:
-        score = sum(match["similarity"] for match in top_10) / len(top_10)
+        score = float(all_scores[top_10].sum() / len(top_10))
     else:
         score = 0.0
     
     #build reasoning from medium matches
-    reasoning = []
-    for match in scores_under_80[:9]:
-        reasoning.append(f"'{match['funder_keyword']}' & '{match['user_keyword']}': {match['similarity']:.3f}")
+    reasoning = None
+    if explain:
+        reasoning = []
+        for i in scores_under_80[:9]:
+            reasoning.append(f"'{funder_keywords[i // num_user]}' & '{user_keywords[i % num_user]}': {all_scores[i]:.3f}")
     
     return max(0.0, score), strong_matches, reasoning, gets_bonus
 
-def check_name_rp(recipients_embedding_dict, user_embedding, user_name):
+def check_name_rp(rp_matrices, user_embedding, user_name, explain=True):
     """
     Calculates semantic similarity between the user's name and the names of the funder's previous recipients.
     """
 
-    #handle empty/nan
-    score = 0.0
-    reasoning = []
-
-    #compare every recipient name to the user's name
-    all_scores = []
-    for recipient_name, recipient_embedding in recipients_embedding_dict.items():
-        if recipient_name != user_name:
-            similarity = calculate_similarity_score(recipient_embedding, user_embedding)
-            all_scores.append({
-                "recipient_name": recipient_name,
-                "similarity": similarity
-            })
-
-    #sort and calculate average of top 10
-    all_scores.sort(key=lambda x: x["similarity"], reverse=True)
-    top_10 = all_scores[:10]
-    if len(top_10) > 0:
-        score = sum(match["similarity"] for match in top_10) / len(top_10)
-    else:
-        score = 0.0
+    #compare every recipient name to the user's name and get average of top 10
+    score, top_10 = top_k_similarity(rp_matrices.name_labels, rp_matrices.name_matrix, user_embedding, user_name)
 
     #build reasoning from top 10 matches
-    reasoning = []
-    for match in top_10:
-        reasoning.append(f"{match['recipient_name']}: {match['similarity']:.3f}")
+    reasoning = [f"{recipient_name}: {similarity:.3f}" for recipient_name, similarity in top_10] if explain else None
 
     return max(0.0, score), reasoning
 
-def check_grants_rp(grants_embedding_dict, user_embedding, user_name):
+def check_grants_rp(rp_matrices, user_embedding, user_name, explain=True):
     """
     Calculates semantic similarity between the user's text sections and the funder's previous grants.
     """
 
-    #handle empty/nan
-    score = 0.0
-    reasoning = []
-
-    #compare every grant to the user's text
-    all_scores = []
-    for grant_recipient_name, grant_embedding in grants_embedding_dict.items():
-        if grant_recipient_name != user_name:
-            similarity = calculate_similarity_score(grant_embedding, user_embedding)
-            all_scores.append({
-                "grant_recipient_name": grant_recipient_name,
-                "similarity": similarity
-            })
-
-    #sort and calculate average of top 10
-    all_scores.sort(key=lambda x: x["similarity"], reverse=True)
-    top_10 = all_scores[:10]
-    if len(top_10) > 0:
-        score = sum(match["similarity"] for match in top_10) / len(top_10)
-    else:
-        score = 0.0
+    #compare every grant to the user's text and get average of top 10
+    score, top_10 = top_k_similarity(rp_matrices.grant_labels, rp_matrices.grant_matrix, user_embedding, user_name)
 
     #build reasoning from top 10 matches
-    reasoning = []
-    for match in top_10:
-        reasoning.append(f"{match['grant_recipient_name']}: {match['similarity']:.3f}")
+    reasoning = [f"{grant_recipient_name}: {similarity:.3f}" for grant_recipient_name, similarity in top_10] if explain else None
 
     return max(0.0, score), reasoning
 
-def check_recipients_rp(recipients_embedding_dict, user_embedding, user_name):
+def check_recipients_rp(rp_matrices, user_embedding, user_name, explain=True):
     """
     Calculates semantic similarity between the user's text sections and those of the funder's previous recipients.
     """
 
-    #handle empty/nan
-    score = 0.0
-    reasoning = []
-
-    #compare every recipient's text to the user's text
-    all_scores = []
-    for recipient_name, recipient_embedding in recipients_embedding_dict.items():
-        if recipient_name != user_name:
-            similarity = calculate_similarity_score(recipient_embedding, user_embedding)
-            all_scores.append({
-                "grant_recipient_name": recipient_name,
-                "similarity": similarity
-            })
-
-    #sort and calculate average of top 10
-    all_scores.sort(key=lambda x: x["similarity"], reverse=True)
-    top_10 = all_scores[:10]
-    if len(top_10) > 0:
-        score = sum(match["similarity"] for match in top_10) / len(top_10)
-    else:
-        score = 0.0
+    #compare every recipient's text to the user's text and get average of top 10
+    score, top_10 = top_k_similarity(rp_matrices.recipient_labels, rp_matrices.recipient_matrix, user_embedding, user_name)
 
     #build reasoning from top 10 matches
-    reasoning = []
-    for match in top_10:
-        reasoning.append(f"{match['grant_recipient_name']}: {match['similarity']:.3f}")
+    reasoning = [f"{grant_recipient_name}: {similarity:.3f}" for grant_recipient_name, similarity in top_10] if explain else None
 
     return max(0.0, score), reasoning
 
-def calculate_keywords_bonus(strong_matches, ukcat_df):
+#weights of strong keyword matches by ukcat level, for tags found in ukcat
+KEYWORD_LEVEL_WEIGHTS = {1: 0.4, 2: 0.8, 3: 1.0}
+
+def calculate_keywords_bonus(strong_matches, ukcat):
     """
     Calculates bonus based on keyword matches. Only runs if keywords with semantic scores above 0.8 exist.
     """
 
     #weight by specificity of ukcat level
-    level_weights = {
-        1: 0.4, 
-        2: 0.8, 
-        3: 1.0
-    }
+    level_weights = KEYWORD_LEVEL_WEIGHTS
     
     weighted_scores = []
+    ukcat_registry = as_ukcat_registry(ukcat)
     for keyword, score in strong_matches.items():
-        #find keyword in ukcat_df
-        match = ukcat_df[ukcat_df["tag"].str.upper() == keyword.upper()]
+        #find keyword in ukcat tags
+        level = ukcat_registry.get_level(keyword)
         
-        if not match.empty:
-            level = match.iloc[0]["level"]
+        if level is not None:
             weighted_score = score * level_weights.get(level, 1.0)
         else:
             weighted_score = score * 0.4
@@ -366,13 +307,14 @@ def calculate_keywords_bonus(strong_matches, ukcat_df):
     
     return bonus
 
-def calculate_relationship_bonus(relationship_df):
+def calculate_relationship_bonus(grant_years):
     """
-    Calculates time since last grant and calculates a bonus. Only runs if there is a relationship.
+    Calculates time since last grant and calculates a bonus from the years of the funder's grants to the user. Only runs if there is a relationship.
     """
 
     #get time lapsed since last gift
-    last_grant_year = relationship_df["year"].max()
+    known_years = [year for year in grant_years if pd.notna(year)]
+    last_grant_year = max(known_years) if known_years else np.nan
     current_year = datetime.now().year
     time_lapsed = current_year - last_grant_year
     
@@ -389,65 +331,65 @@ def calculate_relationship_bonus(relationship_df):
         bonus = 1.1
     
     #add uplift for recurring relationship
-    num_grants = len(relationship_df)
+    num_grants = len(grant_years)
     if num_grants >= 5:
         bonus += 0.1
     
     return time_lapsed, bonus, last_grant_year
 
-def calculate_areas_bonus_rp(funder_grants_df, user_areas, areas_df, hierarchies_df):
+def calculate_areas_bonus_rp(rp_matrices, user_areas, area_index, explain=True):
     """
-    Calculates a bonus based on how well the user's areas match the funder's recipient's areas.
+    Calculates a bonus based on how well the user's areas match the funder's recipient's areas, using the funder's precomputed area profile.
     """
 
-    if funder_grants_df.empty:
+    if rp_matrices.num_grants == 0:
         return 1.0, ["No grants history available"]
 
-    #get unique areas from recipients
-    all_areas = []
-    for areas_list in funder_grants_df["recipient_areas"]:
-        if isinstance(areas_list, list):
-            all_areas.extend(areas_list)
+    #get recipient areas
+    area_profile = rp_matrices.get_area_profile(area_index)
 
-    if len(all_areas) == 0:
+    if area_profile.num_areas == 0:
         return 1.0, ["No area data available"]
 
-    recipient_areas = list(set(all_areas))
+    #check areas as check_areas does, with recipient areas as the funder's
+    user_ids = [area_id for area_id in (area_index.get_id(name) for name in user_areas) if area_id is not None]
+    scores = []
+    for user_area in user_ids:
+        if user_area in area_profile.area_id_set:
+            scores.append(area_index.get_weight(user_area) * 1.0)
+        elif user_area in area_profile.covering_area:
+            scores.append(area_index.get_weight(area_profile.covering_area[user_area]) * 0.6)
+        elif user_area in area_profile.contained_area:
+            scores.append(area_index.get_weight(user_area) * 0.4)
+        else:
+            scores.append(0.0)
 
-    #check areas
-    match_score, _ = check_areas(recipient_areas, user_areas, areas_df, hierarchies_df)
+    matched_scores = [s for s in scores if s > 0]
+    match_score = max(0.0, sum(matched_scores) / len(matched_scores)) if matched_scores else 0.0
 
     #convert to bonus multiplier
     bonus = 1.0 + (match_score * 0.2)
 
+    if not explain:
+        return bonus, None
+
     #get reasoning from top 10 (low level tiers only)
-    area_count = {}
-    for area_name in all_areas:
-        area_id = get_id_from_name(area_name, areas_df)
-        if area_id:
-            granularity = get_granularity_weight(area_id, areas_df)
-            if granularity >= 0.9:
-                area_count[area_name] = area_count.get(area_name, 0) + 1
-
-    if len(area_count) == 0:
+    if len(area_profile.low_level_areas) == 0:
         reasoning = ["Only broad geographic areas found"]
     else:
-        sorted_areas = sorted(area_count.items(), key=lambda x: x[1], reverse=True)
-        total_low_level = sum(area_count.values())
-
         reasoning = []
-        for area_name, count in sorted_areas[:10]:
-            percentage = (count / total_low_level) * 100
-            reasoning.append(f"{area_name}: {count} grants ({percentage:.1f}%)")
+        for area_id, _, count in area_profile.low_level_areas[:10]:
+            percentage = (count / area_profile.total_low_level) * 100
+            reasoning.append(f"{area_index.get_name(area_id)}: {count} grants ({percentage:.1f}%)")
 
     return bonus, reasoning
 
-def calculate_keywords_bonus_rp(funder_grants_df, user_keywords):
+def calculate_keywords_bonus_rp(rp_matrices, user_keywords, explain=True):
     """
-    Calculates a bonus based on exact keyword matches between user and funder's recipients.
+    Calculates a bonus based on exact keyword matches between user and funder's recipients, using the funder's precomputed keyword counts.
     """
 
-    if funder_grants_df.empty:
+    if rp_matrices.num_grants == 0:
         return 1.0, ["No grants history available"]
 
     #parse json
@@ -460,14 +402,9 @@ def calculate_keywords_bonus_rp(funder_grants_df, user_keywords):
         return 1.0, ["No user keywords to match"]
 
     #get all recipient keywords
-    all_recipient_keywords = []
-    for recipient_keywords in funder_grants_df["recipient_extracted_class"]:
-        if isinstance(recipient_keywords, str):
-            recipient_keywords = json.loads(recipient_keywords)
-        if recipient_keywords:
-            all_recipient_keywords.extend(recipient_keywords)
-
-    if len(all_recipient_keywords) == 0:
+    recipient_keyword_counts = rp_matrices.recipient_keyword_counts
+
+    if len(recipient_keyword_counts) == 0:
         return 1.0, ["No recipient keywords available"]
 
     #find exact matches and count frequency
@@ -475,9 +412,9 @@ def calculate_keywords_bonus_rp(funder_grants_df, user_keywords):
     user_keywords_matched = set()
 
     for user_kw in user_keywords:
-        if user_kw in all_recipient_keywords:
+        if user_kw in recipient_keyword_counts:
             user_keywords_matched.add(user_kw)
-            matched_keywords[user_kw] = matched_keywords.get(user_kw, 0) + all_recipient_keywords.count(user_kw)
+            matched_keywords[user_kw] = matched_keywords.get(user_kw, 0) + recipient_keyword_counts[user_kw]
 
     #calculate match percentage
     match_percentage = len(user_keywords_matched) / len(user_keywords)
@@ -490,6 +427,9 @@ def calculate_keywords_bonus_rp(funder_grants_df, user_keywords):
     else:
         bonus = 1.0 + (match_percentage * 0.2)
 
+    if not explain:
+        return bonus, None
+
     #build reasoning from top 10
     if len(matched_keywords) == 0:
         reasoning = ["No exact keyword matches found"]
@@ -502,17 +442,17 @@ def calculate_keywords_bonus_rp(funder_grants_df, user_keywords):
 
     return bonus, reasoning
 
-def calculate_lv_penalty(funder_grants_df):
+def calculate_lv_penalty(rp_matrices):
     """
     Identifies low variance in a funder's previous giving and calculates a penalty.
     """
 
     #skip funders with low giving history
-    if len(funder_grants_df) < 10:
+    if rp_matrices.num_grants < 10:
         return 1.0
 
-    total_grants = len(funder_grants_df)
-    unique_recipients = funder_grants_df['recipient_name'].nunique()
+    total_grants = rp_matrices.num_grants
+    unique_recipients = rp_matrices.num_unique_recipients
     
     #find proportion of grants to unique recipients
     variance_proportion = unique_recipients / total_grants
@@ -525,123 +465,321 @@ def calculate_lv_penalty(funder_grants_df):
     
     return penalty
 
-def get_scores_and_reasonings(pairs_df, idx, grants_df, areas_df, hierarchies_df, model):
+def flatten_lists(lists):
+    """
+    Flattens a column of lists into the row of each item and the items themselves.
+    """
+    lengths = np.fromiter((len(values) for values in lists), dtype=np.int64, count=len(lists))
+    items = np.array(list(chain.from_iterable(lists)), dtype=object)
+
+    return np.repeat(np.arange(len(lists)), lengths), items
+
+def count_category_matches(funder_lists, user_lists, exclude, broad):
+    """
+    Counts, for every pair at once, the user's categories (less any excluded) and how many of them the funder states specifically, i.e. not as a broad category.
+    Also returns whether each funder states any broad category.
+    """
+    funder_rows, funder_items = flatten_lists(funder_lists)
+    user_rows, user_items = flatten_lists(user_lists)
+
+    #drop excluded categories and split off broad ones
+    kept = ~np.isin(funder_items, list(exclude))
+    is_broad = np.isin(funder_items, list(broad))
+    user_kept = ~np.isin(user_items, list(exclude))
+
+    #code each category, then key each item by pair and category so exact matches are one membership test
+    codes, categories = pd.factorize(np.concatenate([funder_items, user_items]))
+    num_categories = max(len(categories), 1)
+    funder_keys = funder_rows * num_categories + codes[:len(funder_items)]
+    user_keys = user_rows * num_categories + codes[len(funder_items):]
+    is_exact = np.isin(user_keys[user_kept], funder_keys[kept & ~is_broad])
+
+    num_pairs = len(user_lists)
+    num_user = np.bincount(user_rows[user_kept], minlength=num_pairs)
+    num_exact = np.bincount(user_rows[user_kept], weights=is_exact, minlength=num_pairs)
+    has_broad = np.bincount(funder_rows[kept & is_broad], minlength=num_pairs) > 0
+
+    return num_user, num_exact, has_broad
+
+def score_beneficiaries_column(funder_lists, user_lists):
+    """
+    Calculates check_beneficiaries' score for every pair at once.
+    """
+    num_user, num_exact, has_high_level = count_category_matches(funder_lists, user_lists, EXCLUDED_BENEFICIARIES, HIGH_LEVEL_BENEFICIARIES)
+
+    #with broad categories every user beneficiary matches, exactly (1.0) or weakly (0.2), else only exact matches count
+    weak_scores = (num_exact + 0.2 * (num_user - num_exact)) / np.maximum(num_user, 1)
+    scores = np.where(has_high_level, weak_scores, (num_exact > 0).astype(np.float64))
+
+    return np.where(num_user > 0, scores, 0.0)
+
+def score_causes_column(funder_lists, user_lists):
+    """
+    Calculates check_causes' score and gcp flag for every pair at once.
+    """
+    num_user, num_exact, has_gcp = count_category_matches(funder_lists, user_lists, EXCLUDED_CAUSES, {GCP})
+
+    #only exact matches count, so the average of matched scores is 1.0 if there are any
+    scores = (num_exact > 0).astype(np.float64)
+
+    return scores, has_gcp & (num_user > 0)
+
+def score_text_similarity_column(funder_embeddings, user_embeddings):
+    """
+    Calculates calculate_similarity_score for every pair at once from stacked embeddings.
+    """
+    funder_matrix = np.stack(funder_embeddings).astype(np.float32, copy=False)
+    user_matrix = np.stack(user_embeddings).astype(np.float32, copy=False)
+
+    #clamp norms as cosine_similarity does
+    dots = np.einsum("ij,ij->i", funder_matrix, user_matrix).astype(np.float64)
+    norms = np.maximum(np.linalg.norm(funder_matrix, axis=1).astype(np.float64), 1e-12) * np.maximum(np.linalg.norm(user_matrix, axis=1).astype(np.float64), 1e-12)
+
+    return np.maximum(dots / norms, 0.0)
+
+def calculate_keywords_bonus_column(strong_matches_list, ukcat):
+    """
+    Calculates calculate_keywords_bonus for every pair at once, with 1.0 for pairs without strong keyword matches.
+    """
+    rows = np.repeat(np.arange(len(strong_matches_list)), [len(strong_matches) for strong_matches in strong_matches_list])
+    keywords = pd.Series([keyword for strong_matches in strong_matches_list for keyword in strong_matches], dtype=object).astype(str).str.upper()
+    scores = np.fromiter((score for strong_matches in strong_matches_list for score in strong_matches.values()), dtype=np.float64, count=len(rows))
+
+    #weight by specificity of ukcat level, or as level 1 if not a tag
+    tag_levels = as_ukcat_registry(ukcat).tag_levels
+    level_weights = keywords.map(tag_levels).map(KEYWORD_LEVEL_WEIGHTS).fillna(1.0).to_numpy(dtype=np.float64)
+    weights = np.where(keywords.isin(tag_levels).to_numpy(), level_weights, 0.4)
+
+    #average per pair and calculate bonus
+    num_matches = np.bincount(rows, minlength=len(strong_matches_list))
+    avg_weighted = np.bincount(rows, weights=scores * weights, minlength=len(strong_matches_list)) / np.maximum(num_matches, 1)
+    bonus = np.minimum(np.maximum(1.1 + avg_weighted * 0.2, 1.1), 1.3)
+
+    return np.where(num_matches > 0, bonus, 1.0)
+
+SCORE_FIELDS = (
+    "is_sbf", "is_nua", "is_on_list", "list_reasoning", "existing_relationship", "num_grants", "relationship", "areas_score", "areas_reasoning",
+    "beneficiaries_score", "beneficiaries_reasoning", "causes_score", "causes_reasoning", "has_gcp", "text_similarity_score",
+    "keyword_similarity_score", "keyword_strong_matches", "keyword_reasoning", "keyword_gets_bonus", "name_rp_score", "name_rp_reasoning",
+    "grants_rp_score", "grants_rp_reasoning", "recipients_rp_score", "recipients_rp_reasoning", "sbf_penalty", "nua_penalty", "keywords_bonus",
+    "time_lapsed", "relationship_bonus", "last_grant_year", "gcp_bonus", "areas_rp_bonus", "areas_rp_reasoning", "keywords_rp_bonus", "keywords_rp_reasoning", "lv_penalty",
+    "has_grants_data"
+)
+
+REASONING_FIELDS = (
+    "list_reasoning", "areas_reasoning", "beneficiaries_reasoning", "causes_reasoning", "keyword_reasoning", "name_rp_reasoning",
+    "grants_rp_reasoning", "recipients_rp_reasoning", "areas_rp_reasoning", "keywords_rp_reasoning"
+)
+
+class ScoreResult:
+    """
+    Results of the 20 steps for one pair, iterable in SCORE_FIELDS order.
+    Reasoning fields and the relationship grants are None unless scored with explain, when each is built on first access.
+    """
+    __slots__ = SCORE_FIELDS + ("_builders",)
+
+    def __init__(self, builders=None, **fields):
+        self._builders = builders or {}
+        for field in SCORE_FIELDS:
+            if field not in self._builders:
+                setattr(self, field, fields.get(field))
+
+    def __getattr__(self, name):
+        #only called for fields not yet set, i.e. reasoning still to be built
+        if name != "_builders" and name in self._builders:
+            value = self._builders.pop(name)()
+            setattr(self, name, value)
+            return value
+        raise AttributeError(name)
+
+    def __iter__(self):
+        return (getattr(self, field) for field in SCORE_FIELDS)
+
+    def __len__(self):
+        return len(SCORE_FIELDS)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(getattr(self, field) for field in SCORE_FIELDS[i])
+        return getattr(self, SCORE_FIELDS[i])
+
+def get_scores_and_reasonings(pairs_df, idx, grants_df, areas_df, hierarchies_df, model, explain=True):
     """
     Calls all calculation functions to get scores and reasonings for each step.
     """
 
+    timer = start_pair_timer()
+
     #get funder's data
     funder_num = pairs_df["funder_registered_num"].iloc[idx]
-    funder_grants_df = grants_df[grants_df["funder_num"] == funder_num].copy()
-    has_grants_data = not funder_grants_df.empty
+    grants_index = get_funder_grants_index(grants_df)
+    rp_matrices = get_rp_engine(grants_df).get_funder(funder_num)
+    area_index = get_area_index(areas_df, hierarchies_df)
+    timer.lap("prepare")
+
+    return score_pair(pairs_df.iloc[idx], grants_index, rp_matrices, area_index, model, explain=explain, timer=timer)
+
+def score_pair(pair, grants_index, rp_matrices, area_index, model, keyword_cache=None, explain=False, timer=None):
+    """
+    Runs the 20 scoring steps for one funder-user pair (a row of a pairs dataframe) using the funder's prepared grants data.
+    The grants index can be anything with get_relationship and get_relationship_years, e.g. a compiled profile store.
+    Only the numeric components are computed; with explain, the reasoning is built lazily when it is read from the result.
+    Each step is timed when step timing is on (see step_timing).
+    """
+    if timer is None:
+        timer = start_pair_timer()
     
     #1 check if funder has a single beneficiary
-    is_sbf = pairs_df["is_potential_sbf"].iloc[idx]
+    is_sbf = pair["is_potential_sbf"]
+    timer.lap("sbf")
 
     #2 check if funder states no unsolicited applications
-    is_nua = pairs_df["is_nua"].iloc[idx]
+    is_nua = pair["is_nua"]
+    timer.lap("nua")
 
     #3 check if funder is on the list
-    is_on_list = pairs_df["is_on_list"].iloc[idx]
-    list_reasoning = set(pairs_df["list_entries"].iloc[idx]) if is_on_list else None
-
-    #4 check if funder has ever given a grant to applicant
-    user_num = pairs_df["user_id"].iloc[idx]
-    existing_relationship, num_grants, relationship = check_existing_relationship(grants_df, funder_num, user_num)
+    is_on_list = pair["is_on_list"]
+    timer.lap("on_list")
 
-    #5 get areas score
-    funder_areas = pairs_df["areas"].iloc[idx].copy()
-    user_areas = pairs_df["user_areas"].iloc[idx].copy()
-    areas_score, areas_reasoning = check_areas(funder_areas, user_areas, areas_df, hierarchies_df)
+    #4, 5, 9-12, 16 and 18-20 look up the funder's grants, areas and keywords
+    lookups = score_lookup_steps(pair, grants_index, rp_matrices, area_index, model, keyword_cache, timer)
 
     #6 get beneficiaries score
-    funder_beneficiaries = pairs_df["beneficiaries"].iloc[idx].copy()
-    user_beneficiaries = pairs_df["user_beneficiaries"].iloc[idx].copy()
-    beneficiaries_score, beneficiaries_reasoning = check_beneficiaries(funder_beneficiaries, user_beneficiaries)
+    beneficiaries_score, _ = check_beneficiaries(pair["beneficiaries"], pair["user_beneficiaries"], explain=False)
+    timer.lap("beneficiaries")
 
     #7 get causes score
-    funder_causes = pairs_df["causes"].iloc[idx].copy()
-    user_causes = pairs_df["user_causes"].iloc[idx].copy()
-    causes_score, causes_reasoning, has_gcp = check_causes(funder_causes, user_causes)
+    causes_score, _, has_gcp = check_causes(pair["causes"], pair["user_causes"], explain=False)
+    timer.lap("causes")
 
     #8 get text semantic similarity score
-    funder_embedding = pairs_df["concat_em"].iloc[idx]
-    user_embedding = pairs_df["user_concat_em"].iloc[idx]
-    text_similarity_score = calculate_similarity_score(funder_embedding, user_embedding)
-
-    #9 get keyword semantic similarity score
-    funder_keywords = pairs_df["extracted_class"].iloc[idx]
-    user_keywords = pairs_df["user_extracted_class"].iloc[idx]
-    keyword_similarity_score, keyword_strong_matches, keyword_reasoning, keyword_gets_bonus = check_keywords(funder_keywords, user_keywords, model)
-
-    #10 get name (RP) semantic similarity score
-    recipients_name_all_em = dict(zip(funder_grants_df["recipient_name"], funder_grants_df["recipient_name_em"]))
-    user_name_em = pairs_df["user_name_em"].iloc[idx]
-    user_name = pairs_df["user_name"].iloc[idx]
-    name_rp_score, name_rp_reasoning = check_name_rp(recipients_name_all_em, user_name_em, user_name)
-
-    #11 get grants (RP) semantic similarity score
-    non_empty_grants = funder_grants_df[
-        (funder_grants_df["grant_title"].notna() & (funder_grants_df["grant_title"] != "")) |
-        (funder_grants_df["grant_desc"].notna() & (funder_grants_df["grant_desc"] != ""))
-    ]
-    grants_all_em = dict(zip(non_empty_grants["recipient_name"], non_empty_grants["grant_concat_em"]))
-    user_concat_em = pairs_df["user_concat_em"].iloc[idx]
-    user_name = pairs_df["user_name"].iloc[idx]
-    grants_rp_score, grants_rp_reasoning = check_grants_rp(grants_all_em, user_concat_em, user_name)
-
-    #12 get recipients (RP) semantic similarity score
-    recipients_all_em = dict(zip(funder_grants_df["recipient_name"], funder_grants_df["recipient_concat_em"]))
-    user_concat_em = pairs_df["user_concat_em"].iloc[idx]
-    user_name = pairs_df["user_name"].iloc[idx]
-    recipients_rp_score, recipients_rp_reasoning = check_recipients_rp(recipients_all_em, user_concat_em, user_name)
+    text_similarity_score = calculate_similarity_score(pair["concat_em"], pair["user_concat_em"])
+    timer.lap("text_similarity")
 
     #13 get sbf penalty
     sbf_penalty = 0.1 if is_sbf else 1.0
+    timer.lap("sbf_penalty")
 
     #14 get nua penalty
-    if existing_relationship:
+    if lookups["existing_relationship"]:
         nua_penalty = 1.0
     else:
-        nua_penalty = 0.2 if is_nua else 1.0       
+        nua_penalty = 0.2 if is_nua else 1.0
+    timer.lap("nua_penalty")
 
     #15 get keywords bonus
-    if keyword_strong_matches:
-        ukcat_url = "https://raw.githubusercontent.com/lico27/ukcat/main/data/ukcat.csv"
-        ukcat_df = pd.read_csv(ukcat_url)
-        keywords_bonus = calculate_keywords_bonus(keyword_strong_matches, ukcat_df)
+    if lookups["keyword_strong_matches"]:
+        keywords_bonus = calculate_keywords_bonus(lookups["keyword_strong_matches"], get_ukcat_registry())
     else:
         keywords_bonus = 1.0
+    timer.lap("keywords_bonus")
+
+    #17 get gcp bonus
+    gcp_bonus = 1.2 if has_gcp else 1.0
+    timer.lap("gcp_bonus")
+
+    timer.finish(pair["funder_registered_num"], rp_matrices.num_grants, pair["extracted_class"], pair["user_extracted_class"])
+
+    #rerun the steps with reasoning only if it is read
+    builders = get_reasoning_builders(pair, grants_index, rp_matrices, area_index, model, keyword_cache) if explain else None
+
+    return ScoreResult(
+        builders, is_sbf=is_sbf, is_nua=is_nua, is_on_list=is_on_list, beneficiaries_score=beneficiaries_score, causes_score=causes_score,
+        has_gcp=has_gcp, text_similarity_score=text_similarity_score, sbf_penalty=sbf_penalty, nua_penalty=nua_penalty,
+        keywords_bonus=keywords_bonus, gcp_bonus=gcp_bonus, **lookups
+    )
+
+def score_lookup_steps(pair, grants_index, rp_matrices, area_index, model, keyword_cache=None, timer=None):
+    """
+    Runs the steps that look up the funder's grants, areas or keyword embeddings for one pair (4, 5, 9-12, 16 and 18-20), returning their results by field.
+    The other steps only compare the pair's own columns, so score_pairs runs them over the whole batch at once.
+    """
+    if timer is None:
+        timer = start_pair_timer()
+
+    #get funder's data
+    funder_num = pair["funder_registered_num"]
+    has_grants_data = rp_matrices.num_grants > 0
+
+    #4 check if funder has ever given a grant to applicant
+    user_num = pair["user_id"]
+    existing_relationship, num_grants, _ = check_existing_relationship(grants_index, funder_num, user_num, explain=False)
+    timer.lap("existing_relationship")
+
+    #5 get areas score
+    user_areas = pair["user_areas"]
+    areas_score, _ = check_areas(pair["areas"], user_areas, area_index, explain=False)
+    timer.lap("areas")
+
+    #9 get keyword semantic similarity score
+    user_keywords = pair["user_extracted_class"]
+    keyword_similarity_score, keyword_strong_matches, _, keyword_gets_bonus = check_keywords(pair["extracted_class"], user_keywords, model, keyword_cache, explain=False)
+    timer.lap("keywords")
+
+    #10 get name (RP) semantic similarity score
+    user_name = pair["user_name"]
+    name_rp_score, _ = check_name_rp(rp_matrices, pair["user_name_em"], user_name, explain=False)
+    timer.lap("name_rp")
+
+    #11 get grants (RP) semantic similarity score
+    user_concat_em = pair["user_concat_em"]
+    grants_rp_score, _ = check_grants_rp(rp_matrices, user_concat_em, user_name, explain=False)
+    timer.lap("grants_rp")
+
+    #12 get recipients (RP) semantic similarity score
+    recipients_rp_score, _ = check_recipients_rp(rp_matrices, user_concat_em, user_name, explain=False)
+    timer.lap("recipients_rp")
 
     #16 get relationship bonus
     if existing_relationship:
-        time_lapsed, relationship_bonus, last_grant_year = calculate_relationship_bonus(relationship)
+        grant_years = grants_index.get_relationship_years(funder_num, user_num)
+        time_lapsed, relationship_bonus, last_grant_year = calculate_relationship_bonus(grant_years)
     else:
         time_lapsed = None
         relationship_bonus = 1.0
         last_grant_year = None
-
-    #17 get gcp bonus
-    gcp_bonus = 1.2 if has_gcp else 1.0
+    timer.lap("relationship_bonus")
 
     #18 get areas (RP) bonus
-    user_areas = pairs_df["user_areas"].iloc[idx].copy()
-    areas_rp_bonus, areas_rp_reasoning = calculate_areas_bonus_rp(funder_grants_df, user_areas, areas_df, hierarchies_df)
+    areas_rp_bonus, _ = calculate_areas_bonus_rp(rp_matrices, user_areas, area_index, explain=False)
+    timer.lap("areas_rp_bonus")
 
     #19 get keywords (RP) bonus
-    user_keywords = pairs_df["user_extracted_class"].iloc[idx]
-    keywords_rp_bonus, keywords_rp_reasoning = calculate_keywords_bonus_rp(funder_grants_df, user_keywords)
+    keywords_rp_bonus, _ = calculate_keywords_bonus_rp(rp_matrices, user_keywords, explain=False)
+    timer.lap("keywords_rp_bonus")
 
     #20 get low variance penalty
-    lv_penalty = calculate_lv_penalty(funder_grants_df)
-    
-    return (is_sbf, is_nua, is_on_list, list_reasoning, existing_relationship, num_grants, relationship, areas_score, areas_reasoning, 
-            beneficiaries_score, beneficiaries_reasoning, causes_score, causes_reasoning, has_gcp, text_similarity_score,
-            keyword_similarity_score, keyword_strong_matches, keyword_reasoning, keyword_gets_bonus, name_rp_score, name_rp_reasoning,
-            grants_rp_score, grants_rp_reasoning, recipients_rp_score, recipients_rp_reasoning, sbf_penalty, nua_penalty, keywords_bonus,
-            time_lapsed, relationship_bonus, last_grant_year, gcp_bonus, areas_rp_bonus, areas_rp_reasoning, keywords_rp_bonus, keywords_rp_reasoning, lv_penalty,
-            has_grants_data
-    )
+    lv_penalty = calculate_lv_penalty(rp_matrices)
+    timer.lap("lv_penalty")
+
+    return {
+        "existing_relationship": existing_relationship, "num_grants": num_grants, "areas_score": areas_score,
+        "keyword_similarity_score": keyword_similarity_score, "keyword_strong_matches": keyword_strong_matches, "keyword_gets_bonus": keyword_gets_bonus,
+        "name_rp_score": name_rp_score, "grants_rp_score": grants_rp_score, "recipients_rp_score": recipients_rp_score, "time_lapsed": time_lapsed,
+        "relationship_bonus": relationship_bonus, "last_grant_year": last_grant_year, "areas_rp_bonus": areas_rp_bonus,
+        "keywords_rp_bonus": keywords_rp_bonus, "lv_penalty": lv_penalty, "has_grants_data": has_grants_data
+    }
+
+def get_reasoning_builders(pair, grants_index, rp_matrices, area_index, model, keyword_cache=None):
+    """
+    Returns a function per reasoning field (and the relationship grants) that reruns its step with reasoning for one pair.
+    """
+    funder_num = pair["funder_registered_num"]
+    user_num = pair["user_id"]
+
+    return {
+        "list_reasoning": lambda: set(pair["list_entries"]) if pair["is_on_list"] else None,
+        "relationship": lambda: grants_index.get_relationship(funder_num, user_num),
+        "areas_reasoning": lambda: check_areas(pair["areas"], pair["user_areas"], area_index)[1],
+        "beneficiaries_reasoning": lambda: check_beneficiaries(pair["beneficiaries"], pair["user_beneficiaries"])[1],
+        "causes_reasoning": lambda: check_causes(pair["causes"], pair["user_causes"])[1],
+        "keyword_reasoning": lambda: check_keywords(pair["extracted_class"], pair["user_extracted_class"], model, keyword_cache)[2],
+        "name_rp_reasoning": lambda: check_name_rp(rp_matrices, pair["user_name_em"], pair["user_name"])[1],
+        "grants_rp_reasoning": lambda: check_grants_rp(rp_matrices, pair["user_concat_em"], pair["user_name"])[1],
+        "recipients_rp_reasoning": lambda: check_recipients_rp(rp_matrices, pair["user_concat_em"], pair["user_name"])[1],
+        "areas_rp_reasoning": lambda: calculate_areas_bonus_rp(rp_matrices, pair["user_areas"], area_index)[1],
+        "keywords_rp_reasoning": lambda: calculate_keywords_bonus_rp(rp_matrices, pair["user_extracted_class"])[1]
+    }
 
 def calculate_alignment_score(pairs_df, idx, grants_df, areas_df, hierarchies_df, model):
     """
@@ -649,60 +787,183 @@ def calculate_alignment_score(pairs_df, idx, grants_df, areas_df, hierarchies_df
     """
 
     #get scores
-    result = get_scores_and_reasonings(pairs_df, idx, grants_df, areas_df, hierarchies_df, model)
-    
-    #unpack score elements
-    (is_sbf, is_nua, is_on_list, list_reasoning,
-     existing_relationship, num_grants, relationship, areas_score,
-     areas_reasoning, beneficiaries_score, beneficiaries_reasoning,
-     causes_score, causes_reasoning, has_gcp, text_similarity_score,
-     keyword_similarity_score, keyword_strong_matches, keyword_reasoning, keyword_gets_bonus,
-     name_rp_score, name_rp_reasoning, grants_rp_score, grants_rp_reasoning,
-     recipients_rp_score, recipients_rp_reasoning, sbf_penalty, nua_penalty, keywords_bonus,
-     time_lapsed, relationship_bonus, last_grant_year, gcp_bonus, areas_rp_bonus, areas_rp_reasoning,
-     keywords_rp_bonus, keywords_rp_reasoning, lv_penalty, has_grants_data) = result
-
-    #define weights based on stated/revealsed
-    sp_weights = {
-        "areas": (areas_score, 0.08),
-        "beneficiaries": (beneficiaries_score, 0.04),
-        "causes": (causes_score, 0.02),
-        "text_similarity": (text_similarity_score, 0.16),
-        "keyword_similarity": (keyword_similarity_score, 0.11)
-    }
+    result = get_scores_and_reasonings(pairs_df, idx, grants_df, areas_df, hierarchies_df, model, explain=False)
 
-    rp_weights = {
-        "name_rp": (name_rp_score, 0.17),
-        "grants_rp": (grants_rp_score, 0.21),
-        "recipients_rp": (recipients_rp_score, 0.21)
-    }
+    return combine_scores(result)
+
+#stated and revealed preference weights, and the multipliers applied to their weighted sum
+SP_WEIGHTS = {"areas_score": 0.08, "beneficiaries_score": 0.04, "causes_score": 0.02, "text_similarity_score": 0.16, "keyword_similarity_score": 0.11}
+RP_WEIGHTS = {"name_rp_score": 0.17, "grants_rp_score": 0.21, "recipients_rp_score": 0.21}
+MULTIPLIERS = ("sbf_penalty", "nua_penalty", "keywords_bonus", "relationship_bonus", "gcp_bonus", "areas_rp_bonus", "keywords_rp_bonus", "lv_penalty")
+
+def combine_scores(result):
+    """
+    Applies the stated/revealed preference weights and all multipliers to the scores from the 20 steps.
+    Reads only the numeric fields of the result, so no reasoning is built.
+    """
 
     #calculate scores with proportional reweighting
-    if has_grants_data:
+    if result.has_grants_data:
         #normal calculation when grants history exists
-        weighted_scores = sum(score * weight for score, weight in sp_weights.values())
-        weighted_scores += sum(score * weight for score, weight in rp_weights.values())
+        weighted_scores = sum(getattr(result, field) * weight for field, weight in SP_WEIGHTS.items())
+        weighted_scores += sum(getattr(result, field) * weight for field, weight in RP_WEIGHTS.items())
     else:
         #get total weights when no grants history
-        sp_total = sum(weight for _, weight in sp_weights.values())
-        rp_total = sum(weight for _, weight in rp_weights.values())
-        
+        sp_total = sum(SP_WEIGHTS.values())
+        rp_total = sum(RP_WEIGHTS.values())
+
         #apply proportional reweighting
         reweight_proportion = (sp_total + rp_total) / sp_total
-        weighted_scores = sum(score * weight * reweight_proportion for score, weight in sp_weights.values())
-    
-    final_score = (
-        weighted_scores *
-        sbf_penalty *
-        nua_penalty *
-        keywords_bonus *
-        relationship_bonus *
-        gcp_bonus *
-        areas_rp_bonus *
-        keywords_rp_bonus *
-        lv_penalty
-    )
-    
+        weighted_scores = sum(getattr(result, field) * weight * reweight_proportion for field, weight in SP_WEIGHTS.items())
+
+    final_score = weighted_scores
+    for field in MULTIPLIERS:
+        final_score = final_score * getattr(result, field)
+
     final_score = min(max(final_score, 0.05), 0.95)
-    
-    return final_score
\ No newline at end of file
+
+    return final_score
+
+def combine_score_columns(scores_df):
+    """
+    Applies combine_scores to every row of a batch scores dataframe at once, in the same order of operations so the scores match exactly.
+    """
+    columns = {field: scores_df[field].to_numpy(dtype=np.float64) for field in list(SP_WEIGHTS) + list(RP_WEIGHTS) + list(MULTIPLIERS)}
+    has_grants_data = scores_df["has_grants_data"].to_numpy(dtype=bool)
+
+    #weighted sums with and without grants history
+    sp_scores = sum(columns[field] * weight for field, weight in SP_WEIGHTS.items())
+    rp_scores = sum(columns[field] * weight for field, weight in RP_WEIGHTS.items())
+    reweight_proportion = (sum(SP_WEIGHTS.values()) + sum(RP_WEIGHTS.values())) / sum(SP_WEIGHTS.values())
+    reweighted_scores = sum(columns[field] * weight * reweight_proportion for field, weight in SP_WEIGHTS.items())
+    final_scores = np.where(has_grants_data, sp_scores + rp_scores, reweighted_scores)
+
+    for field in MULTIPLIERS:
+        final_scores = final_scores * columns[field]
+
+    return np.minimum(np.maximum(final_scores, 0.05), 0.95)
+
+BATCH_SCORE_COLUMNS = [
+    "existing_relationship", "num_grants", "has_grants_data",
+    "areas_score", "beneficiaries_score", "causes_score", "text_similarity_score", "keyword_similarity_score",
+    "name_rp_score", "grants_rp_score", "recipients_rp_score",
+    "sbf_penalty", "nua_penalty", "keywords_bonus", "relationship_bonus", "gcp_bonus",
+    "areas_rp_bonus", "keywords_rp_bonus", "lv_penalty"
+]
+
+def get_score_columns(explain=False):
+    """
+    Gets the columns of a batch scores dataframe.
+    """
+    columns = ["funder_registered_num", "user_id"] + BATCH_SCORE_COLUMNS + ["final_score"]
+    if explain:
+        columns += list(REASONING_FIELDS)
+
+    return columns
+
+def calculate_alignment_scores_batch(pairs_df, grants_df, areas_df, hierarchies_df, model, explain=False, keyword_cache=None):
+    """
+    Scores every pair in a pairs dataframe, sharing each funder's grants, embeddings and area lookups across its pairs.
+    Returns a dataframe with the same index as pairs_df holding the component scores, multipliers and final score, plus the reasoning with explain.
+    """
+    area_index = get_area_index(areas_df, hierarchies_df)
+    grants_index = get_funder_grants_index(grants_df)
+    rp_engine = get_rp_engine(grants_df)
+
+    return score_pairs(pairs_df, grants_index, rp_engine, area_index, model, explain=explain, keyword_cache=keyword_cache)
+
+def get_batch_keywords(pairs_df):
+    """
+    Gets every funder and user keyword in a pairs dataframe, parsing json strings.
+    """
+    all_keywords = []
+    for keywords in list(pairs_df["extracted_class"]) + list(pairs_df["user_extracted_class"]):
+        if isinstance(keywords, str):
+            keywords = json.loads(keywords)
+        if isinstance(keywords, (list, np.ndarray)):
+            all_keywords.extend(keywords)
+
+    return all_keywords
+
+def score_pairs(pairs_df, grants_index, rp_engine, area_index, model, explain=False, keyword_cache=None):
+    """
+    Scores every pair in a pairs dataframe against prepared funder data: a grants index and RP engine, or a compiled profile store for both.
+    The steps that need the funder's grants, areas or keyword embeddings run pair by pair on the funder's stacked matrices; the rest run column-wise over the batch.
+    """
+    keyword_cache = keyword_cache or get_keyword_cache(model)
+
+    #embed every keyword in the batch in one go
+    keyword_cache.precompute(get_batch_keywords(pairs_df))
+
+    #group pairs by funder
+    pairs = pairs_df.to_dict("records")
+    funder_positions = {}
+    for position, pair in enumerate(pairs):
+        funder_positions.setdefault(pair["funder_registered_num"], []).append(position)
+
+    #decode each embedding once, sharing it between pairs that hold the same stored value
+    decoded_embeddings = {}
+    for pair in pairs:
+        for col in ["concat_em", "user_name_em", "user_concat_em"]:
+            if id(pair[col]) not in decoded_embeddings:
+                decoded_embeddings[id(pair[col])] = embedding_to_array(pair[col])
+
+    #run the steps that look up funder data per pair, sharing each funder's data across its pairs
+    rows = [None] * len(pairs)
+    timers = [None] * len(pairs)
+    funder_grants = [0] * len(pairs)
+    for funder_num, positions in funder_positions.items():
+        #get funder's data once for all of its pairs
+        rp_matrices = rp_engine.get_funder(funder_num)
+
+        for position in positions:
+            pair = pairs[position]
+            pair["concat_em"] = decoded_embeddings[id(pair["concat_em"])]
+            pair["user_name_em"] = decoded_embeddings[id(pair["user_name_em"])]
+            pair["user_concat_em"] = decoded_embeddings[id(pair["user_concat_em"])]
+            timers[position] = start_pair_timer()
+            funder_grants[position] = rp_matrices.num_grants
+            row = {"funder_registered_num": funder_num, "user_id": pair["user_id"]}
+            row.update(score_lookup_steps(pair, grants_index, rp_matrices, area_index, model, keyword_cache, timers[position]))
+
+            #keep reasoning if asked for
+            if explain:
+                builders = get_reasoning_builders(pair, grants_index, rp_matrices, area_index, model, keyword_cache)
+                row.update({col: builders[col]() for col in REASONING_FIELDS})
+            rows[position] = row
+
+    scores_df = pd.DataFrame(rows, index=pairs_df.index)
+    if not len(scores_df):
+        return pd.DataFrame(rows, index=pairs_df.index, columns=get_score_columns(explain))
+
+    #run the steps that only compare the pairs' own columns over the whole batch
+    timer = start_batch_timer()
+    is_sbf = pairs_df["is_potential_sbf"].astype(bool).to_numpy()
+    timer.lap("sbf")
+    is_nua = pairs_df["is_nua"].astype(bool).to_numpy()
+    timer.lap("nua")
+    scores_df["beneficiaries_score"] = score_beneficiaries_column(pairs_df["beneficiaries"].to_numpy(), pairs_df["user_beneficiaries"].to_numpy())
+    timer.lap("beneficiaries")
+    scores_df["causes_score"], has_gcp = score_causes_column(pairs_df["causes"].to_numpy(), pairs_df["user_causes"].to_numpy())
+    timer.lap("causes")
+    scores_df["text_similarity_score"] = score_text_similarity_column([pair["concat_em"] for pair in pairs], [pair["user_concat_em"] for pair in pairs])
+    timer.lap("text_similarity")
+    scores_df["sbf_penalty"] = np.where(is_sbf, 0.1, 1.0)
+    timer.lap("sbf_penalty")
+    scores_df["nua_penalty"] = np.where(scores_df["existing_relationship"].to_numpy(dtype=bool) | ~is_nua, 1.0, 0.2)
+    timer.lap("nua_penalty")
+    scores_df["keywords_bonus"] = calculate_keywords_bonus_column(scores_df["keyword_strong_matches"].to_numpy(), get_ukcat_registry())
+    timer.lap("keywords_bonus")
+    scores_df["gcp_bonus"] = np.where(has_gcp, 1.2, 1.0)
+    timer.lap("gcp_bonus")
+
+    #give each pair its share of the batch steps
+    timer.share(timers)
+    for pair, pair_timer, num_grants in zip(pairs, timers, funder_grants):
+        pair_timer.finish(pair["funder_registered_num"], num_grants, pair["extracted_class"], pair["user_extracted_class"])
+
+    #weight and combine the components of every pair in one pass
+    scores_df = scores_df.reindex(columns=get_score_columns(explain))
+    scores_df["final_score"] = combine_score_columns(scores_df)
+
+    return scores_df
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+STEPS = (
+    "prepare", "sbf", "nua", "on_list", "existing_relationship", "areas", "beneficiaries", "causes", "text_similarity", "keywords",
+    "name_rp", "grants_rp", "recipients_rp", "sbf_penalty", "nua_penalty", "keywords_bonus", "relationship_bonus", "gcp_bonus",
+    "areas_rp_bonus", "keywords_rp_bonus", "lv_penalty", "total"
+)
+SIZES = ("grants_per_funder", "funder_keywords", "user_keywords")
+
+TIME_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus style, plus the count, sum and max of observed values.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        """
+        Returns (upper bound, count of values at or below it) pairs, ending with +Inf.
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            pairs.append((bound, total))
+
+        return pairs
+
+    def to_dict(self):
+        return {
+            "count": self.count, "sum": self.sum, "max": self.max, "mean": self.sum / self.count if self.count else 0.0,
+            "buckets": [[bound, count] for bound, count in self.cumulative()]
+        }
+
+class StepTimings:
+    """
+    Aggregates per-step wall times, input sizes and per-funder totals over every pair scored while timing is on.
+    """
+
+    def __init__(self, slow_funders=20):
+        self.slow_funders = slow_funders
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.steps = {}
+            self.sizes = {}
+            self.funders = {}
+
+    def record(self, funder_num, step_times, sizes):
+        """
+        Adds one pair's step times and input sizes.
+        """
+        total = sum(step_times.values())
+        with self.lock:
+            for step, seconds in step_times.items():
+                self.steps.setdefault(step, Histogram(TIME_BUCKETS)).observe(seconds)
+            self.steps.setdefault("total", Histogram(TIME_BUCKETS)).observe(total)
+            for name, size in sizes.items():
+                self.sizes.setdefault(name, Histogram(SIZE_BUCKETS)).observe(size)
+
+            #track pairs and time per funder to find slow ones
+            funder = self.funders.setdefault(str(funder_num), [0, 0.0, 0.0, sizes.get("grants_per_funder", 0)])
+            funder[0] += 1
+            funder[1] += total
+            funder[2] = max(funder[2], total)
+
+    def get_slow_funders(self, limit=None):
+        """
+        Returns the funders with the most time spent scoring, slowest first.
+        """
+        with self.lock:
+            funders = sorted(self.funders.items(), key=lambda item: item[1][1], reverse=True)[:limit or self.slow_funders]
+
+        return [
+            {"funder_registered_num": funder_num, "pairs": count, "total_seconds": total, "mean_seconds": total / count, "max_seconds": slowest, "grants": grants}
+            for funder_num, (count, total, slowest, grants) in funders
+        ]
+
+    def to_json(self):
+        """
+        Returns every histogram and the slowest funders as a json-ready dict.
+        """
+        with self.lock:
+            steps = {step: self.steps[step].to_dict() for step in order_names(self.steps, STEPS)}
+            sizes = {name: self.sizes[name].to_dict() for name in order_names(self.sizes, SIZES)}
+
+        return {"steps": steps, "sizes": sizes, "slow_funders": self.get_slow_funders()}
+
+    def to_prometheus(self):
+        """
+        Returns every histogram and the slowest funders in the Prometheus text format.
+        """
+        with self.lock:
+            steps = [(step, self.steps[step]) for step in order_names(self.steps, STEPS)]
+            sizes = [(name, self.sizes[name]) for name in order_names(self.sizes, SIZES)]
+
+        lines = ["# HELP score_step_seconds Wall time of each scoring step per pair.", "# TYPE score_step_seconds histogram"]
+        for step, histogram in steps:
+            lines.extend(format_histogram("score_step_seconds", "step", step, histogram))
+
+        lines += ["# HELP score_input_size Sizes of the inputs to each scored pair.", "# TYPE score_input_size histogram"]
+        for name, histogram in sizes:
+            lines.extend(format_histogram("score_input_size", "input", name, histogram))
+
+        lines += ["# HELP score_slow_funder_seconds Time spent scoring the slowest funders.", "# TYPE score_slow_funder_seconds gauge"]
+        for funder in self.get_slow_funders():
+            label = f'funder="{escape_label(funder["funder_registered_num"])}"'
+            lines.append(f'score_slow_funder_seconds{{{label},stat="total"}} {funder["total_seconds"]!r}')
+            lines.append(f'score_slow_funder_seconds{{{label},stat="max"}} {funder["max_seconds"]!r}')
+
+        return "\n".join(lines) + "\n"
+
+def order_names(names, known):
+    """
+    Orders recorded names by a known order, with any others after.
+    """
+    return [name for name in known if name in names] + sorted(name for name in names if name not in known)
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_histogram(metric, label, value, histogram):
+    label = f'{label}="{escape_label(value)}"'
+    lines = [f'{metric}_bucket{{{label},le="{bound}"}} {count}' for bound, count in histogram.cumulative()]
+    lines.append(f"{metric}_sum{{{label}}} {histogram.sum!r}")
+    lines.append(f"{metric}_count{{{label}}} {histogram.count}")
+
+    return lines
+
+def count_items(values):
+    """
+    Counts the items of a list field, parsing json strings and treating missing values as empty.
+    """
+    if isinstance(values, str):
+        try:
+            values = json.loads(values)
+        except json.JSONDecodeError:
+            return 1
+    try:
+        return len(values)
+    except TypeError:
+        return 0
+
+class PairTimer:
+    """
+    Times the steps of one pair: each lap records the time since the previous lap under the step's name.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.step_times = {}
+        self.last = time.perf_counter()
+
+    def lap(self, step):
+        now = time.perf_counter()
+        self.step_times[step] = self.step_times.get(step, 0.0) + now - self.last
+        self.last = now
+
+    def add(self, step, seconds):
+        """
+        Records time measured elsewhere, e.g. the pair's share of a step run over a whole batch.
+        """
+        self.step_times[step] = self.step_times.get(step, 0.0) + seconds
+
+    def finish(self, funder_num, num_grants, funder_keywords, user_keywords):
+        sizes = {"grants_per_funder": num_grants, "funder_keywords": count_items(funder_keywords), "user_keywords": count_items(user_keywords)}
+        self.timings.record(funder_num, self.step_times, sizes)
+
+class BatchTimer:
+    """
+    Times steps run once over a batch of pairs: each lap records the time since the previous lap, later shared equally between the pairs.
+    """
+
+    def __init__(self):
+        self.step_times = {}
+        self.last = time.perf_counter()
+
+    def lap(self, step):
+        now = time.perf_counter()
+        self.step_times[step] = self.step_times.get(step, 0.0) + now - self.last
+        self.last = now
+
+    def share(self, pair_timers):
+        """
+        Adds each pair's share of every step's time to its timer.
+        """
+        for step, seconds in self.step_times.items():
+            for timer in pair_timers:
+                timer.add(step, seconds / len(pair_timers))
+
+class NullTimer:
+    """
+    Stands in for a pair timer when timing is off, so the steps cost one no-op call each.
+    """
+
+    def lap(self, step):
+        pass
+
+    def add(self, step, seconds):
+        pass
+
+    def share(self, pair_timers):
+        pass
+
+    def finish(self, funder_num, num_grants, funder_keywords, user_keywords):
+        pass
+
+NULL_TIMER = NullTimer()
+
+#process-wide timings, on when SCORE_STEP_TIMING is set
+_timings = StepTimings()
+_enabled = os.getenv("SCORE_STEP_TIMING", "").lower() in ("1", "true", "yes", "on")
+_local = threading.local()
+
+def get_step_timings():
+    """
+    Gets the process-wide step timings, filled while SCORE_STEP_TIMING is set.
+    """
+    return _timings
+
+def set_step_timing(enabled):
+    """
+    Turns process-wide step timing on or off, returning whether it was on.
+    """
+    global _enabled
+    previous = _enabled
+    _enabled = bool(enabled)
+
+    return previous
+
+def start_pair_timer():
+    """
+    Returns a timer for one pair, recording into the innermost record_step_timings block of this thread, else the process-wide timings if on.
+    """
+    timings = getattr(_local, "timings", None)
+    if timings is not None:
+        return PairTimer(timings)
+    if _enabled:
+        return PairTimer(_timings)
+
+    return NULL_TIMER
+
+def start_batch_timer():
+    """
+    Returns a timer for steps run over a whole batch, timing whenever start_pair_timer would.
+    """
+    if getattr(_local, "timings", None) is not None or _enabled:
+        return BatchTimer()
+
+    return NULL_TIMER
+
+@contextmanager
+def record_step_timings(timings=None):
+    """
+    Records the step timings of every pair scored on this thread within the block, yielding the timings collected.
+    """
+    timings = timings or StepTimings()
+    previous = getattr(_local, "timings", None)
+    _local.timings = timings
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+from tornado.testing import AsyncHTTPTestCase
+
+#add api, backend and project root to path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+project_root = os.path.abspath(os.path.join(backend_dir, '..'))
+for path in [project_root, backend_dir, os.path.join(backend_dir, "api")]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from reference_data import LocalDataSource
+from ukcat_registry import UkcatRegistry, use_ukcat_registry
+from score_calculator import ScoringService, make_app
+
+DIM = 16
+USER = {
+    "user_id": "R1",
+    "user_name": "Youth Arts Trust",
+    "user_activities": "education and arts projects for young people",
+    "user_objectives": "to advance education",
+    "user_areas": ["London"],
+    "user_beneficiaries": ["Children/young People"],
+    "user_causes": ["Education/training"]
+}
+
+class HashModel:
+    """
+    Stands in for the sentence transformer with a vector seeded from each text's hash, so the tests need no model download.
+    """
+    cache_name = "test-hash-model"
+
+    def encode(self, texts):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = np.stack([
+            np.random.default_rng(int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)).normal(size=DIM) for text in texts
+        ]).astype(np.float32) if texts else np.zeros((0, DIM), dtype=np.float32)
+
+        return vectors[0] if single else vectors
+
+def write_fixtures(folder, model):
+    """
+    Writes a tiny set of prepared reference tables in the layout LocalDataSource reads.
+    """
+    areas_df = pd.DataFrame({
+        "area_id": ["K1", "R1", "R2"],
+        "area_level": ["country", "region", "region"],
+        "area_name": ["England", "London", "North West"]
+    })
+    hierarchies_df = pd.DataFrame({"parent_area_id": ["K1", "K1"], "child_area_id": ["R1", "R2"]})
+    funders_df = pd.DataFrame({
+        "registered_num": ["100", "200", "300"],
+        "name": ["Arts Foundation", "Health Fund", "Northern Trust"],
+        "is_potential_sbf": [False, False, True],
+        "is_nua": [False, True, False],
+        "is_on_list": [True, False, False],
+        "list_entries": [["A"], [], []],
+        "areas": [["London"], ["England"], ["North West"]],
+        "beneficiaries": [["Children/young People"], [], ["The General Public/mankind"]],
+        "causes": [["Education/training", "Arts/culture"], ["Health"], ["General Charitable Purposes"]],
+        "extracted_class": [["EDUCATION", "ARTS"], ["HEALTH"], []],
+        "concat_em": list(model.encode(["arts and education", "health care", "general purposes in the north"]))
+    })
+    grants_df = pd.DataFrame({
+        "grant_id": ["G1", "G2", "G3"],
+        "funder_num": ["100", "100", "200"],
+        "recipient_id": ["R1", "R2", "R3"],
+        "recipient_name": ["YOUTH ARTS TRUST", "CITY MUSEUM", "CARE HOME"],
+        "year": [2023, 2024, 2022],
+        "grant_title": ["Workshops", "Exhibition", None],
+        "grant_desc": ["arts workshops", None, "care"],
+        "recipient_name_em": list(model.encode(["youth arts trust", "city museum", "care home"])),
+        "recipient_concat_em": list(model.encode(["youth arts education", "museum arts", "elderly care"])),
+        "grant_concat_em": list(model.encode(["workshops arts", "exhibition", "care"])),
+        "recipient_areas": [["London"], ["London"], None],
+        "recipient_extracted_class": [["ARTS", "EDUCATION"], ["ARTS"], ["HEALTH"]]
+    })
+
+    for name, df in [("funders", funders_df), ("grants", grants_df), ("areas", areas_df), ("hierarchies", hierarchies_df)]:
+        df.to_pickle(os.path.join(folder, f"{name}_df.pkl"))
+
+class ScoreCalculatorTest(AsyncHTTPTestCase):
+    """
+    Smoke tests of the scoring API against fixture tables and a stand-in model.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = HashModel()
+        cls.folder = tempfile.mkdtemp()
+        write_fixtures(cls.folder, cls.model)
+        cls.previous_registry = use_ukcat_registry(UkcatRegistry(pd.DataFrame({
+            "tag": ["Education", "Arts", "Health"],
+            "level": [1, 2, 2],
+            "Regular expression": [r"\beducat", r"\barts?\b", r"\bhealth"],
+            "Exclude regular expression": [None, None, None]
+        })))
+        #keep the test model's keyword vectors out of the shared on-disk cache
+        cls.service = ScoringService(LocalDataSource(cls.folder), model_loader=lambda: cls.model, max_workers=2,
+                                     keyword_cache_path=os.path.join(cls.folder, "keyword_embeddings.sqlite"))
+        cls.service.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        use_ukcat_registry(cls.previous_registry)
+        shutil.rmtree(cls.folder)
+
+    def get_app(self):
+        return make_app(self.service)
+
+    def post_json(self, path, body, headers=None):
+        response = self.fetch(path, method="POST", body=json.dumps(body), headers=headers)
+        return response.code, json.loads(response.body)
+
+    def test_ready(self):
+        response = self.fetch("/health/ready")
+        self.assertEqual(response.code, 200, self.service.error)
+        self.assertEqual(json.loads(response.body)["status"], "ready")
+
+    def test_score(self):
+        code, result = self.post_json("/score", {"funder_registered_num": "100", "user": USER, "explain": True})
+        self.assertEqual(code, 200)
+        self.assertEqual(result["funder_registered_num"], "100")
+        self.assertTrue(0 <= result["final_score"] <= 1)
+        self.assertTrue(result["existing_relationship"])
+
+    def test_keyword_cache_in_test_folder(self):
+        self.post_json("/score", {"funder_registered_num": "100", "user": USER})
+        self.assertEqual(self.service.keyword_cache.cache_path, os.path.join(self.folder, "keyword_embeddings.sqlite"))
+        self.assertTrue(os.path.exists(self.service.keyword_cache.cache_path))
+
+    def test_score_unknown_funder(self):
+        code, result = self.post_json("/score", {"funder_registered_num": "999", "user": USER})
+        self.assertEqual(code, 404)
+        self.assertIn("999", result["error"])
+
+    def test_rank(self):
+        code, result = self.post_json("/rank", {"user": USER, "top_k": 2})
+        self.assertEqual(code, 200)
+        scores = [funder["final_score"] for funder in result["funders"]]
+        self.assertEqual(len(scores), 2)
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_invalid_input(self):
+        for path, body in [
+            ("/rank", {"user": USER, "top_k": "lots"}),
+            ("/rank", {"user": USER, "top_k": 0}),
+            ("/rank", {"user": "not a profile"}),
+            ("/score", {"funder_registered_num": "100", "user": dict(USER, user_areas="London")}),
+            ("/score", {"funder_registered_num": ["100"], "user": USER}),
+            ("/score", [1, 2])
+        ]:
+            code, result = self.post_json(path, body)
+            self.assertEqual(code, 400, body)
+            self.assertIn("error", result)
+
+    def test_invalidate_needs_token(self):
+        os.environ.pop("SCORE_API_TOKEN", None)
+        code, _ = self.post_json("/cache/invalidate", {"all": True, "reload": False})
+        self.assertEqual(code, 403)
+
+        os.environ["SCORE_API_TOKEN"] = "secret"
+        try:
+            code, _ = self.post_json("/cache/invalidate", {"all": True, "reload": False}, headers={"Authorization": "Bearer wrong"})
+            self.assertEqual(code, 401)
+            code, result = self.post_json("/cache/invalidate", {"all": True, "reload": False}, headers={"Authorization": "Bearer secret"})
+            self.assertEqual(code, 200)
+            self.assertEqual(result["cache"]["size"], 0)
+        finally:
+            os.environ.pop("SCORE_API_TOKEN", None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import sys
+import unittest
+
+#add benchmarks, backend and project root to path
+backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+project_root = os.path.abspath(os.path.join(backend_dir, '..'))
+for path in [project_root, backend_dir, os.path.join(backend_dir, "benchmarks")]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+from ukcat_registry import UkcatRegistry, use_ukcat_registry
+from scoring_engine import assert_backend_parity
+from synthetic_data import make_synthetic_data, SyntheticModel
+
+DIM = 32
+
+def empty_every(values, step, empty):
+    """
+    Replaces every step-th value with an empty one.
+    """
+    return [empty if i % step == 0 else value for i, value in enumerate(values)]
+
+class ScoringParityTest(unittest.TestCase):
+    """
+    Checks the reference and numpy scoring backends agree on every step for the benchmark's synthetic data.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.frames = make_synthetic_data(200, grants_per_funder=6, num_pairs=150, dim=DIM, seed=7)
+        cls.model = SyntheticModel(DIM)
+        cls.previous_registry = use_ukcat_registry(UkcatRegistry(cls.frames["ukcat"]))
+
+    @classmethod
+    def tearDownClass(cls):
+        use_ukcat_registry(cls.previous_registry)
+
+    def assert_parity(self, pairs_df, grants_df):
+        assert_backend_parity(pairs_df, grants_df, self.frames["areas"], self.frames["hierarchies"], self.model)
+
+    def test_synthetic_pairs(self):
+        self.assert_parity(self.frames["pairs"], self.frames["grants"])
+
+    def test_empty_lists(self):
+        pairs_df = self.frames["pairs"].copy()
+        grants_df = self.frames["grants"].copy()
+
+        #empty keyword, area, beneficiary and cause lists on either side of the pairs
+        pairs_df["extracted_class"] = empty_every(pairs_df["extracted_class"], 3, "[]")
+        pairs_df["user_extracted_class"] = empty_every(pairs_df["user_extracted_class"], 4, [])
+        for col in ["areas", "beneficiaries", "causes"]:
+            pairs_df[col] = empty_every(pairs_df[col], 5, [])
+            pairs_df[f"user_{col}"] = empty_every(pairs_df[f"user_{col}"], 2, [])
+
+        #empty recipient keywords and areas on some grants, and no grants at all for some paired funders
+        grants_df["recipient_extracted_class"] = empty_every(grants_df["recipient_extracted_class"], 2, "[]")
+        grants_df["recipient_areas"] = empty_every(grants_df["recipient_areas"], 3, [])
+        funders_without_grants = set(pairs_df["funder_registered_num"].iloc[::6])
+        grants_df = grants_df[~grants_df["funder_num"].isin(funders_without_grants)].reset_index(drop=True)
+        self.assertTrue(pairs_df["funder_registered_num"].isin(funders_without_grants).any())
+
+        self.assert_parity(pairs_df, grants_df)
+
+if __name__ == "__main__":
+    unittest.main()
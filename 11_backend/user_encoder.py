@@ -0,0 +1,100 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from keyword_embeddings import get_keyword_cache, normalise_rows
+
+def build_user_texts(user_name, user_activities, user_objectives):
+    """
+    Returns the name and the lowercased name, activities and objectives text that the user embeddings are made from.
+    """
+    user_name = user_name or ""
+    concat_text = " ".join([user_name, user_activities or "", user_objectives or ""]).lower()
+
+    return user_name, concat_text
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class UserProfileEncoder:
+    """
+    Encodes all of a user's texts (name, concatenated text and keywords) in one batched call, caching the vectors by text hash.
+    Keyword vectors are normalised and shared with the keyword cache, so scoring the user against many funders never re-encodes them.
+    """
+
+    def __init__(self, model, keyword_cache=None, max_size=4096):
+        self.model = model
+        self.keyword_cache = keyword_cache or get_keyword_cache(model)
+        self.max_size = max_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, user_name, concat_text, keywords=()):
+        """
+        Returns the float32 name and concatenated text embeddings, and the normalised keyword matrix.
+        """
+        keywords = list(dict.fromkeys(str(keyword) for keyword in keywords))
+        texts = list(dict.fromkeys([user_name, concat_text]))
+        hashes = {text: hash_text(text) for text in texts}
+
+        #check cached texts and keywords
+        found = {}
+        with self.lock:
+            for text in texts:
+                if hashes[text] in self.memory:
+                    self.memory.move_to_end(hashes[text])
+                    found[text] = self.memory[hashes[text]]
+            self.hits += len(found)
+            self.misses += len(texts) - len(found)
+        found_keywords = self.keyword_cache.lookup(keywords) if keywords else {}
+        missing_texts = [text for text in texts if text not in found]
+        missing_keywords = [keyword for keyword in keywords if keyword not in found_keywords]
+
+        #encode everything missing in one batch
+        if missing_texts or missing_keywords:
+            batch = missing_texts + missing_keywords
+            encoded = np.asarray(self.model.encode(batch), dtype=np.float32).reshape(len(batch), -1)
+            new_texts = dict(zip(missing_texts, encoded[:len(missing_texts)]))
+            with self.lock:
+                for text, embedding in new_texts.items():
+                    self._remember(hashes[text], embedding)
+            found.update(new_texts)
+
+            if missing_keywords:
+                new_keywords = dict(zip(missing_keywords, normalise_rows(encoded[len(missing_texts):])))
+                self.keyword_cache.store(new_keywords)
+                found_keywords.update(new_keywords)
+
+        keywords_em = np.stack([found_keywords[keyword] for keyword in keywords]) if keywords else np.zeros((0, 0), dtype=np.float32)
+
+        return found[user_name], found[concat_text], keywords_em
+
+    def encode_user(self, user, user_activities, user_objectives):
+        """
+        Adds the user_name_em and user_concat_em columns to a user built from a profile, encoding its keywords alongside.
+        """
+        user_name, concat_text = build_user_texts(user["user_name"], user_activities, user_objectives)
+        user["user_name_em"], user["user_concat_em"], _ = self.encode(user_name, concat_text, user.get("user_extracted_class") or [])
+
+        return user
+
+    def _remember(self, key, embedding):
+        self.memory[key] = embedding
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+_encoders = {}
+
+def get_user_encoder(model, keyword_cache=None):
+    """
+    Gets the shared user profile encoder for a loaded model.
+    """
+    keyword_cache = keyword_cache or get_keyword_cache(model)
+    cache_key = (id(model), id(keyword_cache))
+    if cache_key not in _encoders:
+        _encoders[cache_key] = UserProfileEncoder(model, keyword_cache=keyword_cache)
+
+    return _encoders[cache_key]
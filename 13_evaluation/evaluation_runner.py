@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import multiprocessing
+import numpy as np
+import pandas as pd
+from evaluation_logic import get_scores_and_reasonings, combine_scores, SCORE_FIELDS
+from scoring_logic import BATCH_SCORE_COLUMNS
+from ukcat_registry import get_ukcat_registry, use_ukcat_registry
+
+#data shared with worker processes, set by init_worker
+_shared = {}
+
+class PrecomputedEncoder:
+    """
+    Serves keyword embeddings encoded up front in one batch, without holding the model, so workers never run it.
+    """
+
+    def __init__(self, model, texts, batch_size=256):
+        texts = list(dict.fromkeys(texts))
+        self.embeddings = dict(zip(texts, model.encode(texts, batch_size=batch_size))) if texts else {}
+
+    def encode(self, text, **kwargs):
+        if not isinstance(text, str) or text not in self.embeddings:
+            raise KeyError(f"Keyword {text!r} was not encoded up front - check get_all_keywords collects it")
+        return self.embeddings[text]
+
+def get_all_keywords(pairs_df):
+    """
+    Collects the funder and user keywords of every pair, parsing json lists.
+    """
+    keywords = []
+    for keyword_list in list(pairs_df["extracted_class"]) + list(pairs_df["user_extracted_class"]):
+        if isinstance(keyword_list, str):
+            keyword_list = json.loads(keyword_list)
+        if isinstance(keyword_list, (list, np.ndarray)):
+            keywords.extend(keyword for keyword in keyword_list if isinstance(keyword, str))
+
+    return keywords
+
+def make_chunks(pairs_df, chunk_size):
+    """
+    Splits pair positions into chunks, keeping each funder's pairs together.
+    """
+    funder_positions = {}
+    for position, funder_num in enumerate(pairs_df["funder_registered_num"]):
+        funder_positions.setdefault(funder_num, []).append(position)
+
+    chunks = [[]]
+    for positions in funder_positions.values():
+        if chunks[-1] and len(chunks[-1]) + len(positions) > chunk_size:
+            chunks.append([])
+        chunks[-1].extend(positions)
+
+    return [chunk for chunk in chunks if chunk]
+
+def score_chunk(chunk):
+    """
+    Scores a chunk of pairs by position, returning each position with its component scores and final score.
+    """
+    pairs_df = _shared["pairs_df"]
+    funder_grants = _shared["funder_grants"]
+
+    rows = []
+    for position in chunk:
+        #only the funder's own grants are needed, so skip filtering the whole table
+        funder_num = pairs_df["funder_registered_num"].iloc[position]
+        funder_grants_df = funder_grants.get(funder_num, _shared["empty_grants"])
+
+        result = get_scores_and_reasonings(pairs_df, position, funder_grants_df, _shared["areas_df"], _shared["hierarchies_df"], _shared["encoder"])
+        fields = dict(zip(SCORE_FIELDS, result))
+        row = {col: fields[col] for col in BATCH_SCORE_COLUMNS}
+        row["final_score"] = combine_scores(result)
+        rows.append((position, row))
+
+    return rows
+
+def init_worker(shared):
+    _shared.update(shared)
+    use_ukcat_registry(shared["ukcat_registry"])
+
+def get_pool_context():
+    """
+    Gets a forkserver context where the platform has one, otherwise spawn, so workers never inherit the parent's torch and OpenMP threads.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        #import the scoring modules once in the server rather than in every worker
+        context.set_forkserver_preload(["evaluation_runner"])
+        return context
+
+    return multiprocessing.get_context("spawn")
+
+def run_evaluation(pairs_df, grants_df, areas_df, hierarchies_df, model, id_col=None, workers=None, chunk_size=50, progress_every=500):
+    """
+    Scores every pair of a pairs dataframe across a process pool and returns one dataframe, in the order of pairs_df,
+    with the pair id, component scores and final score.
+    Keywords are encoded once up front in this process, and workers start from a forkserver (or spawn) with the tables, embeddings and UK-CAT registry but not the model.
+    """
+    start_time = time.time()
+    workers = workers or os.cpu_count()
+
+    #prepare everything workers read
+    shared = {
+        "pairs_df": pairs_df,
+        "funder_grants": {funder_num: group for funder_num, group in grants_df.groupby("funder_num", sort=False)},
+        "empty_grants": grants_df.iloc[0:0],
+        "areas_df": areas_df,
+        "hierarchies_df": hierarchies_df,
+        "encoder": PrecomputedEncoder(model, get_all_keywords(pairs_df)),
+        "ukcat_registry": get_ukcat_registry()
+    }
+    chunks = make_chunks(pairs_df, chunk_size)
+
+    #collect results as chunks finish
+    rows = [None] * len(pairs_df)
+    scored = 0
+    def collect(chunk_rows):
+        nonlocal scored
+        for position, row in chunk_rows:
+            rows[position] = row
+        previous = scored
+        scored += len(chunk_rows)
+        if progress_every and scored // progress_every > previous // progress_every:
+            print(f"Scored {scored:,}/{len(pairs_df):,} pairs ({time.time() - start_time:.1f}s)")
+
+    if workers == 1 or len(chunks) <= 1:
+        _shared.update(shared)
+        try:
+            for chunk in chunks:
+                collect(score_chunk(chunk))
+        finally:
+            _shared.clear()
+    else:
+        with get_pool_context().Pool(workers, initializer=init_worker, initargs=(shared,)) as pool:
+            for chunk_rows in pool.imap_unordered(score_chunk, chunks):
+                collect(chunk_rows)
+
+    results_df = pd.DataFrame(rows, index=pairs_df.index, columns=BATCH_SCORE_COLUMNS + ["final_score"])
+    results_df.insert(0, "funder_registered_num", pairs_df["funder_registered_num"])
+    results_df.insert(1, "user_id", pairs_df["user_id"])
+    if id_col is not None:
+        results_df.insert(0, id_col, pairs_df[id_col])
+    print(f"Scored {len(pairs_df):,} pairs with {workers} workers in {time.time() - start_time:.2f}s")
+
+    return results_df
@@ -1,13 +1,51 @@
+import os
 import pandas as pd
 import numpy as np
 import json
-import time
-from supabase import create_client
+import urllib.request
+from supabase_client import get_supabase_client, get_rate_limiter
+from table_snapshots import invalidate_snapshots
 
-def pipe_to_supabase(df, table, unique_key, url, key, batch_size=1000, delay=0.5):
+def sanitise_column(values):
+    """
+    Converts a column to json-ready python values in one pass, with missing, NaN and infinite values as None.
+    """
+    if pd.api.types.is_integer_dtype(values.dtype) and pd.api.types.is_extension_array_dtype(values.dtype):
+        return values.to_numpy(dtype=object, na_value=None)
 
-    #create client instance
-    supabase = create_client(url, key)
+    #mask non-finite floats at column level
+    if pd.api.types.is_float_dtype(values.dtype):
+        array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+        converted = values.to_numpy().astype(object)
+        converted[~np.isfinite(array)] = None
+        return converted
+
+    converted = values.to_numpy(dtype=object, copy=True)
+    missing = pd.isna(converted)
+
+    #object columns can also hold stray infinite floats
+    if values.dtype == object:
+        missing |= np.array([isinstance(value, float) and np.isinf(value) for value in converted], dtype=bool)
+    if missing.any():
+        converted[missing] = None
+
+    return converted
+
+def iter_record_batches(df, batch_size=1000):
+    """
+    Yields json-ready batches of records lazily, sanitising one batch of rows at a time so memory stays bounded.
+    """
+    columns = list(df.columns)
+    for start in range(0, len(df), batch_size):
+        chunk = df.iloc[start:start + batch_size]
+        values = [sanitise_column(chunk.iloc[:, i]) for i in range(len(columns))]
+        yield [dict(zip(columns, row)) for row in zip(*values)]
+
+def pipe_to_supabase(df, table, unique_key, url, key, batch_size=1000):
+
+    #get shared client instance, paced by the shared rate limiter
+    supabase = get_supabase_client(url, key)
+    rate_limiter = get_rate_limiter()
 
     #check if dataframe is empty
     if df.empty or len(df) == 0:
@@ -23,53 +61,62 @@ def pipe_to_supabase(df, table, unique_key, url, key, batch_size=1000, delay=0.5
         #keep first occurrence of each duplicate
         df = df.drop_duplicates(subset=unique_cols, keep="first")
 
-    #convert ints
-    for col in df.columns:
-        if df[col].dtype == "Int64":
-            df[col] = df[col].apply(lambda x: int(x) if pd.notna(x) else None)
-
-    #handle json non-compliance
-    for col in df.columns:
-        if df[col].dtype in ['float64', 'float32']:
-            #replace inf and -inf with None
-            df[col] = df[col].replace([np.inf, -np.inf], None)
-            #replace NaN with None
-            df[col] = df[col].apply(lambda x: None if pd.isna(x) or (isinstance(x, float) and not np.isfinite(x)) else x)
-    df = df.where(pd.notna(df), None)
-
-    #make df into dictionaries to be readable by supabase
-    records = df.to_dict("records")
-
-    #additional json validation
-    for record in records:
-        for key, value in record.items():
-            if isinstance(value, float):
-                if np.isnan(value) or np.isinf(value):
-                    record[key] = None
-
     #batch upsert for large datasets
-    total_records = len(records)
+    total_records = len(df)
+    batch_num = 0
 
     try:
-        for i in range(0, total_records, batch_size):
-            batch = records[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            
+        for batch in iter_record_batches(df, batch_size):
+            batch_num += 1
+
+            #pipe batch to supabase
             try:
-                json.dumps(batch)
+                rate_limiter.wait()
+                supabase.table(table).upsert(batch, on_conflict = unique_key).execute()
             except (ValueError, TypeError) as json_err:
-                print(f"JSON validation failed for batch {batch_num}: {json_err}")
+                print(f"JSON serialisation failed for batch {batch_num}: {json_err}")
                 print(f"First record in batch: {batch[0]}")
                 raise
 
-            #pipe batch to supabase
-            supabase.table(table).upsert(batch, on_conflict = unique_key).execute()
-
-            #add delay
-            if i + batch_size < total_records:
-                time.sleep(delay)
-
         print(f"Successfully upserted all {total_records} records to {table}")
     except Exception as e:
         print(f"✗ Error upserting to {table} at batch {batch_num}: {e}")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        #drop local snapshots, as in-place updates keep the row count and max key the same
+        invalidate_snapshots(table)
+
+def get_changed_funders(tables):
+    """
+    Collects the registered numbers of the funders in a dictionary of upserted tables and their keys.
+    """
+    funder_nums = set()
+    for df, _ in tables.values():
+        if "registered_num" in df.columns:
+            funder_nums.update(str(num) for num in df["registered_num"].dropna().unique())
+
+    return sorted(funder_nums)
+
+def invalidate_score_cache(funder_nums, api_url, timeout=10, token=None):
+    """
+    Asks a running scoring API to reload its reference data and then evict its cached scores for the given funders, doing nothing if no api url is set.
+    The request is authorised with the token, or SCORE_API_TOKEN, and the API reloads in the background. Failures are reported but do not stop the pipeline.
+    """
+    if not api_url or not funder_nums:
+        return
+
+    headers = {"Content-Type": "application/json"}
+    token = token or os.getenv("SCORE_API_TOKEN")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    request = urllib.request.Request(
+        f"{api_url.rstrip('/')}/cache/invalidate",
+        data=json.dumps({"funder_registered_nums": list(funder_nums)}).encode("utf-8"),
+        headers=headers,
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            print(f"Asked the scoring API to reload and evict cached scores for {len(funder_nums)} funders: {response.read().decode('utf-8')}")
+    except Exception as e:
+        print(f"Warning: Could not invalidate score cache: {e}")
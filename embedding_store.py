@@ -0,0 +1,171 @@
+import base64
+import binascii
+import json
+import struct
+import numpy as np
+import pandas as pd
+from supabase_client import get_supabase_client, get_rate_limiter
+
+def embedding_to_array(embedding):
+    """
+    Converts a stored embedding to a float32 array, or None if it is missing (including empty or blank strings).
+    Accepts json/pgvector text, base64 or raw pgvector binary, lists and arrays, and raises ValueError for strings that are none of these.
+    """
+    if embedding is None:
+        return None
+    if isinstance(embedding, float) and np.isnan(embedding):
+        return None
+    if isinstance(embedding, (bytes, bytearray, memoryview)):
+        return decode_vector_binary(embedding)
+    if isinstance(embedding, str):
+        text = embedding.strip()
+        if not text:
+            return None
+        if text.startswith("["):
+            embedding = json.loads(text)
+        else:
+            try:
+                data = base64.b64decode(text, validate=True)
+            except binascii.Error:
+                raise ValueError(f"Embedding string is neither json/pgvector text nor base64: {text[:40]!r}")
+            return decode_vector_binary(data)
+
+    return np.asarray(embedding, dtype=np.float32).ravel()
+
+def decode_vector_binary(data):
+    """
+    Decodes pgvector's binary format (vector_send): a big-endian dimension and unused header, then big-endian float4 values.
+    """
+    if len(data) < 4:
+        raise ValueError(f"Embedding is not pgvector binary: {len(data)} bytes is too short for the header")
+    dim, _ = struct.unpack_from(">HH", data)
+    if len(data) != 4 + 4 * dim:
+        raise ValueError(f"Embedding is not pgvector binary: {len(data)} bytes does not hold {dim} float4 values")
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+def cosine_similarity(embedding_a, embedding_b):
+    """
+    Calculates the cosine similarity of two embeddings with numpy.
+    """
+    a = embedding_to_array(embedding_a)
+    b = embedding_to_array(embedding_b)
+
+    #clamp norms as sentence-transformers' cos_sim does
+    norms = max(float(np.linalg.norm(a)), 1e-12) * max(float(np.linalg.norm(b)), 1e-12)
+    return float(np.dot(a, b)) / norms
+
+class EmbeddingStore:
+    """
+    Decodes each embedding column of a table once into a contiguous float32 matrix, with a map from key to row.
+    """
+
+    def __init__(self, df, key_col=None, columns=None):
+        if columns is None:
+            columns = [col for col in df.columns if col.endswith("_em")]
+
+        #map keys to rows, keeping the first row for repeated keys
+        keys = df[key_col] if key_col is not None else df.index
+        self.row_index = {}
+        for row, key in enumerate(keys):
+            self.row_index.setdefault(key, row)
+
+        #decode each column into one matrix, leaving missing embeddings as zero rows
+        self.matrices = {}
+        self.present = {}
+        for col in columns:
+            vectors = [embedding_to_array(embedding) for embedding in df[col]]
+            dims = {len(vector) for vector in vectors if vector is not None}
+            if len(dims) > 1:
+                raise ValueError(f"Column '{col}' has embeddings of different sizes: {sorted(dims)}")
+            dim = dims.pop() if dims else 0
+
+            matrix = np.zeros((len(vectors), dim), dtype=np.float32)
+            present = np.zeros(len(vectors), dtype=bool)
+            for row, vector in enumerate(vectors):
+                if vector is not None:
+                    matrix[row] = vector
+                    present[row] = True
+            self.matrices[col] = matrix
+            self.present[col] = present
+
+    def get(self, col, key):
+        """
+        Returns the embedding for a key, or None if it is missing.
+        """
+        row = self.row_index.get(key)
+        if row is None or not self.present[col][row]:
+            return None
+        return self.matrices[col][row]
+
+    def as_series(self, col, index):
+        """
+        Returns a column as an object series of row views into the matrix, with None where the embedding is missing.
+        """
+        values = np.empty(len(self.present[col]), dtype=object)
+        matrix = self.matrices[col]
+        for row in np.flatnonzero(self.present[col]):
+            values[row] = matrix[row]
+
+        return pd.Series(values, index=index, name=col)
+
+def decode_embedding_columns(df, key_col=None, columns=None):
+    """
+    Decodes a table's embedding columns once at load, replacing them with views into contiguous matrices.
+    Returns the decoded copy of the table and its embedding store.
+    """
+    store = EmbeddingStore(df, key_col=key_col, columns=columns)
+    decoded_df = df.copy()
+    for col in store.matrices:
+        decoded_df[col] = store.as_series(col, df.index)
+
+    return decoded_df, store
+
+#the embedding columns get_embeddings_b64 can read, by table, with the key each is paged by (the allow-list in schema.sql)
+EMBEDDING_COLUMNS = {
+    "funders": ("registered_num", (
+        "name_em", "activities_em", "objectives_em", "objectives_activities_em", "achievements_performance_em", "grant_policy_em", "concat_em"
+    )),
+    "grants": ("grant_id", ("grant_title_em", "grant_desc_em", "grant_concat_em")),
+    "recipients": ("recipient_id", ("recipient_name_em", "recipient_activities_em", "recipient_objectives_em", "recipient_concat_em"))
+}
+
+def fetch_embeddings_base64(url, key, table_name, key_col, em_col, batch_size=1000):
+    """
+    Fetches one embedding column as base64 pgvector binary through the get_embeddings_b64 function, which is much smaller to send and faster to decode than text.
+    Only the columns in EMBEDDING_COLUMNS can be fetched. Returns a dataframe of keys and decoded embeddings.
+    """
+    table_key_col, em_cols = EMBEDDING_COLUMNS.get(table_name, (None, ()))
+    if key_col != table_key_col or em_col not in em_cols:
+        raise ValueError(f"get_embeddings_b64 cannot read {table_name}.{em_col} keyed by {key_col}; see EMBEDDING_COLUMNS")
+
+    #get shared client instance
+    supabase = get_supabase_client(url, key)
+    rate_limiter = get_rate_limiter()
+
+    keys = []
+    embeddings = []
+    last_key = None
+
+    while True:
+        rate_limiter.wait()
+        response = supabase.rpc("get_embeddings_b64", {
+            "table_name": table_name,
+            "key_col": key_col,
+            "em_col": em_col,
+            "after_key": last_key,
+            "batch_size": batch_size
+        }).execute()
+        data = response.data
+
+        if not data:
+            break
+
+        for row in data:
+            keys.append(row["key"])
+            embeddings.append(embedding_to_array(row["em_b64"]))
+        last_key = data[-1]["key"]
+
+        if len(data) < batch_size:
+            break
+
+    return pd.DataFrame({key_col: keys, em_col: embeddings})
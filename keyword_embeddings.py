@@ -0,0 +1,179 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+
+DEFAULT_MODEL_NAME = "all-roberta-large-v1"
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "keyword_embeddings.sqlite")
+
+class KeywordEmbeddingCache:
+    """
+    Caches normalised keyword embeddings in memory (LRU) and on disk, keyed by model name and keyword text.
+    """
+
+    def __init__(self, model, model_name=DEFAULT_MODEL_NAME, cache_path=DEFAULT_CACHE_PATH, max_size=20000):
+        self.model = model
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.connection = None
+
+        #open on-disk store
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            self.connection = sqlite3.connect(cache_path, check_same_thread=False)
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS keyword_embeddings ("
+                "model_name TEXT NOT NULL, keyword TEXT NOT NULL, embedding BLOB NOT NULL, "
+                "PRIMARY KEY (model_name, keyword))"
+            )
+            self.connection.commit()
+
+    def encode(self, keywords):
+        """
+        Returns a float32 matrix of normalised embeddings, one row per keyword, encoding only keywords not already cached.
+        """
+        keywords = [str(keyword) for keyword in keywords]
+        found = self.lookup(keywords)
+
+        #encode anything new in one batch
+        missing = [keyword for keyword in dict.fromkeys(keywords) if keyword not in found]
+        if missing:
+            encoded = normalise_rows(np.asarray(self.model.encode(missing), dtype=np.float32).reshape(len(missing), -1))
+            new_embeddings = dict(zip(missing, encoded))
+            self.store(new_embeddings)
+            found.update(new_embeddings)
+
+        if not keywords:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        return np.stack([found[keyword] for keyword in keywords])
+
+    def lookup(self, keywords):
+        """
+        Returns the cached embeddings of whichever keywords are in memory or on disk, without encoding the rest.
+        """
+        keywords = [str(keyword) for keyword in keywords]
+        found = {}
+
+        with self.lock:
+            #check memory
+            for keyword in keywords:
+                if keyword in self.memory:
+                    self.memory.move_to_end(keyword)
+                    found[keyword] = self.memory[keyword]
+
+            #check disk for the rest
+            missing = [keyword for keyword in dict.fromkeys(keywords) if keyword not in found]
+            if missing and self.connection is not None:
+                for keyword, embedding in self._read_disk(missing).items():
+                    self._remember(keyword, embedding)
+                    found[keyword] = embedding
+
+        return found
+
+    def store(self, embeddings):
+        """
+        Saves newly encoded, normalised embeddings in memory and on disk.
+        """
+        with self.lock:
+            self._write_disk(embeddings)
+            for keyword, embedding in embeddings.items():
+                self._remember(keyword, embedding)
+
+    def precompute(self, keywords, batch_size=512):
+        """
+        Encodes and stores a collection of keywords in batches, e.g. all funder keywords at data-prep time.
+        """
+        unique_keywords = list(dict.fromkeys(str(keyword) for keyword in keywords))
+        for i in range(0, len(unique_keywords), batch_size):
+            self.encode(unique_keywords[i:i + batch_size])
+
+        return len(unique_keywords)
+
+    def add(self, keywords, embeddings):
+        """
+        Puts already normalised embeddings into the memory cache, e.g. the keyword matrix of a compiled profile store.
+        """
+        with self.lock:
+            for keyword, embedding in zip(keywords, embeddings):
+                self._remember(str(keyword), embedding)
+
+    def _remember(self, keyword, embedding):
+        self.memory[keyword] = embedding
+        self.memory.move_to_end(keyword)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+
+    def _read_disk(self, keywords):
+        found = {}
+
+        #query in chunks to stay under sqlite's variable limit
+        for i in range(0, len(keywords), 500):
+            chunk = keywords[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"SELECT keyword, embedding FROM keyword_embeddings WHERE model_name = ? AND keyword IN ({placeholders})",
+                [self.model_name] + chunk
+            ).fetchall()
+            for keyword, blob in rows:
+                found[keyword] = np.frombuffer(blob, dtype=np.float32)
+
+        return found
+
+    def _write_disk(self, embeddings):
+        if self.connection is None:
+            return
+
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO keyword_embeddings (model_name, keyword, embedding) VALUES (?, ?, ?)",
+            [(self.model_name, keyword, embedding.astype(np.float32).tobytes()) for keyword, embedding in embeddings.items()]
+        )
+        self.connection.commit()
+
+def normalise_rows(matrix):
+    """
+    L2-normalises each row of a matrix, leaving all-zero rows as zeros.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+_caches = {}
+
+def get_model_cache_name(model):
+    """
+    Names a model's cached keyword embeddings after its name or path and runtime: the cache_name model_runtime sets, else the hub name
+    or path a sentence transformer was loaded from and its backend. Raises ValueError if the model cannot be identified, rather than
+    filing its vectors under another model's name.
+    """
+    cache_name = getattr(model, "cache_name", None)
+    if cache_name:
+        return cache_name
+
+    name_or_path = getattr(getattr(model, "model_card_data", None), "base_model", None)
+    if not name_or_path:
+        try:
+            name_or_path = model[0].auto_model.config._name_or_path
+        except (TypeError, KeyError, IndexError, AttributeError):
+            name_or_path = None
+    if not name_or_path:
+        raise ValueError(f"Cannot tell which model {type(model).__name__} is to cache its keyword embeddings, pass model_name or load it with model_runtime.load_model")
+
+    #sentence-transformers only ran on torch before it had backends
+    runtime = getattr(model, "runtime", None) or getattr(model, "backend", None) or "torch"
+
+    return f"{name_or_path}:{runtime}"
+
+def get_keyword_cache(model, model_name=None, cache_path=DEFAULT_CACHE_PATH):
+    """
+    Gets the shared keyword embedding cache for a loaded model, named after the model and its runtime unless model_name is given.
+    """
+    model_name = model_name or get_model_cache_name(model)
+    cache_key = (id(model), model_name, cache_path)
+    if cache_key not in _caches:
+        _caches[cache_key] = KeywordEmbeddingCache(model, model_name=model_name, cache_path=cache_path)
+
+    return _caches[cache_key]
@@ -0,0 +1,36 @@
+-- adds updated_at to funders, grants and recipients in databases created before schema.sql had it, for the snapshot freshness checks in utils.py
+-- (see WATERMARK_COLUMNS in table_snapshots.py). Safe to run more than once
+BEGIN;
+
+ALTER TABLE public.funders ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone;
+ALTER TABLE public.grants ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone;
+ALTER TABLE public.recipients ADD COLUMN IF NOT EXISTS updated_at timestamp with time zone;
+
+-- backfill existing rows, then require the column from now on
+UPDATE public.funders SET updated_at = now() WHERE updated_at IS NULL;
+UPDATE public.grants SET updated_at = now() WHERE updated_at IS NULL;
+UPDATE public.recipients SET updated_at = now() WHERE updated_at IS NULL;
+ALTER TABLE public.funders ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL;
+ALTER TABLE public.grants ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL;
+ALTER TABLE public.recipients ALTER COLUMN updated_at SET DEFAULT now(), ALTER COLUMN updated_at SET NOT NULL;
+
+-- bump updated_at on every write
+CREATE OR REPLACE FUNCTION public.set_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$;
+DROP TRIGGER IF EXISTS funders_set_updated_at ON public.funders;
+DROP TRIGGER IF EXISTS grants_set_updated_at ON public.grants;
+DROP TRIGGER IF EXISTS recipients_set_updated_at ON public.recipients;
+CREATE TRIGGER funders_set_updated_at BEFORE INSERT OR UPDATE ON public.funders FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+CREATE TRIGGER grants_set_updated_at BEFORE INSERT OR UPDATE ON public.grants FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+CREATE TRIGGER recipients_set_updated_at BEFORE INSERT OR UPDATE ON public.recipients FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+CREATE INDEX IF NOT EXISTS funders_updated_at_idx ON public.funders (updated_at);
+CREATE INDEX IF NOT EXISTS grants_updated_at_idx ON public.grants (updated_at);
+CREATE INDEX IF NOT EXISTS recipients_updated_at_idx ON public.recipients (updated_at);
+
+COMMIT;
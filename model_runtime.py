@@ -0,0 +1,245 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from keyword_embeddings import DEFAULT_MODEL_NAME
+
+RUNTIMES = ("torch", "onnx", "int8")
+DEFAULT_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "models")
+DEFAULT_QUANTIZATION = "avx2"
+WARM_UP_TEXTS = [
+    "warm up",
+    "to advance education and relieve poverty for the public benefit by making grants to charities working with young people"
+]
+
+def get_runtime_settings():
+    """
+    Reads the runtime, thread count and quantisation target from EMBEDDING_RUNTIME, EMBEDDING_THREADS and EMBEDDING_QUANTIZATION.
+    """
+    runtime = os.getenv("EMBEDDING_RUNTIME", "torch").lower()
+    threads = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+    quantization = os.getenv("EMBEDDING_QUANTIZATION", DEFAULT_QUANTIZATION)
+
+    return runtime, threads, quantization
+
+def get_export_path(model_name, export_dir=DEFAULT_EXPORT_DIR):
+    return os.path.join(export_dir, model_name.replace("/", "--") + "-onnx")
+
+def get_session_options(threads):
+    """
+    Builds onnxruntime session options limited to a number of threads.
+    """
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+
+    return options
+
+def export_model(model_name=DEFAULT_MODEL_NAME, export_dir=DEFAULT_EXPORT_DIR, quantization=DEFAULT_QUANTIZATION):
+    """
+    Exports the model to an ONNX graph and a dynamically int8-quantised copy once, returning the folder holding both.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    path = get_export_path(model_name, export_dir)
+    exported = [os.path.join(path, "onnx", "model.onnx"), os.path.join(path, "model.onnx")]
+    if not any(os.path.exists(file_path) for file_path in exported):
+        start_time = time.time()
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        model.save(path)
+        print(f"Exported {model_name} to ONNX in {time.time() - start_time:.1f}s")
+
+    if not os.path.exists(os.path.join(path, "onnx", f"model_qint8_{quantization}.onnx")):
+        start_time = time.time()
+        model = SentenceTransformer(path, device="cpu", backend="onnx")
+        export_dynamic_quantized_onnx_model(model, quantization, path)
+        print(f"Quantised {model_name} to int8 ({quantization}) in {time.time() - start_time:.1f}s")
+
+    return path
+
+def warm_up_model(model, texts=WARM_UP_TEXTS):
+    """
+    Encodes a few texts so the first request does not pay for lazy initialisation, returning the time taken.
+    """
+    start_time = time.time()
+    for text in texts:
+        model.encode(text)
+    model.encode(texts)
+
+    return time.time() - start_time
+
+def load_model(model_name=DEFAULT_MODEL_NAME, runtime=None, threads=None, quantization=None, warm_up=True, export_dir=DEFAULT_EXPORT_DIR):
+    """
+    Loads the sentence transformer on CPU with fp32 torch, an ONNX graph or an int8-quantised ONNX graph, defaulting to the environment settings.
+    The model is tagged with a cache name per runtime so cached keyword embeddings from different runtimes are not mixed.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    env_runtime, env_threads, env_quantization = get_runtime_settings()
+    runtime = (runtime or env_runtime).lower()
+    threads = threads or env_threads
+    quantization = quantization or env_quantization
+    if runtime not in RUNTIMES:
+        raise ValueError(f"Unknown embedding runtime '{runtime}', expected one of {', '.join(RUNTIMES)}")
+
+    start_time = time.time()
+    if runtime == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name, device="cpu")
+        model.cache_name = model_name
+    else:
+        path = export_model(model_name, export_dir, quantization)
+        model_kwargs = {"provider": "CPUExecutionProvider"}
+        if runtime == "int8":
+            model_kwargs["file_name"] = os.path.join("onnx", f"model_qint8_{quantization}.onnx")
+        if threads:
+            model_kwargs["session_options"] = get_session_options(threads)
+        model = SentenceTransformer(path, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        model.cache_name = f"{model_name}:{runtime}" if runtime == "onnx" else f"{model_name}:int8-{quantization}"
+    model.runtime = runtime
+
+    message = f"Loaded {model_name} ({runtime}) in {time.time() - start_time:.1f}s"
+    if warm_up:
+        message += f", warmed up in {warm_up_model(model):.2f}s"
+    print(message)
+
+    return model
+
+def encode_texts(model, texts):
+    """
+    Encodes texts as an fp32 matrix, returning it and the encode time per text.
+    """
+    start_time = time.time()
+    ems = np.asarray(model.encode(texts), dtype=np.float32)
+
+    return ems, (time.time() - start_time) / max(len(texts), 1)
+
+def get_pair_similarities(funder_ems, recipient_ems):
+    """
+    Returns the cosine similarity of each funder and recipient embedding pair.
+    """
+
+    #clamp norms as sentence-transformers' cos_sim does
+    norms = np.maximum(np.linalg.norm(funder_ems, axis=1), 1e-12) * np.maximum(np.linalg.norm(recipient_ems, axis=1), 1e-12)
+
+    return np.einsum("ij,ij->i", funder_ems, recipient_ems) / norms
+
+def summarise_differences(sims, baseline_sims):
+    """
+    Gets the largest and mean absolute difference of cosine scores from the fp32 baseline.
+    """
+    differences = np.abs(sims - baseline_sims)
+    if not len(differences):
+        return 0.0, 0.0
+
+    return float(differences.max()), float(differences.mean())
+
+def check_runtime_accuracy(
+    model,
+    baseline_model,
+    funders_df,
+    recipients_df,
+    embedding_pairs,
+    funder_text_col="funders_text",
+    recipient_text_col="recipients_text",
+    rating_col="my_rating"
+):
+    """
+    Compares a model's cosine scores on the embedding pairs against the fp32 baseline, returning a summary and the pairs with their scores.
+    As the service scores users encoded at request time against funder and recipient vectors stored in fp32, the mixed scores pair each
+    side's fp32 embedding with the other side's runtime embedding.
+    """
+
+    #align pairs as the model selection tests do
+    aligned_pairs = embedding_pairs.merge(
+        funders_df[["registered_num", funder_text_col]],
+        left_on="funder_registered_num",
+        right_on="registered_num",
+        how="left"
+    ).merge(
+        recipients_df[["recipient_id", recipient_text_col]],
+        on="recipient_id",
+        how="left"
+    )
+    funder_texts = aligned_pairs[funder_text_col].fillna("").tolist()
+    recipient_texts = aligned_pairs[recipient_text_col].fillna("").tolist()
+
+    #encode with both models
+    baseline_ems, baseline_seconds = encode_texts(baseline_model, funder_texts + recipient_texts)
+    baseline_funder_ems, baseline_recipient_ems = baseline_ems[:len(funder_texts)], baseline_ems[len(funder_texts):]
+    runtime_ems, seconds = encode_texts(model, funder_texts + recipient_texts)
+    funder_ems, recipient_ems = runtime_ems[:len(funder_texts)], runtime_ems[len(funder_texts):]
+
+    #score runtime against runtime, and stored fp32 vectors against runtime-encoded users
+    baseline_sims = get_pair_similarities(baseline_funder_ems, baseline_recipient_ems)
+    sims = get_pair_similarities(funder_ems, recipient_ems)
+    mixed_sims = np.concatenate([
+        get_pair_similarities(baseline_funder_ems, recipient_ems),
+        get_pair_similarities(funder_ems, baseline_recipient_ems)
+    ])
+    aligned_pairs["baseline_sim"] = baseline_sims
+    aligned_pairs["runtime_sim"] = sims
+    aligned_pairs["mixed_funder_sim"] = mixed_sims[:len(sims)]
+    aligned_pairs["mixed_recipient_sim"] = mixed_sims[len(sims):]
+    max_abs_diff, mean_abs_diff = summarise_differences(sims, baseline_sims)
+    mixed_max_abs_diff, mixed_mean_abs_diff = summarise_differences(mixed_sims, np.concatenate([baseline_sims, baseline_sims]))
+
+    summary = {
+        "runtime": getattr(model, "runtime", None),
+        "pairs": len(aligned_pairs),
+        "max_abs_diff": max_abs_diff,
+        "mean_abs_diff": mean_abs_diff,
+        "mixed_max_abs_diff": mixed_max_abs_diff,
+        "mixed_mean_abs_diff": mixed_mean_abs_diff,
+        "baseline_corr": float(np.corrcoef(baseline_sims, sims)[0, 1]) if len(sims) > 1 else 1.0,
+        "baseline_ms_per_text": baseline_seconds * 1000,
+        "runtime_ms_per_text": seconds * 1000
+    }
+    if rating_col in aligned_pairs:
+        summary["baseline_rating_corr"] = aligned_pairs[rating_col].corr(aligned_pairs["baseline_sim"])
+        summary["runtime_rating_corr"] = aligned_pairs[rating_col].corr(aligned_pairs["runtime_sim"])
+        summary["mixed_rating_corr"] = aligned_pairs[rating_col].corr(aligned_pairs["mixed_funder_sim"])
+
+    return summary, aligned_pairs
+
+def load_embedding_pairs(checkpoint_folder):
+    """
+    Loads the model selection checkpoints and builds the text columns of the chosen approach (activities and objectives, plus the funder's objectives and activities section).
+    """
+    funders_df = pd.read_pickle(os.path.join(checkpoint_folder, "funders_df.pkl"))
+    recipients_df = pd.read_pickle(os.path.join(checkpoint_folder, "recipients_df.pkl"))
+    embedding_pairs = pd.read_pickle(os.path.join(checkpoint_folder, "embedding_pairs.pkl"))
+
+    recipients_df["recipients_text"] = recipients_df["recipient_activities"].fillna("") + "" + recipients_df["recipient_objectives"].fillna("").str.lower()
+    funders_df["funders_text"] = funders_df["activities"].fillna("") + "" + funders_df["objectives"].fillna("") + "" + funders_df["objectives_activities"].fillna("").str.lower()
+
+    return funders_df, recipients_df, embedding_pairs
+
+def main():
+    parser = argparse.ArgumentParser(description="Check ONNX and int8 runtimes against the fp32 model on the embedding pairs.")
+    parser.add_argument("--runtimes", nargs="+", default=["onnx", "int8"], choices=RUNTIMES)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--tolerance", type=float, default=0.02, help="largest allowed difference in cosine score from fp32")
+    parser.add_argument("--checkpoints", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "07_model_and_approach_selection", "7.1_checkpoints"))
+    args = parser.parse_args()
+
+    funders_df, recipients_df, embedding_pairs = load_embedding_pairs(args.checkpoints)
+    baseline_model = load_model(runtime="torch", threads=args.threads)
+
+    failed = False
+    for runtime in args.runtimes:
+        model = load_model(runtime=runtime, threads=args.threads)
+        summary, _ = check_runtime_accuracy(model, baseline_model, funders_df, recipients_df, embedding_pairs)
+        passed = max(summary["max_abs_diff"], summary["mixed_max_abs_diff"]) <= args.tolerance
+        failed = failed or not passed
+        print(", ".join(f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}" for name, value in summary.items()) + ("" if passed else " - FAILED"))
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
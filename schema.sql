@@ -120,6 +120,7 @@ CREATE TABLE public.funders (
   grant_policy_em USER-DEFINED,
   concat_em USER-DEFINED,
   extracted_class text,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
   CONSTRAINT funders_pkey PRIMARY KEY (registered_num)
 );
 CREATE TABLE public.grants (
@@ -133,6 +134,7 @@ CREATE TABLE public.grants (
   grant_desc_em USER-DEFINED,
   grant_concat_em USER-DEFINED,
   grant_extracted_class text,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
   CONSTRAINT grants_pkey PRIMARY KEY (grant_id)
 );
 CREATE TABLE public.list_entries (
@@ -189,5 +191,63 @@ CREATE TABLE public.recipients (
   recipient_objectives_em USER-DEFINED,
   recipient_concat_em USER-DEFINED,
   recipient_extracted_class text,
+  updated_at timestamp with time zone NOT NULL DEFAULT now(),
   CONSTRAINT recipients_pkey PRIMARY KEY (recipient_id)
-);
\ No newline at end of file
+);
+-- top-k funder prefilter over concat_em, used by 11_backend/funder_ranking.py
+CREATE INDEX funders_concat_em_idx ON public.funders USING hnsw (concat_em vector_cosine_ops);
+CREATE OR REPLACE FUNCTION public.match_funders(query_embedding vector, match_count integer)
+RETURNS TABLE (registered_num character varying, similarity double precision)
+LANGUAGE sql STABLE AS $$
+  SELECT registered_num, 1 - (concat_em <=> query_embedding) AS similarity
+  FROM public.funders
+  WHERE concat_em IS NOT NULL
+  ORDER BY concat_em <=> query_embedding
+  LIMIT match_count;
+$$;
+
+-- embeddings as base64 pgvector binary, keyset-paged by key, used by embedding_store.py
+-- only reads the embedding columns allow-listed here (EMBEDDING_COLUMNS in embedding_store.py), and runs as the caller so row level security still applies
+CREATE OR REPLACE FUNCTION public.get_embeddings_b64(table_name text, key_col text, em_col text, after_key text, batch_size integer)
+RETURNS TABLE (key text, em_b64 text)
+LANGUAGE plpgsql STABLE SECURITY INVOKER AS $$
+BEGIN
+  IF (table_name, key_col, em_col) NOT IN (
+    ('funders', 'registered_num', 'name_em'), ('funders', 'registered_num', 'activities_em'), ('funders', 'registered_num', 'objectives_em'),
+    ('funders', 'registered_num', 'objectives_activities_em'), ('funders', 'registered_num', 'achievements_performance_em'),
+    ('funders', 'registered_num', 'grant_policy_em'), ('funders', 'registered_num', 'concat_em'),
+    ('grants', 'grant_id', 'grant_title_em'), ('grants', 'grant_id', 'grant_desc_em'), ('grants', 'grant_id', 'grant_concat_em'),
+    ('recipients', 'recipient_id', 'recipient_name_em'), ('recipients', 'recipient_id', 'recipient_activities_em'),
+    ('recipients', 'recipient_id', 'recipient_objectives_em'), ('recipients', 'recipient_id', 'recipient_concat_em')
+  ) THEN
+    RAISE EXCEPTION 'get_embeddings_b64 cannot read %.% keyed by %', table_name, em_col, key_col USING ERRCODE = 'insufficient_privilege';
+  END IF;
+  IF batch_size IS NULL OR batch_size < 1 OR batch_size > 10000 THEN
+    RAISE EXCEPTION 'batch_size must be between 1 and 10000' USING ERRCODE = 'invalid_parameter_value';
+  END IF;
+
+  RETURN QUERY EXECUTE format(
+    'SELECT %1$I::text, encode(vector_send(%2$I), ''base64'') FROM public.%3$I
+     WHERE %2$I IS NOT NULL AND ($1 IS NULL OR %1$I::text > $1)
+     ORDER BY %1$I::text LIMIT $2',
+    key_col, em_col, table_name)
+  USING after_key, batch_size;
+END;
+$$;
+
+-- bumps updated_at on every write, so snapshot freshness checks in utils.py catch in-place updates (see WATERMARK_COLUMNS in table_snapshots.py)
+-- existing databases get the column, backfill and triggers from migrations/001_add_updated_at.sql
+CREATE OR REPLACE FUNCTION public.set_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$;
+CREATE TRIGGER funders_set_updated_at BEFORE INSERT OR UPDATE ON public.funders FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+CREATE TRIGGER grants_set_updated_at BEFORE INSERT OR UPDATE ON public.grants FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+CREATE TRIGGER recipients_set_updated_at BEFORE INSERT OR UPDATE ON public.recipients FOR EACH ROW EXECUTE FUNCTION public.set_updated_at();
+CREATE INDEX funders_updated_at_idx ON public.funders (updated_at);
+CREATE INDEX grants_updated_at_idx ON public.grants (updated_at);
+CREATE INDEX recipients_updated_at_idx ON public.recipients (updated_at);
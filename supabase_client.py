@@ -0,0 +1,63 @@
+import os
+import time
+import threading
+from supabase import create_client
+
+DEFAULT_RATE_LIMIT = 10
+
+class RateLimiter:
+    """
+    Spaces requests evenly at up to a given number per second, across every thread sharing the limiter.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """
+        Sets the requests allowed per second, with 0 or None for no limit.
+        """
+        self.interval = 1.0 / rate if rate else 0.0
+
+    def wait(self):
+        """
+        Blocks until the caller may send its next request.
+        """
+        with self.lock:
+            now = self.clock()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+
+        if start > now:
+            self.sleep(start - now)
+
+#process-wide clients and rate limit
+_clients = {}
+_clients_lock = threading.Lock()
+_rate_limiter = None
+
+def get_supabase_client(url, key):
+    """
+    Gets the shared client for a project and key, so every request reuses its pooled HTTP connections.
+    """
+    with _clients_lock:
+        if (url, key) not in _clients:
+            _clients[(url, key)] = create_client(url, key)
+
+        return _clients[(url, key)]
+
+def get_rate_limiter():
+    """
+    Gets the process-wide rate limiter, allowing SUPABASE_RATE_LIMIT requests per second (default 10).
+    """
+    global _rate_limiter
+    with _clients_lock:
+        #read the limit on first use, after any .env has been loaded
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(float(os.getenv("SUPABASE_RATE_LIMIT", DEFAULT_RATE_LIMIT)))
+
+        return _rate_limiter
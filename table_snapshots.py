@@ -0,0 +1,140 @@
+import os
+import json
+import glob
+import time
+import hashlib
+import numpy as np
+from embedding_store import embedding_to_array
+
+DEFAULT_SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "tables")
+
+#columns bumped on every write by a trigger (see schema.sql), per table, to also catch in-place updates that keep the row count and max key
+WATERMARK_COLUMNS = {
+    "funders": "updated_at",
+    "grants": "updated_at",
+    "recipients": "updated_at"
+}
+
+def get_snapshot_dir(snapshot=None):
+    """
+    Resolves a snapshot argument to a folder: a path is used as is, True uses SUPABASE_SNAPSHOT_DIR or the default, None uses SUPABASE_SNAPSHOT_DIR if set, False turns snapshots off.
+    """
+    if snapshot is False:
+        return None
+    if isinstance(snapshot, str):
+        return snapshot
+    if snapshot is True:
+        return os.getenv("SUPABASE_SNAPSHOT_DIR") or DEFAULT_SNAPSHOT_DIR
+
+    return os.getenv("SUPABASE_SNAPSHOT_DIR") or None
+
+def get_snapshot_path(snapshot_dir, table_name, params):
+    """
+    Gets the path, without extension, of a table's snapshot for one set of query parameters (columns, filters).
+    """
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(snapshot_dir, f"{table_name}-{digest}")
+
+def read_snapshot(path, token):
+    """
+    Reads a snapshot if it was saved with the same freshness token, else returns None.
+    Embedding columns come back as float32 arrays (views into one matrix per column), or None where missing.
+    """
+    if not os.path.exists(path + ".json") or not os.path.exists(path + ".parquet"):
+        return None
+    with open(path + ".json") as f:
+        meta = json.load(f)
+    if meta["token"] != json.loads(json.dumps(token, default=str)):
+        return None
+
+    import pyarrow.parquet as pq
+    table = pq.read_table(path + ".parquet")
+    embedding_cols = meta["embedding_columns"]
+    df = table.drop(list(embedding_cols)).to_pandas()
+
+    #rebuild embeddings from the flat float32 values
+    for col, dim in embedding_cols.items():
+        column = table.column(col).combine_chunks()
+        matrix = column.flatten().to_numpy().reshape(-1, dim)
+        valid = column.is_valid().to_numpy(zero_copy_only=False)
+        embeddings = np.empty(len(column), dtype=object)
+        embeddings[np.flatnonzero(valid)] = list(matrix)
+        df[col] = embeddings
+
+    #restore columns stored as json
+    for col in meta["json_columns"]:
+        df[col] = [json.loads(value) if isinstance(value, str) else None for value in df[col]]
+
+    return df[meta["columns"]]
+
+def write_snapshot(path, df, token, table_name, params):
+    """
+    Saves a table as Parquet, with *_em columns as fixed-size float32 lists, alongside its freshness token.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrays = []
+    embedding_cols = {}
+    json_cols = []
+    for col in df.columns:
+        values = df[col]
+
+        #store embeddings as fixed-size float32 lists
+        if col.endswith("_em"):
+            embeddings = [embedding_to_array(value) for value in values]
+            dims = {len(embedding) for embedding in embeddings if embedding is not None}
+            if len(dims) == 1:
+                dim = dims.pop()
+                valid = np.array([embedding is not None for embedding in embeddings], dtype=bool)
+                matrix = np.zeros((len(embeddings), dim), dtype=np.float32)
+                if valid.any():
+                    matrix[valid] = np.stack([embedding for embedding in embeddings if embedding is not None])
+                flat = pa.array(matrix.ravel(), type=pa.float32())
+                arrays.append(pa.FixedSizeListArray.from_arrays(flat, dim, mask=pa.array(~valid)))
+                embedding_cols[col] = dim
+                continue
+
+        #keep json lists and dicts as json, as arrow would read them back as arrays, and fall back to json for columns it cannot type
+        is_json = values.dtype == object and any(isinstance(value, (list, dict)) for value in values)
+        if not is_json:
+            try:
+                arrays.append(pa.array(values, from_pandas=True))
+                continue
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                pass
+        arrays.append(pa.array([None if value is None or (isinstance(value, float) and np.isnan(value)) else json.dumps(value, default=str) for value in values], type=pa.string()))
+        json_cols.append(col)
+
+    table = pa.Table.from_arrays(arrays, names=[str(col) for col in df.columns])
+    meta = {
+        "table": table_name,
+        "params": params,
+        "token": token,
+        "rows": len(df),
+        "columns": list(df.columns),
+        "embedding_columns": embedding_cols,
+        "json_columns": json_cols,
+        "saved_at": time.time()
+    }
+
+    #write to temporary files and swap in, so readers never see a partial snapshot
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path + ".parquet.tmp")
+    with open(path + ".json.tmp", "w") as f:
+        json.dump(meta, f, default=str)
+    os.replace(path + ".parquet.tmp", path + ".parquet")
+    os.replace(path + ".json.tmp", path + ".json")
+
+def invalidate_snapshots(table_name, snapshot_dir=None):
+    """
+    Deletes every local snapshot of a table, e.g. after upserting to it, returning how many were removed.
+    """
+    snapshot_dir = snapshot_dir or get_snapshot_dir(True)
+    paths = glob.glob(os.path.join(glob.escape(snapshot_dir), f"{glob.escape(table_name)}-*.json"))
+    for path in paths:
+        for file_path in [path, path[:-len(".json")] + ".parquet"]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    return len(paths)
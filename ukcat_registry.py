@@ -0,0 +1,173 @@
+import os
+import re
+import sys
+import json
+import hashlib
+import urllib.request
+import pandas as pd
+
+#raw csv at a pinned commit of the UK-CAT repo, so a snapshot always holds the same taxonomy
+UKCAT_URL = "https://raw.githubusercontent.com/lico27/ukcat/{commit}/data/ukcat.csv"
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ukcat")
+#records the pinned commit and the sha256 of its csv, committed alongside the snapshot
+LOCK_PATH = os.path.join(SNAPSHOT_DIR, "ukcat.lock.json")
+
+class UkcatRegistry:
+    """
+    UK-CAT tags indexed for scoring and classification: upper-cased tag levels and compiled include/exclude patterns.
+    """
+
+    def __init__(self, ukcat_df, version=None):
+        self.version = version
+        self.ukcat_df = ukcat_df
+
+        #map upper-cased tags to their level, keeping the first row for repeated tags
+        self.tag_levels = {}
+        for tag, level in zip(ukcat_df["tag"], ukcat_df["level"]):
+            if pd.notna(tag):
+                self.tag_levels.setdefault(str(tag).upper(), level)
+
+        #compile patterns once, skipping any that are invalid
+        self.patterns = []
+        for tag, pattern, exclude_pattern in zip(ukcat_df["tag"], ukcat_df["Regular expression"], ukcat_df["Exclude regular expression"]):
+            if pd.isna(pattern) or not pattern:
+                continue
+            try:
+                include_regex = re.compile(pattern, re.IGNORECASE)
+                exclude_regex = re.compile(exclude_pattern, re.IGNORECASE) if pd.notna(exclude_pattern) and exclude_pattern else None
+            except re.error:
+                continue
+            self.patterns.append((tag, include_regex, exclude_regex))
+
+    def get_level(self, keyword):
+        """
+        Returns the UK-CAT level for a tag, ignoring case, or None if it is not a tag.
+        """
+        return self.tag_levels.get(str(keyword).upper())
+
+    def match_tags(self, text):
+        """
+        Returns the tags whose pattern matches the text and whose exclude pattern does not.
+        """
+        matched = []
+        for tag, include_regex, exclude_regex in self.patterns:
+            if include_regex.search(text):
+                if exclude_regex is not None and exclude_regex.search(text):
+                    continue
+                matched.append(tag)
+
+        return matched
+
+def get_snapshot_path(commit):
+    """
+    Gets the path of the local UK-CAT snapshot for a commit.
+    """
+    return os.path.join(SNAPSHOT_DIR, f"ukcat-{commit}.csv")
+
+def read_lock():
+    """
+    Reads the pinned commit, url and checksum of the UK-CAT snapshot, or None if nothing is pinned.
+    """
+    if not os.path.exists(LOCK_PATH):
+        return None
+    with open(LOCK_PATH) as f:
+        return json.load(f)
+
+def get_sha256(content):
+    return hashlib.sha256(content).hexdigest()
+
+def download_ukcat_snapshot(commit, expected_sha256=None):
+    """
+    Downloads the UK-CAT csv at a commit and saves it as a local snapshot, checking it against the expected checksum if given.
+    Without one, pins the commit and the csv's checksum in the lock file.
+    """
+    if not re.fullmatch(r"[0-9a-f]{40}", commit):
+        raise ValueError(f"UK-CAT must be pinned to a full commit sha, not '{commit}'")
+    url = UKCAT_URL.format(commit=commit)
+    with urllib.request.urlopen(url, timeout=60) as response:
+        content = response.read()
+
+    sha256 = get_sha256(content)
+    if expected_sha256 is not None and sha256 != expected_sha256:
+        raise ValueError(f"UK-CAT csv at {url} has sha256 {sha256}, expected {expected_sha256}")
+
+    #check it parses before saving
+    path = get_snapshot_path(commit)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    UkcatRegistry(pd.read_csv(tmp_path))
+    os.replace(tmp_path, path)
+
+    if expected_sha256 is None:
+        with open(LOCK_PATH, "w") as f:
+            json.dump({"commit": commit, "url": url, "sha256": sha256}, f, indent=2)
+            f.write("\n")
+
+    return path
+
+def load_ukcat_registry(download=False):
+    """
+    Loads the UK-CAT registry from the pinned local snapshot, checking its checksum.
+    Never touches the network unless download is set, when a missing snapshot is fetched from the pinned commit.
+    """
+    lock = read_lock()
+    if lock is None:
+        raise FileNotFoundError(f"No UK-CAT snapshot is pinned in {LOCK_PATH} - run 'python ukcat_registry.py <commit sha>' and commit data/ukcat")
+
+    path = get_snapshot_path(lock["commit"])
+    if not os.path.exists(path):
+        if not download:
+            raise FileNotFoundError(f"UK-CAT snapshot not found at {path} - run 'python ukcat_registry.py {lock['commit']}' to download it")
+        download_ukcat_snapshot(lock["commit"], expected_sha256=lock["sha256"])
+
+    with open(path, "rb") as f:
+        sha256 = get_sha256(f.read())
+    if sha256 != lock["sha256"]:
+        raise ValueError(f"UK-CAT snapshot {path} has sha256 {sha256}, but {LOCK_PATH} pins {lock['sha256']}")
+
+    return UkcatRegistry(pd.read_csv(path), version=lock["commit"])
+
+_registry = {}
+
+def get_ukcat_registry():
+    """
+    Gets the shared UK-CAT registry, loading the pinned snapshot on first use.
+    """
+    if "registry" not in _registry:
+        _registry["registry"] = load_ukcat_registry()
+
+    return _registry["registry"]
+
+def use_ukcat_registry(registry):
+    """
+    Replaces the shared UK-CAT registry, e.g. with one built from synthetic data for benchmarks.
+    Returns the registry it replaced, or None.
+    """
+    previous = _registry.get("registry")
+    _registry["registry"] = registry
+
+    return previous
+
+def as_ukcat_registry(ukcat):
+    """
+    Accepts a registry or a UK-CAT dataframe and returns a registry, building it once per dataframe.
+    """
+    if isinstance(ukcat, UkcatRegistry):
+        return ukcat
+
+    #keep a reference to the dataframe so its id cannot be reused
+    if _registry.get("frame") is not ukcat:
+        _registry["frame"] = ukcat
+        _registry["frame_registry"] = UkcatRegistry(ukcat)
+
+    return _registry["frame_registry"]
+
+if __name__ == "__main__":
+    #pin a new commit, or fetch the pinned one if no commit is given
+    if len(sys.argv) > 1:
+        print(f"Pinned UK-CAT snapshot {download_ukcat_snapshot(sys.argv[1])}")
+    else:
+        load_ukcat_registry(download=True)
+        print(f"UK-CAT snapshot {get_snapshot_path(read_lock()['commit'])} matches {LOCK_PATH}")
@@ -1,7 +1,10 @@
 import pandas as pd
-from supabase import create_client
 import time
 import re
+from concurrent.futures import ThreadPoolExecutor
+from supabase_client import get_supabase_client, get_rate_limiter
+from table_snapshots import WATERMARK_COLUMNS, get_snapshot_dir, get_snapshot_path, read_snapshot, write_snapshot
+from ukcat_registry import as_ukcat_registry
 
 def clean_data(tables, upper_cols, int_cols):
     """
@@ -61,79 +64,268 @@ def clean_data(tables, upper_cols, int_cols):
 
     return tables
 
-def get_table_from_supabase(url, key, table_name, batch_size=1000, delay=0.2, filter_recipients=False):
-    """
-    Fetches table data from Supabase with batching to avoid timeouts
-    """
-
-    PRIMARY_KEYS = {
-        "recipients": "recipient_id",
-        "funders": "registered_num",
-        "grants": "grant_id",
-        "evaluation_pairs": "id",
-        "beneficiaries": "ben_id",
-        "causes": "cause_id",
-        "areas": "area_id",
-        "financials": "financials_id",
-        "list_entries": "list_id",
-        "funder_causes": "funder_causes_id",
-        "funder_areas": "funder_areas_id",
-        "funder_beneficiaries": "funder_ben_id",
-        "funder_grants": "funder_grants_id",
-        "funder_financials": "funder_fin_id",
-        "funder_list": "funder_list_id",
-        "recipient_grants": "recipient_grants_id",
-        "recipient_areas": "recipient_areas_id",
-        "recipient_beneficiaries": "recipient_ben_id",
-        "recipient_causes": "recipient_cause_id",
-        "embedding_pairs": "id",
-        "logic_pairs": "id",
-        "area_hierarchy": "parent_area_id",
-        "evaluation_responses": "id"
-    }
-
-    #create client instance
-    supabase = create_client(url, key)
+#ordering columns for each table, a tuple where the primary key is composite
+PRIMARY_KEYS = {
+    "recipients": "recipient_id",
+    "funders": "registered_num",
+    "grants": "grant_id",
+    "evaluation_pairs": "id",
+    "beneficiaries": "ben_id",
+    "causes": "cause_id",
+    "areas": "area_id",
+    "financials": "financials_id",
+    "list_entries": "list_id",
+    "funder_causes": "funder_causes_id",
+    "funder_areas": "funder_areas_id",
+    "funder_beneficiaries": "funder_ben_id",
+    "funder_grants": "funder_grants_id",
+    "funder_financials": "funder_fin_id",
+    "funder_list": "funder_list_id",
+    "recipient_grants": "recipient_grants_id",
+    "recipient_areas": "recipient_areas_id",
+    "recipient_beneficiaries": "recipient_ben_id",
+    "recipient_causes": "recipient_cause_id",
+    "embedding_pairs": "id",
+    "logic_pairs": "id",
+    "area_hierarchy": ("parent_area_id", "child_area_id"),
+    "evaluation_responses": "id"
+}
+
+def get_key_columns(table_name):
+    """
+    Gets a table's ordering columns as a list.
+    """
+    if table_name not in PRIMARY_KEYS:
+        raise ValueError(f"Unknown table '{table_name}' - please add ordering column to PRIMARY_KEYS")
+
+    key_cols = PRIMARY_KEYS[table_name]
+    return list(key_cols) if isinstance(key_cols, tuple) else [key_cols]
+
+def quote_filter_value(value):
+    """
+    Quotes a value for a PostgREST or() filter, so commas, dots and brackets in ids are read literally.
+    """
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def filter_after_key(query, key_cols, last_key):
+    """
+    Filters a query to the rows after the last key seen, in key order.
+    """
+    if len(key_cols) == 1:
+        return query.gt(key_cols[0], last_key[0])
+
+    #(a, b) > (x, y) as a > x or (a = x and b > y)
+    conditions = []
+    for i, col in enumerate(key_cols):
+        equal = [f"{prev_col}.eq.{quote_filter_value(value)}" for prev_col, value in zip(key_cols[:i], last_key)]
+        greater = f"{col}.gt.{quote_filter_value(last_key[i])}"
+        conditions.append(f"and({','.join(equal + [greater])})" if equal else greater)
+
+    return query.or_(",".join(conditions))
+
+#postgrest query methods for each filter operator
+FILTER_METHODS = {
+    "eq": "eq", "neq": "neq", "gt": "gt", "gte": "gte", "lt": "lt", "lte": "lte", "like": "like", "ilike": "ilike",
+    "is": "is_", "in": "in_", "contains": "contains", "overlaps": "overlaps"
+}
+
+_table_columns = {}
+
+def get_table_columns(url, key, table_name):
+    """
+    Gets a table's column names from its first row, cached per project and table, or None if the table is empty.
+    """
+    if (url, table_name) not in _table_columns:
+        get_rate_limiter().wait()
+        data = get_supabase_client(url, key).table(table_name).select("*").limit(1).execute().data
+        if not data:
+            return None
+        _table_columns[(url, table_name)] = list(data[0].keys())
+
+    return _table_columns[(url, table_name)]
+
+def get_select_columns(url, key, table_name, columns=None, exclude_embeddings=False):
+    """
+    Gets the columns to select, leaving out the *_em vector columns with exclude_embeddings, or None to select everything.
+    """
+    if isinstance(columns, str):
+        columns = [col.strip() for col in columns.split(",")]
+    if columns is None and exclude_embeddings:
+        columns = get_table_columns(url, key, table_name)
+    if columns is None:
+        return None
+    if exclude_embeddings:
+        columns = [col for col in columns if not col.endswith("_em")]
+
+    return list(dict.fromkeys(columns))
+
+def apply_filters(query, filters):
+    """
+    Pushes filters down to PostgREST, given as a dict of column values to match or (column, operator, value) tuples.
+    """
+    if isinstance(filters, dict):
+        filters = [(col, "eq", value) for col, value in filters.items()]
+
+    for col, operator, value in filters or []:
+        if operator not in FILTER_METHODS:
+            raise ValueError(f"Unknown filter operator '{operator}', expected one of {', '.join(FILTER_METHODS)}")
+        query = getattr(query, FILTER_METHODS[operator])(col, value)
+
+    return query
+
+_missing_watermarks = set()
+
+def is_missing_column_error(error, col):
+    """
+    Checks if a PostgREST error is Postgres' undefined column error (42703) for a column.
+    """
+    message = str(error)
+    return "42703" in message or f"{col} does not exist" in message
+
+def get_freshness_token(url, key, table_name, filter_recipients=False, filters=None):
+    """
+    Gets a cheap token that changes when the table's rows do: the row count and max primary key, plus the max watermark if the table has one.
+    """
+    key_cols = get_key_columns(table_name)
+    supabase = get_supabase_client(url, key)
+    rate_limiter = get_rate_limiter()
+
+    def query_latest(select, order_cols):
+        query = supabase.table(table_name).select(select, count="exact")
+        if filter_recipients:
+            query = query.eq("is_recipient", True)
+        query = apply_filters(query, filters)
+        for col in order_cols:
+            query = query.order(col, desc=True)
+        rate_limiter.wait()
+        return query.limit(1).execute()
+
+    #count and get the last key in one request
+    response = query_latest(",".join(key_cols), key_cols)
+    token = {"count": response.count, "max_key": [response.data[0][col] for col in key_cols] if response.data else None}
+
+    #fall back to the count and max key until migrations/001_add_updated_at.sql has added the watermark column
+    watermark_col = WATERMARK_COLUMNS.get(table_name)
+    if watermark_col and (url, table_name) not in _missing_watermarks:
+        try:
+            response = query_latest(watermark_col, [watermark_col])
+            token["watermark"] = response.data[0][watermark_col] if response.data else None
+        except Exception as e:
+            if not is_missing_column_error(e, watermark_col):
+                raise
+            _missing_watermarks.add((url, table_name))
+            print(f"{table_name} has no {watermark_col} column, checking snapshot freshness by row count and max key only")
+
+    return token
+
+def get_table_from_supabase(url, key, table_name, batch_size=1000, delay=0.2, filter_recipients=False, min_batch_size=10, max_retries=5,
+                            columns=None, exclude_embeddings=False, filters=None, snapshot=None):
+    """
+    Fetches table data from Supabase, or from a local Parquet snapshot of the same query if the remote table has not changed since it was saved.
+    Snapshots are on with snapshot=True or a folder, or whenever SUPABASE_SNAPSHOT_DIR is set, and freshness is checked with get_freshness_token.
+    """
+    fetch_args = (url, key, table_name, batch_size, delay, filter_recipients, min_batch_size, max_retries, columns, exclude_embeddings, filters)
+    snapshot_dir = get_snapshot_dir(snapshot)
+    if snapshot_dir is None:
+        return fetch_table_from_supabase(*fetch_args)
+
+    #take the token before fetching, so changes made during the fetch show up next time
+    params = {"columns": columns, "exclude_embeddings": exclude_embeddings, "filters": filters, "filter_recipients": filter_recipients}
+    path = get_snapshot_path(snapshot_dir, table_name, params)
+    token = get_freshness_token(url, key, table_name, filter_recipients, filters)
+    df = read_snapshot(path, token)
+    if df is not None:
+        return df
+
+    df = fetch_table_from_supabase(*fetch_args)
+    write_snapshot(path, df, token, table_name, params)
+
+    return df
+
+def fetch_table_from_supabase(url, key, table_name, batch_size=1000, delay=0.2, filter_recipients=False, min_batch_size=10, max_retries=5,
+                              columns=None, exclude_embeddings=False, filters=None):
+    """
+    Fetches table data from Supabase in primary key order, paging from the last key seen so every page costs the same.
+    On a timeout it halves the page size and resumes from the last key after a backoff from delay, growing back to batch_size after each successful page.
+    Pages are paced by the shared rate limiter, so concurrent fetches stay under SUPABASE_RATE_LIMIT together.
+    Only the given columns are sent, less any *_em vector columns with exclude_embeddings, and filters are applied in the database.
+    """
+    key_cols = get_key_columns(table_name)
+
+    #get shared client instance
+    supabase = get_supabase_client(url, key)
+    rate_limiter = get_rate_limiter()
+
+    #select only the columns needed, plus the key to page on
+    columns = get_select_columns(url, key, table_name, columns, exclude_embeddings)
+    extra_cols = [col for col in key_cols if columns is not None and col not in columns]
+    select = "*" if columns is None else ",".join(columns + extra_cols)
 
     all_data = []
-    offset = 0
+    last_key = None
+    page_size = batch_size
+    retries = 0
 
     while True:
-        query = supabase.table(table_name).select("*")
+        query = supabase.table(table_name).select(select)
 
         #get only actual recipients
         if filter_recipients:
             query = query.eq("is_recipient", True)
+        query = apply_filters(query, filters)
 
-        #order by primary key
-        if table_name not in PRIMARY_KEYS:
-            raise ValueError(f"Unknown table '{table_name}' - please add ordering column to PRIMARY_KEYS")
-
-        query = query.order(PRIMARY_KEYS[table_name])
+        #start after the last row fetched and order by primary key
+        if last_key is not None:
+            query = filter_after_key(query, key_cols, last_key)
+        for col in key_cols:
+            query = query.order(col)
 
         #batch imports
         try:
-            response = query.limit(batch_size).offset(offset).execute()
-            data = response.data
+            rate_limiter.wait()
+            data = query.limit(page_size).execute().data
         except Exception as e:
-            if "timeout" in str(e).lower() and batch_size > 10:
-                return get_table_from_supabase(url, key, table_name, batch_size=batch_size // 2, delay=delay, filter_recipients=filter_recipients)
-            raise
+            if "timeout" not in str(e).lower() or retries >= max_retries:
+                raise
+            retries += 1
+            page_size = max(page_size // 2, min_batch_size)
+            print(f"Timeout fetching {table_name} after {len(all_data)} rows, retrying with batch size {page_size}")
+            time.sleep(delay * 2 ** retries)
+            continue
 
+        retries = 0
         if not data:
             break
 
         all_data.extend(data)
-        offset += len(data)
+        last_key = [data[-1][col] for col in key_cols]
 
-        if len(data) < batch_size:
+        if len(data) < page_size:
             break
 
-        time.sleep(delay)
+        page_size = min(page_size * 2, batch_size)
 
-    df = pd.DataFrame(all_data)
+    if columns is None:
+        return pd.DataFrame(all_data)
 
-    return df
+    df = pd.DataFrame(all_data, columns=columns + extra_cols)
+
+    return df.drop(columns=extra_cols)
+
+def load_tables(url, key, specs, max_workers=8, **defaults):
+    """
+    Fetches several tables concurrently over the shared client, returning a dict of dataframes.
+    Each spec is a table name, or a dict with a "table", an optional "name" to return it under and any get_table_from_supabase arguments, which override the defaults given.
+    """
+    specs = [{**defaults, "table": spec} if isinstance(spec, str) else {**defaults, **spec} for spec in specs]
+    names = [spec.pop("name", spec["table"]) for spec in specs]
+    if len(set(names)) < len(names):
+        raise ValueError("Table specs must have unique names")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(specs)))) as executor:
+        futures = {name: executor.submit(get_table_from_supabase, url, key, spec.pop("table"), **spec) for name, spec in zip(names, specs)}
+
+        return {name: future.result() for name, future in futures.items()}
 
 def clean_text(text):
     """
@@ -252,9 +444,10 @@ def extract_areas(row, section_cols, nlp):
     
     return unique_areas
 
-def extract_classifications(row, section_cols, ukcat_df, areas_df):
+def extract_classifications(row, section_cols, ukcat, areas_df):
     """
     Uses data from the Charity Classifications project to extract causes and beneficiaries, and Charity Commission data to match/extract areas.
+    Accepts the shared UK-CAT registry or a UK-CAT dataframe.
     """
 
     #get existing extracted classifications
@@ -271,29 +464,8 @@ def extract_classifications(row, section_cols, ukcat_df, areas_df):
 
     text_to_search = " ".join(sections)
 
-    matched_items = []
-
-    #check against ukcat patterns
-    for idx, ukcat_row in ukcat_df.iterrows():
-
-        pattern = ukcat_row["Regular expression"]
-        exclude_pattern = ukcat_row["Exclude regular expression"]
-
-        if pd.isna(pattern) or not pattern:
-            continue
-
-        try:
-            #check if patterns match
-            if re.search(pattern, text_to_search, re.IGNORECASE):
-                #check exclude patterns do not match
-                if pd.notna(exclude_pattern) and exclude_pattern:
-                    if re.search(exclude_pattern, text_to_search, re.IGNORECASE):
-                        continue
-
-                #add tag
-                matched_items.append(ukcat_row["tag"])
-        except re.error:
-            continue
+    #check against precompiled ukcat patterns
+    matched_items = as_ukcat_registry(ukcat).match_tags(text_to_search)
 
     #check against areas
     for idx, area_row in areas_df.iterrows():